@@ -4,18 +4,25 @@
 from __future__ import annotations
 
 import argparse
+import contextlib
+import importlib.util
+import io
 import json
 import os
 import sqlite3
+import statistics
+import time
 from collections import Counter, defaultdict
 from pathlib import Path
 from typing import Any, Dict, List
 
+import emotion_rules
 from emotion_rules import detect_emotion_6  # reuse production logic
 
 BASE_DIR = Path(__file__).resolve().parent
 DEFAULT_CASES = BASE_DIR / "emotion_test_cases.json"
 DB_PATH = BASE_DIR / "emotion_logs.db"
+LEGACY_PATH = BASE_DIR / "tests" / "fixtures" / "emotion_rules_legacy.py"  # --latency の before
 
 
 def load_cases(path: Path) -> List[Dict[str, Any]]:
@@ -93,6 +100,89 @@ def run_cases(cases: List[Dict[str, Any]]) -> None:
         print("\n✅ No misclassifications! Great job.")
 
 
+def _time_calls(fn, cases: List[Dict[str, Any]], repeat: int) -> List[float]:
+    """1呼び出しごとの経過時間（マイクロ秒）を集める。"""
+    samples: List[float] = []
+    perf = time.perf_counter
+    for _ in range(repeat):
+        for case in cases:
+            text = (case.get("text") or "").strip()
+            prev = case.get("prev_emotion")
+            t0 = perf()
+            fn(text, prev)
+            samples.append((perf() - t0) * 1e6)
+    return samples
+
+
+def _summarize(samples: List[float]) -> str:
+    if not samples:
+        return "n=0"
+    qs = statistics.quantiles(samples, n=100) if len(samples) > 1 else [samples[0]] * 99
+    return (
+        f"n={len(samples)}  mean={statistics.fmean(samples):7.1f}us  "
+        f"p50={qs[49]:7.1f}us  p99={qs[98]:7.1f}us"
+    )
+
+
+def _load_legacy():
+    """比較用の旧実装（tests/fixtures の固定版）をファイルパスから読む。本番コードからは import しない。"""
+    spec = importlib.util.spec_from_file_location("emotion_rules_legacy", LEGACY_PATH)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module.detect_emotion_6
+
+
+@contextlib.contextmanager
+def _detect_cache_disabled():
+    """detect_emotion_6 のメモ化を一時的に切る（分類器そのものの時間を測るため）。"""
+    cache = emotion_rules._detect_cache
+    saved, cache.maxsize = cache.maxsize, 0
+    try:
+        yield
+    finally:
+        cache.maxsize = saved
+
+
+def report_latency(cases: List[Dict[str, Any]], repeat: int) -> None:
+    """
+    旧実装（before: 呼び出し毎に辞書を組み立てて re.search、stdout に print）と
+    現行実装（after: 共有レジストリのコンパイル済みルールで1回走査）の1呼び出しレイテンシを比較する。
+    before の print は計測に含める（出力先は /dev/null）。
+    同じケースを繰り返すので、after は cold（メモ化なし＝分類器の比較）と warm（メモ化あり）を分けて出す。
+    """
+    detect_emotion_6_legacy = _load_legacy()
+    mismatches = 0
+    with contextlib.redirect_stdout(io.StringIO()):
+        for case in cases:
+            text = (case.get("text") or "").strip()
+            prev = case.get("prev_emotion")
+            if detect_emotion_6_legacy(text, prev) != detect_emotion_6(text, prev):
+                mismatches += 1
+
+    # ウォームアップ（import 直後のキャッシュ等の影響を除く）
+    with contextlib.redirect_stdout(io.StringIO()):
+        _time_calls(detect_emotion_6_legacy, cases, 1)
+    with _detect_cache_disabled():
+        _time_calls(detect_emotion_6, cases, 1)
+
+    with open(os.devnull, "w", encoding="utf-8") as devnull, contextlib.redirect_stdout(devnull):
+        before = _time_calls(detect_emotion_6_legacy, cases, repeat)
+    with _detect_cache_disabled():
+        cold = _time_calls(detect_emotion_6, cases, repeat)
+    emotion_rules._detect_cache.clear()
+    warm = _time_calls(detect_emotion_6, cases, repeat)
+
+    print("\n" + "=" * 80)
+    print("⏱️ detect_emotion_6 per-call latency")
+    print("=" * 80)
+    print(f"before (legacy)       : {_summarize(before)}")
+    print(f"after  (cold, no memo): {_summarize(cold)}")
+    print(f"after  (warm, memo)    : {_summarize(warm)}")
+    if before and cold:
+        print(f"speedup (mean, cold)   : x{statistics.fmean(before) / max(statistics.fmean(cold), 1e-9):.2f}")
+    print(f"decision mismatches: {mismatches}/{len(cases)}")
+
+
 def inspect_db(limit: int) -> None:
     if not DB_PATH.exists():
         print(f"DB file not found: {DB_PATH}")
@@ -133,6 +223,17 @@ def main() -> None:
         action="store_true",
         help="Also print latest emotion_logs entries for manual inspection.",
     )
+    parser.add_argument(
+        "--latency",
+        action="store_true",
+        help="Also compare per-call latency of the legacy and current classifier.",
+    )
+    parser.add_argument(
+        "--repeat",
+        type=int,
+        default=50,
+        help="How many times to run the case set when --latency is set.",
+    )
     parser.add_argument(
         "--limit",
         type=int,
@@ -142,7 +243,11 @@ def main() -> None:
     args = parser.parse_args()
 
     cases_path = args.cases if isinstance(args.cases, Path) else Path(args.cases)
-    run_cases(load_cases(cases_path))
+    cases = load_cases(cases_path)
+    run_cases(cases)
+
+    if args.latency:
+        report_latency(cases, max(1, args.repeat))
 
     if args.inspect_db:
         inspect_db(args.limit)
@@ -0,0 +1,223 @@
+"""Per-conversation emotion state for /api/analyze (in-process LRU + SQLite)."""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import sqlite3
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass, replace
+from typing import Callable, List, Optional, Tuple
+
+# (生徒, 日付) ごとに「いまの感情」と「どこまで読んだか」を持つ。
+# /api/analyze は毎ターン messages 全履歴を送ってくるが、
+# 前回見た位置より後ろの user 発話だけを判定すれば済むようにする。
+#
+# キーに会話 id は入れない（フロントは会話 id を送ってこない）。emotion_logs が「生徒×日で1行」なので、
+# 状態もそれに合わせて1日1本: 同じ日に別のチャットを開くと履歴が一致せずフォールバック
+# （最後の user 発話だけ判定）になり、prev_emotion はその日のローリング感情を引き継ぐ。
+# これは以前の「今日の行の感情を prev にする」挙動と同じ。
+
+
+@dataclass(frozen=True)
+class ConversationState:
+    student_id: str
+    day: str                       # DATE('now') と同じ UTC 日付（YYYY-MM-DD）
+    emotion: Optional[str] = None  # ローリング感情（次の判定の prev_emotion）
+    confidence: float = 0.0
+    last_index: int = 0            # 処理済みメッセージ数（messages[:last_index] は見た）
+    last_fp: str = ""              # messages[last_index-1] の指紋（履歴が差し替わったかの判定）
+    entry_id: Optional[int] = None  # emotion_logs の今日の行
+
+
+def message_fingerprint(message: dict) -> str:
+    raw = json.dumps([message.get("role"), message.get("content")], ensure_ascii=False)
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()[:16]
+
+
+def classify_new_messages(
+    messages: List[dict],
+    state: ConversationState,
+    detect: Callable[[str, Optional[str]], Tuple[str, float]],
+) -> Tuple[str, float, str, ConversationState]:
+    """
+    前回の続きだけを判定して (emotion, confidence, 最新の user 発話, 新しい state) を返す。
+
+    - 前回見た末尾（指紋一致）の後ろに足されたぶん → 新しい user 発話を順に判定（prev は直前の結果）
+    - 新しい user 発話が無い → 状態そのまま（判定しない）
+    - 履歴が短くなった／差し替わった（text だけの呼び出し等）→ 従来どおり最後の user 発話だけ判定
+    """
+    n = len(messages)
+    continued = (
+        0 < state.last_index <= n
+        and message_fingerprint(messages[state.last_index - 1]) == state.last_fp
+    )
+    if continued:
+        new_texts = [
+            m.get("content", "") for m in messages[state.last_index:] if m.get("role") == "user"
+        ]
+    else:
+        last_user = ""
+        for m in reversed(messages):
+            if m.get("role") == "user":
+                last_user = m.get("content", "")
+                break
+        if not last_user.strip() and messages:
+            last_user = messages[-1].get("content", "")
+        new_texts = [last_user]
+
+    emotion, confidence = state.emotion, state.confidence
+    last_text = ""
+    for text in new_texts:
+        emotion, confidence = detect(text, emotion)
+        last_text = text
+
+    new_state = replace(
+        state,
+        emotion=emotion,
+        confidence=confidence,
+        last_index=n,
+        last_fp=message_fingerprint(messages[-1]) if messages else "",
+    )
+    return emotion, confidence, last_text, new_state
+
+
+class ConversationStateStore:
+    """
+    (student_id, day) → ConversationState。
+    読み: LRU → 無ければ SQLite（プロセス再起動後だけ）。
+    書き: 呼び出し側の接続で emotion_logs と同じトランザクションに UPSERT し、commit 後に remember()。
+    LRU はプロセスごとなので、ワーカーが複数あると他のワーカーの書き込みより古いことがある。
+    書き込み側は書き込みロックを取ってから load() で SQLite の状態を読み直すこと。
+    """
+
+    def __init__(self, db_path: str, maxsize: int = 2048):
+        self.db_path = db_path
+        self.maxsize = maxsize
+        self._lru: "OrderedDict[Tuple[str, str], ConversationState]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._pruned_day: Optional[str] = None
+
+    @staticmethod
+    def ensure_table(conn: sqlite3.Connection) -> None:
+        conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS conversation_state (
+                student_id TEXT NOT NULL,
+                day TEXT NOT NULL,
+                emotion TEXT,
+                confidence REAL,
+                last_index INTEGER NOT NULL DEFAULT 0,
+                last_fp TEXT,
+                entry_id INTEGER,
+                updated_at TEXT,
+                PRIMARY KEY (student_id, day)
+            )
+            """
+        )
+
+    def get(self, student_id: str, day: str, conn: Optional[sqlite3.Connection] = None) -> ConversationState:
+        key = (student_id, day)
+        with self._lock:
+            st = self._lru.get(key)
+            if st is not None:
+                self._lru.move_to_end(key)
+                return st
+
+        own = conn is None
+        c = sqlite3.connect(self.db_path) if own else conn
+        try:
+            st = self.load(c, student_id, day)
+        finally:
+            if own:
+                c.close()
+        self.remember(st)
+        return st
+
+    def load(self, conn: sqlite3.Connection, student_id: str, day: str) -> ConversationState:
+        """LRU を見ずに SQLite の状態を読む（無ければ今日の emotion_logs 行から）。"""
+        row = conn.execute(
+            """
+            SELECT emotion, confidence, last_index, last_fp, entry_id
+            FROM conversation_state WHERE student_id = ? AND day = ?
+            """,
+            (student_id, day),
+        ).fetchone()
+        if row is None:
+            return self._bootstrap(conn, student_id, day)
+        return ConversationState(student_id, day, row[0], row[1] or 0.0, row[2] or 0, row[3] or "", row[4])
+
+    @staticmethod
+    def todays_entry(conn: sqlite3.Connection, student_id: str, day: str) -> Optional[Tuple[int, str, float]]:
+        """emotion_logs の今日の最新行 (id, emotion, confidence)。無ければ None。"""
+        return conn.execute(
+            """
+            SELECT id, emotion, confidence FROM emotion_logs
+            WHERE student_id = ?
+              AND DATE(created_at) = ?
+            ORDER BY created_at DESC
+            LIMIT 1
+            """,
+            (student_id, day),
+        ).fetchone()
+
+    @classmethod
+    def _bootstrap(cls, conn: sqlite3.Connection, student_id: str, day: str) -> ConversationState:
+        """状態が未保存の日（導入直後など）は今日の emotion_logs 行から引き継ぐ。"""
+        row = cls.todays_entry(conn, student_id, day)
+        if row is None:
+            return ConversationState(student_id=student_id, day=day)
+        return ConversationState(student_id, day, emotion=row[1], confidence=row[2] or 0.0, entry_id=row[0])
+
+    def save(self, conn: sqlite3.Connection, st: ConversationState) -> None:
+        """呼び出し側のトランザクション内で永続化する（commit は呼び出し側）。"""
+        conn.execute(
+            """
+            INSERT INTO conversation_state
+                (student_id, day, emotion, confidence, last_index, last_fp, entry_id, updated_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?, datetime('now'))
+            ON CONFLICT(student_id, day) DO UPDATE SET
+                emotion = excluded.emotion,
+                confidence = excluded.confidence,
+                last_index = excluded.last_index,
+                last_fp = excluded.last_fp,
+                entry_id = excluded.entry_id,
+                updated_at = excluded.updated_at
+            """,
+            (st.student_id, st.day, st.emotion, st.confidence, st.last_index, st.last_fp, st.entry_id),
+        )
+
+    def remember(self, st: ConversationState) -> None:
+        key = (st.student_id, st.day)
+        with self._lock:
+            self._lru[key] = st
+            self._lru.move_to_end(key)
+            while len(self._lru) > self.maxsize:
+                self._lru.popitem(last=False)
+
+    def prune(self, conn: sqlite3.Connection, today: str) -> int:
+        """
+        今日より前の状態を消す（日付が変われば新しいキーになるので、もう参照されない）。
+        保持は「今日の分だけ」。同じ日の2回目以降は何もしないので、書き込みのたびに呼んでよい
+        （起動時の init_db と、/api/analyze の書き込みトランザクションから呼ぶ）。
+        commit は呼び出し側で、commit できたら mark_pruned(today) を呼ぶ（失敗したら次の書き込みでやり直す）。
+        """
+        if self._pruned_day == today:
+            return 0
+        return conn.execute("DELETE FROM conversation_state WHERE day < ?", (today,)).rowcount
+
+    def mark_pruned(self, today: str) -> None:
+        """prune の commit 後に呼ぶ。今日はもう消さない・LRU からも前日以前を落とす。"""
+        with self._lock:
+            for key in [k for k in self._lru if k[1] < today]:
+                del self._lru[key]
+            self._pruned_day = today
+
+
+__all__ = [
+    "ConversationState",
+    "ConversationStateStore",
+    "classify_new_messages",
+    "message_fingerprint",
+]
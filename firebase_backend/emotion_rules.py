@@ -2,9 +2,83 @@
 
 from __future__ import annotations
 
-import re
+import importlib
+import importlib.util
+import logging
+import os
+import random
+import sys
+from pathlib import Path
+from types import ModuleType
 from typing import Optional, Tuple
 
+# ルールは lib/No_look の共有レジストリ（config/emotion_rules.json の lexicons.detect6）から取る。
+# FastAPI 側の top-level パッケージ app を sys.path 経由で import すると、別の app と
+# 食い合うので、app/rules だけをファイルパスから独立したパッケージ名で読み込む
+# （app/rules の中は相対 import のみ）。場所は NOLOOK_RULES_PKG、ルールファイルは NOLOOK_RULES_PATH で変えられる。
+RULES_PACKAGE = "nolook_rules"
+_DEFAULT_RULES_PKG = Path(__file__).resolve().parents[1] / "lib" / "No_look" / "app" / "rules"
+
+
+def _load_rules_package() -> ModuleType:
+    if RULES_PACKAGE in sys.modules:
+        return sys.modules[RULES_PACKAGE]
+    pkg_dir = Path(os.getenv("NOLOOK_RULES_PKG") or _DEFAULT_RULES_PKG)
+    spec = importlib.util.spec_from_file_location(
+        RULES_PACKAGE, pkg_dir / "__init__.py", submodule_search_locations=[str(pkg_dir)]
+    )
+    if spec is None or spec.loader is None:
+        raise ImportError(f"rules package not found: {pkg_dir}")
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[RULES_PACKAGE] = module  # 相対 import（.registry など）の解決に必要
+    try:
+        spec.loader.exec_module(module)
+    except BaseException:
+        sys.modules.pop(RULES_PACKAGE, None)
+        raise
+    return module
+
+
+_load_rules_package()
+_memo = importlib.import_module(f"{RULES_PACKAGE}.memo")
+_registry = importlib.import_module(f"{RULES_PACKAGE}.registry")
+LabelCache = _memo.LabelCache
+get_registry, get_rules = _registry.get_registry, _registry.get_rules
+
+RULES_LEXICON = "detect6"
+
+_POSITIVE = frozenset({"楽しい"})
+_NEGATIVE = frozenset({"悲しい", "怒り", "不安", "しんどい"})
+
+get_registry()  # import 時にロード＆コンパイルしておく
+
+# 定型の短文が多いので (テキスト, prev_emotion, ルール版) をキーに結果をメモ化
+_detect_cache = LabelCache("detect_emotion_6")
+
+# デバッグ用トレース（既定は無効）。
+# NOLOOK_DETECT_TRACE_SAMPLE=0.01 のように割合を指定すると、その割合の呼び出しだけ
+# 入力プレビューとスコアを logger に出す（stdout へは同期で書かない）。
+logger = logging.getLogger("nolook.detect_emotion_6")
+
+
+def _trace_rate() -> float:
+    try:
+        rate = float(os.getenv("NOLOOK_DETECT_TRACE_SAMPLE", "0") or 0)
+    except ValueError:
+        return 0.0
+    return min(1.0, max(0.0, rate))
+
+
+TRACE_SAMPLE_RATE = _trace_rate()
+
+
+def _sampled() -> bool:
+    """この呼び出しをトレースするか（1呼び出しにつき1回だけ判定）。"""
+    rate = TRACE_SAMPLE_RATE
+    if rate <= 0.0:
+        return False
+    return (rate >= 1.0 or random.random() < rate) and logger.isEnabledFor(logging.INFO)
+
 
 def detect_emotion_6(text: str, prev_emotion: Optional[str] = None) -> Tuple[str, float]:
     """
@@ -15,23 +89,34 @@ def detect_emotion_6(text: str, prev_emotion: Optional[str] = None) -> Tuple[str
     ★ 改善②：スコアが全て0（新たにマッチするワードなし）なら前フレーム感情を継続
     """
 
-    preview = (text or "")[:50].replace("\n", " ")
-    print(f"🔍 [detect_emotion_6] text='{preview}', prev={prev_emotion}")
+    trace = _sampled()
+    if trace:
+        logger.info("text=%r prev=%s", (text or "")[:50].replace("\n", " "), prev_emotion)
 
     if not text:
         if prev_emotion in ("楽しい", "悲しい", "怒り", "不安", "しんどい"):
             return prev_emotion, 0.5
         return "中立", 0.3
 
+    if trace:
+        # トレース時はスコアも出したいのでキャッシュを通さない
+        return _detect_uncached(text, prev_emotion, True)
+    return _detect_cache.get_or_compute(text, _detect_uncached, prev_emotion)
+
+
+def _detect_uncached(text: str, prev_emotion: Optional[str], trace: bool = False) -> Tuple[str, float]:
     lower = text.lower()
+    lex = get_rules().lexicon(RULES_LEXICON)
+    # 語彙ヒット・危険ワード・あいさつ等のマーカーを1回の走査で拾う。
+    # マーカーはかな/漢字のみなので lower() の前後どちらで見ても結果は同じ。
+    scan = lex.matcher.scan(lower)
 
     # ★ 危険ワード（最優先）
-    crisis_words = ["死にたい", "消えたい", "いなくなりたい", "自殺", "リスカ", "もう無理"]
-    if any(w in lower for w in crisis_words):
+    if scan.has("crisis"):
         return "しんどい", 0.98
 
     # 好きと嫌いの葛藤はしんどい寄り
-    if re.search(r"(好き).*(嫌い)|(嫌い).*(好き)", lower):
+    if lex.patterns["ambivalent"].search(lower):
         return "しんどい", 0.7
 
     scores = {
@@ -43,104 +128,36 @@ def detect_emotion_6(text: str, prev_emotion: Optional[str] = None) -> Tuple[str
         "中立": 0.0,
     }
 
-    EMOTION_PATTERNS = {
-        "楽しい": [
-            r"楽しい", r"楽しかっ", r"楽しく", r"楽しくなって",
-            r"嬉しい", r"うれし", r"嬉しかっ", r"うれしかっ",
-            r"幸せ", r"しあわせ",
-            r"最高", r"サイコー",
-            r"よかった", r"良かった",
-            r"ワクワク", r"わくわく",
-            r"好き", r"大好き",
-            r"はまってる", r"ハマってる",
-            r"楽しみ", r"面白い", r"おもしろい",
-            r"褒められ", r"ほめられ",
-            r"褒めてくれた", r"ほめてくれた",
-            r"うまく描け", r"上手く描け", r"うまくできた", r"上手くできた",
-            r"うまくいっ", r"上手くいっ",
-            r"学校.*楽しい",
-            r"友達.*楽しい",
-            r"楽しくて",
-            r"爆笑", r"腹筋崩壊",
-            r"神回", r"優勝レベル", r"優勝だった",
-            r"楽しすぎ", r"楽しすぎた",
-            r"エモい",
-            r"気がラクになった", r"ちょっとラクになった",
-            r"ホッとした", r"ほっとした",
-            r"救われた気がする", r"気持ちが軽くなった",
-        ],
-        "悲しい": [
-            r"悲しい", r"かなしい", r"悲しかっ",
-            r"辛い", r"つらい",
-            r"寂し", r"さみし",
-            r"落ち込", r"萎え", r"萎えた",
-            r"泣きたい", r"泣いた", r"泣いて", r"涙",
-            r"ショック", r"へこむ", r"へこんだ",
-        ],
-        "怒り": [
-            r"怒", r"ムカつく", r"むかつく",
-            r"腹立", r"イライラ", r"いらいら",
-            r"うざい", r"ウザい",
-            r"許せない", r"キレた", r"キレそう",
-            r"ブチギレ", r"キレそうだ", r"腹立つ",
-            r"理不尽",
-            r"納得いかない",
-            r"悔し",
-        ],
-        "不安": [
-            r"不安", r"心配", r"しんぱい",
-            r"怖い", r"こわい",
-            r"緊張", r"ドキドキ", r"どきどき",
-            r"やばい", r"ヤバい",
-            r"どうしよう",
-            r"テスト", r"試験", r"受験",
-            r"発表", r"面接",
-            r"どうやったら.*できる",
-            r"どうしたら.*できる",
-            r"うまくいくか分からない",
-            r"怒られそう",
-        ],
-        "しんどい": [
-            r"疲れ", r"つかれ", r"疲れた",
-            r"しんどい",
-            r"大変", r"たいへん",
-            r"きつい", r"きつかった",
-            r"だるい", r"だるかった",
-            r"眠い", r"ねむい",
-            r"分からん", r"わからん", r"分かんない", r"わかんない",
-            r"難しい", r"むずかしい",
-            r"困った",
-            r"めんどくさい", r"めんどう", r"面倒",
-            r"苦しい", r"つらい",
-            r"無理",
-            r"もう無理", r"無理すぎ", r"無理だ", r"限界", r"無理かも",
-            r"できない",
-            r"苦手",
-            r"モヤモヤ", r"もやもや",
-        ],
-    }
-
-    for emo, patterns in EMOTION_PATTERNS.items():
-        for pat in patterns:
-            if re.search(pat, lower):
+    # 1パターンにつき「1回でもヒットしたら +1」
+    seen = set()
+    for hit in scan.hits:
+        if hit.pattern not in seen:
+            seen.add(hit.pattern)
+            scores[hit.emotion] += 1.0
+    for emo, pats in lex.scored_patterns.items():
+        for pat in pats:
+            if pat.search(lower):
                 scores[emo] += 1.0
 
-    print(f"🔍 [detect_emotion_6] scores={scores}")
+    if trace:
+        logger.info("scores=%s", scores)
 
     # あいさつ系は中立を少し上げる
-    if re.search(r"(こんにちは|おはよう|こんばんは|お疲れ|おつかれ)", lower):
+    if scan.has("greeting"):
         scores["中立"] += 0.5
 
     # 「無理しないでね」系はネガ軽減
-    if re.search(r"無理(しない|しなくていい|しないで|せず)", lower):
+    if scan.has("kind_muri"):
         scores["しんどい"] = max(0.0, scores["しんどい"] - 1.0)
 
     # 何もヒットしない → 前フレーム継続 or 中立
     if all(v == 0 for v in scores.values()):
         if prev_emotion in ("しんどい", "不安", "悲しい", "楽しい", "怒り"):
-            print(f"🔍 [detect_emotion_6] fallback prev={prev_emotion} -> {prev_emotion}")
+            if trace:
+                logger.info("fallback prev=%s -> %s", prev_emotion, prev_emotion)
             return prev_emotion, 0.4
-        print("🔍 [detect_emotion_6] fallback -> 中立 (no hits)")
+        if trace:
+            logger.info("fallback -> 中立 (no hits)")
         return "中立", 0.3
 
     sorted_items = sorted(scores.items(), key=lambda x: x[1], reverse=True)
@@ -150,50 +167,50 @@ def detect_emotion_6(text: str, prev_emotion: Optional[str] = None) -> Tuple[str
     total = sum(scores.values())
     base_conf = min(0.9, max(0.5, (top_score / (total + 1e-6)) + 0.3))
 
-    positive_set = {"楽しい"}
-    negative_set = {"悲しい", "怒り", "不安", "しんどい"}
-
     # ★ ① ポジだけ立っている場合は素直にポジで返す
-    if top_emotion in positive_set and all(scores[e] == 0.0 for e in negative_set):
-        print(f"🔍 [detect_emotion_6] pure positive -> {top_emotion}, conf={base_conf:.2f}")
+    if top_emotion in _POSITIVE and all(scores[e] == 0.0 for e in _NEGATIVE):
+        if trace:
+            logger.info("pure positive -> %s, conf=%.2f", top_emotion, base_conf)
         return top_emotion, base_conf
 
     # ★ ② ポジ×ネガ混合 → second_score > 0 のときだけ「しんどい」に圧縮
     if (
-        top_emotion in positive_set
-        and second_emotion in negative_set
+        top_emotion in _POSITIVE
+        and second_emotion in _NEGATIVE
         and second_score > 0  # ← ここ追加
         and abs(top_score - second_score) <= 1.0
     ) or (
-        top_emotion in negative_set
-        and second_emotion in positive_set
+        top_emotion in _NEGATIVE
+        and second_emotion in _POSITIVE
         and second_score > 0  # ← ここ追加
         and abs(top_score - second_score) <= 1.0
     ):
         mixed_conf = min(base_conf, 0.8)
-        print(
-            f"🔍 [detect_emotion_6] mixed pos/neg -> しんどい "
-            f"(top={top_emotion}:{top_score}, second={second_emotion}:{second_score}, conf={mixed_conf:.2f})"
-        )
+        if trace:
+            logger.info(
+                "mixed pos/neg -> しんどい (top=%s:%s, second=%s:%s, conf=%.2f)",
+                top_emotion, top_score, second_emotion, second_score, mixed_conf,
+            )
         return "しんどい", max(0.6, mixed_conf)
 
     # 否定パターンの後処理（例: 「そこまでしんどくない」）
-    def has(pattern: str) -> bool:
-        return re.search(pattern, text) is not None
-
-    if "しんど" in text and has(r"(しんどくない|大丈夫|そこまでしんどくない)"):
-        print("🔍 [detect_emotion_6] negation override -> 中立 (しんどくない系)")
+    if scan.has("shindoi") and scan.has("shindoi_neg"):
+        if trace:
+            logger.info("negation override -> 中立 (しんどくない系)")
         return "中立", 0.5
 
-    if "不安" in text and has(r"(不安ってわけじゃない|そこまで不安|不安ではない)"):
-        print("🔍 [detect_emotion_6] negation override -> 中立 (不安ではない)")
+    if scan.has("fuan") and scan.has("fuan_neg"):
+        if trace:
+            logger.info("negation override -> 中立 (不安ではない)")
         return "中立", 0.5
 
-    if has(r"昨日.*しんどかった") and has(r"今日は.*大丈夫"):
-        print("🔍 [detect_emotion_6] recovery pattern -> 中立")
+    if lex.patterns["recovery_before"].search(text) and lex.patterns["recovery_after"].search(text):
+        if trace:
+            logger.info("recovery pattern -> 中立")
         return "中立", 0.6
 
-    print(f"🔍 [detect_emotion_6] result={top_emotion}, conf={base_conf:.2f}")
+    if trace:
+        logger.info("result=%s, conf=%.2f", top_emotion, base_conf)
     return top_emotion, base_conf
 
 
@@ -2,12 +2,14 @@ import sqlite3
 import os
 import json
 import re
+from dataclasses import replace
 from typing import Optional
 from flask import Flask, request, jsonify
 from datetime import datetime
 from openai import OpenAI
 from dotenv import load_dotenv
 from emotion_rules import detect_emotion_6
+from conversation_state import ConversationStateStore, classify_new_messages
 
 # .env ファイルを読み込む
 load_dotenv()
@@ -17,8 +19,13 @@ app = Flask(__name__)
 # OpenAI クライアントを初期化
 openai_client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
 
-# DB path
-DB_PATH = os.path.join(os.path.dirname(__file__), "emotion_logs.db")
+# DB path（テスト等で差し替えるときは NOLOOK_FB_DB_PATH）
+DB_PATH = os.getenv("NOLOOK_FB_DB_PATH") or os.path.join(os.path.dirname(__file__), "emotion_logs.db")
+
+# (生徒, 日付) ごとの会話状態。プロセス内 LRU が外れたときだけ SQLite を読む
+conversation_states = ConversationStateStore(
+    DB_PATH, maxsize=int(os.getenv("NOLOOK_CONVERSATION_CACHE_SIZE", "2048"))
+)
 
 
 def init_db():
@@ -51,8 +58,14 @@ def init_db():
     if "class_id" not in columns:
         c.execute("ALTER TABLE emotion_logs ADD COLUMN class_id TEXT")
 
+    # 会話ごとのローリング感情（/api/analyze 用）。前日以前の状態はもう使わないので消す
+    ConversationStateStore.ensure_table(conn)
+    today = datetime.utcnow().strftime("%Y-%m-%d")
+    conversation_states.prune(conn, today)
+
     conn.commit()
     conn.close()
+    conversation_states.mark_pruned(today)
 
 
 # import 時にもテーブル構造を整える
@@ -841,6 +854,27 @@ def polish_reply(reply: str, history: list, emotion: Optional[str] = None) -> st
     return polished or reply
 
 
+def _update_log_row(c, entry_id: int, emotion: str, confidence: float, labels: dict, class_id: str) -> bool:
+    """emotion_logs の行 entry_id を今回の判定で上書きする。行が無ければ False。"""
+    c.execute(
+        """
+        UPDATE emotion_logs
+        SET emotion = ?, score = ?, labels = ?, confidence = ?, created_at = datetime('now'),
+            class_id = ?
+        WHERE id = ?
+        """,
+        (
+            emotion,
+            confidence,
+            json.dumps(labels, ensure_ascii=False),
+            confidence,
+            class_id,
+            entry_id,
+        ),
+    )
+    return c.rowcount > 0
+
+
 @app.route("/api/analyze", methods=["POST"])
 def analyze_api():
     """
@@ -870,35 +904,20 @@ def analyze_api():
 
         print(f"\n📝 [analyze] Received {len(messages)} messages from {user_id}")
 
-        # 最新のユーザー発話を感情判定に使う
-        last_user_text = ""
-        for m in reversed(messages):
-            if m.get("role") == "user":
-                last_user_text = m.get("content", "")
-                break
-
-        if not last_user_text.strip():
-            last_user_text = messages[-1].get("content", "")
-
-        # 前回の感情を DB から取得（同じ日の前のレコードがあれば）
-        conn_prev = sqlite3.connect(DB_PATH)
-        c_prev = conn_prev.cursor()
-        c_prev.execute(
-            """
-            SELECT emotion FROM emotion_logs
-            WHERE student_id = ?
-              AND DATE(created_at) = DATE('now')
-            ORDER BY created_at DESC
-            LIMIT 1
-            """,
-            (user_id,),
-        )
-        prev_row = c_prev.fetchone()
-        prev_emotion = prev_row[0] if prev_row else None
-        conn_prev.close()
+        # 会話状態（前回の感情・どこまで読んだか）は LRU から（書き込み時に SQLite と突き合わせる）
+        day = datetime.utcnow().strftime("%Y-%m-%d")  # DATE('now') と同じ UTC 日付
+        state = base = conversation_states.get(user_id, day)
 
-        # 1️⃣ 感情を判定（前フレーム感情を引き継げるように）
-        emotion, confidence = detect_emotion_6(last_user_text, prev_emotion)
+        # 1️⃣ 前回から増えた user 発話だけを判定（前フレーム感情を引き継ぐ）
+        emotion, confidence, last_user_text, state = classify_new_messages(
+            messages, state, detect_emotion_6
+        )
+        if not last_user_text:
+            # 新しい user 発話が無いターン（返信の再生成など）。返信用に最新の発話だけ拾う
+            for m in reversed(messages):
+                if m.get("role") == "user":
+                    last_user_text = m.get("content", "")
+                    break
         # NOTE: 受験・テスト文脈の揺れが大きい場合は、prev_emotion とテスト系キーワードを組み合わせた
         # スムージングで「不安」を優先的に維持する調整を検討する。
         labels = build_labels(emotion)
@@ -915,74 +934,72 @@ def analyze_api():
             used_llm = False
             llm_reason = "FALLBACK_TEMPLATE"
 
-        # 3️⃣ emotion_logs に「今日のレコードをUPDATE」する
+        # 3️⃣ emotion_logs の「今日のレコード」を UPDATE / INSERT
+        # LRU はワーカーごとなので、他のワーカーが先に書いていると上の state は古い。
+        # 書き込みロックを取ってから SQLite の状態を読み直し、食い違っていればその続きから判定し直す
+        # （同じ発話を二重に数えない・今日の行を二重に作らない。返信は上の判定のまま）
         conn = sqlite3.connect(DB_PATH)
-        c = conn.cursor()
-
-        c.execute(
-            """
-            SELECT id FROM emotion_logs
-            WHERE student_id = ?
-              AND DATE(created_at) = DATE('now')
-            """,
-            (user_id,),
-        )
-        row = c.fetchone()
-
-        if row:
-            entry_id = row[0]
-            c.execute(
-                """
-                UPDATE emotion_logs
-                SET emotion = ?, score = ?, labels = ?, confidence = ?, created_at = datetime('now'),
-                    class_id = ?
-                WHERE id = ?
-                """,
-                (
-                    emotion,
-                    confidence,
-                    json.dumps(labels, ensure_ascii=False),
-                    confidence,
-                    class_id,
-                    entry_id,
-                ),
-            )
-            message = "updated today record"
-            print(f"✅ [analyze] UPDATED record {entry_id} for student {user_id}")
-        else:
-            c.execute(
-                """
-                INSERT INTO emotion_logs (
-                    student_id,
-                    class_id,
-                    emotion,
-                    score,
-                    labels,
-                    topic_tags,
-                    negation_index,
-                    source,
-                    confidence,
-                    created_at
-                ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, datetime('now'))
-                """,
-                (
-                    user_id,
-                    class_id,
-                    emotion,
-                    confidence,
-                    json.dumps(labels, ensure_ascii=False),
-                    None,
-                    None,
-                    "text",
-                    confidence,
-                ),
-            )
-            entry_id = c.lastrowid
-            message = "created today record"
-            print(f"✅ [analyze] CREATED record {entry_id} for student {user_id}")
-
-        conn.commit()
-        conn.close()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            c = conn.cursor()
+            current = conversation_states.load(conn, user_id, day)
+            if current != base:
+                emotion, confidence, _, state = classify_new_messages(messages, current, detect_emotion_6)
+                labels = build_labels(emotion)
+
+            entry_id = state.entry_id
+            updated = entry_id is not None and _update_log_row(c, entry_id, emotion, confidence, labels, class_id)
+            if not updated:
+                # 行 id を知らない／その行が消えていた → 今日の行を探して UPDATE、無ければ INSERT
+                today_row = ConversationStateStore.todays_entry(conn, user_id, day)
+                entry_id = today_row[0] if today_row is not None else None
+                updated = entry_id is not None and _update_log_row(c, entry_id, emotion, confidence, labels, class_id)
+
+            if updated:
+                message = "updated today record"
+                print(f"✅ [analyze] UPDATED record {entry_id} for student {user_id}")
+            else:
+                c.execute(
+                    """
+                    INSERT INTO emotion_logs (
+                        student_id,
+                        class_id,
+                        emotion,
+                        score,
+                        labels,
+                        topic_tags,
+                        negation_index,
+                        source,
+                        confidence,
+                        created_at
+                    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, datetime('now'))
+                    """,
+                    (
+                        user_id,
+                        class_id,
+                        emotion,
+                        confidence,
+                        json.dumps(labels, ensure_ascii=False),
+                        None,
+                        None,
+                        "text",
+                        confidence,
+                    ),
+                )
+                entry_id = c.lastrowid
+                message = "created today record"
+                print(f"✅ [analyze] CREATED record {entry_id} for student {user_id}")
+
+            # 会話状態も同じトランザクションで保存し、commit できたら LRU に反映
+            # （日付が変わって最初の書き込みで前日以前の状態を消す。同じ日は何もしない）
+            state = replace(state, entry_id=entry_id)
+            conversation_states.prune(conn, day)
+            conversation_states.save(conn, state)
+            conn.commit()
+        finally:
+            conn.close()
+        conversation_states.mark_pruned(day)
+        conversation_states.remember(state)
 
         return jsonify({
             "reply": ai_reply,
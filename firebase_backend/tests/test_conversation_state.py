@@ -0,0 +1,236 @@
+# tests/test_conversation_state.py
+import sqlite3
+from dataclasses import replace
+from datetime import datetime
+
+import pytest
+
+from conversation_state import (
+    ConversationState,
+    ConversationStateStore,
+    classify_new_messages,
+    message_fingerprint,
+)
+from emotion_rules import detect_emotion_6
+
+DAY = "2026-10-17"
+
+def _recording_detect():
+    calls = []
+    def detect(text, prev):
+        calls.append((text, prev))
+        return detect_emotion_6(text, prev)
+    return detect, calls
+
+def _msgs(*pairs):
+    return [{"role": r, "content": c} for r, c in pairs]
+
+def _after(messages, **kw):
+    """messages を最後まで読んだ状態。"""
+    return ConversationState("s1", DAY, last_index=len(messages), last_fp=message_fingerprint(messages[-1]), **kw)
+
+def test_continued_history_classifies_only_the_appended_user_message():
+    history = _msgs(("user", "部活で疲れた"), ("assistant", "おつかれさま"))
+    state = _after(history, emotion="しんどい", confidence=0.8, entry_id=7)
+    messages = history + _msgs(("user", "明日の発表が不安"))
+    detect, calls = _recording_detect()
+
+    emotion, confidence, last_text, new = classify_new_messages(messages, state, detect)
+    assert calls == [("明日の発表が不安", "しんどい")]
+    assert (emotion, confidence) == detect_emotion_6("明日の発表が不安", "しんどい") == ("不安", pytest.approx(0.9))
+    assert last_text == "明日の発表が不安"
+    assert (new.emotion, new.confidence) == (emotion, confidence)
+    assert (new.last_index, new.last_fp, new.entry_id) == (3, message_fingerprint(messages[-1]), 7)
+
+def test_several_new_user_messages_are_chained_through_prev_emotion():
+    history = _msgs(("user", "おはよう"))
+    state = _after(history, emotion="中立", confidence=0.5)
+    texts = ["テスト合格！嬉しい", "うん", "でも疲れた"]
+    messages = history + _msgs(("assistant", "おはよう！"), *[("user", t) for t in texts])
+    detect, calls = _recording_detect()
+
+    emotion, confidence, last_text, new = classify_new_messages(messages, state, detect)
+    prev, expected = "中立", []
+    for t in texts:
+        expected.append((t, prev))
+        prev, conf = detect_emotion_6(t, prev)
+    assert calls == expected                               # 直前の結果が次の prev になる
+    assert calls[2][1] == "しんどい"                       # 「うん」は前フレーム継続
+    assert (emotion, confidence) == (prev, conf) == ("しんどい", conf)
+    assert last_text == "でも疲れた"
+    assert (new.last_index, new.last_fp) == (len(messages), message_fingerprint(messages[-1]))
+
+def test_no_new_user_message_keeps_the_state_without_classifying():
+    messages = _msgs(("user", "部活で疲れた"), ("assistant", "おつかれさま"))
+    state = _after(messages, emotion="しんどい", confidence=0.8, entry_id=3)
+    detect, calls = _recording_detect()
+
+    emotion, confidence, last_text, new = classify_new_messages(messages, state, detect)
+    assert calls == [] and last_text == ""
+    assert (emotion, confidence) == ("しんどい", 0.8)
+    assert new == state                                    # last_index / last_fp / entry_id もそのまま
+
+@pytest.mark.parametrize("messages", [
+    _msgs(("user", "別の話：友達とケンカしてムカつく")),                          # 差し替え（短くなった）
+    _msgs(("user", "書き換えた"), ("assistant", "うん"), ("user", "友達とケンカしてムカつく")),  # 同じ長さで別内容
+])
+def test_replaced_history_falls_back_to_the_last_user_message(messages):
+    history = _msgs(("user", "部活で疲れた"), ("assistant", "おつかれさま"), ("user", "だるい"))
+    state = _after(history, emotion="しんどい", confidence=0.7, entry_id=5)
+    detect, calls = _recording_detect()
+
+    emotion, confidence, last_text, new = classify_new_messages(messages, state, detect)
+    assert calls == [(messages[-1]["content"], "しんどい")]
+    assert (emotion, confidence) == detect_emotion_6(messages[-1]["content"], "しんどい")
+    assert emotion == "怒り"
+    assert (new.last_index, new.last_fp, new.entry_id) == (len(messages), message_fingerprint(messages[-1]), 5)
+
+def _db(tmp_path):
+    path = str(tmp_path / "state.db")
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE emotion_logs (id INTEGER PRIMARY KEY AUTOINCREMENT, student_id TEXT, "
+                 "emotion TEXT, confidence REAL, created_at TEXT)")
+    ConversationStateStore.ensure_table(conn)
+    conn.commit()
+    return path, conn
+
+def test_lru_miss_reads_sqlite_then_bootstraps_from_todays_log_row(tmp_path):
+    path, conn = _db(tmp_path)
+    conn.execute("INSERT INTO emotion_logs (student_id, emotion, confidence, created_at) VALUES "
+                 "('s2', '悲しい', 0.6, '2026-10-16 23:00:00'), ('s2', '不安', 0.7, '2026-10-17 08:00:00'), "
+                 "('s2', '怒り', 0.9, '2026-10-17 12:00:00')")
+    saved = ConversationState("s1", DAY, "楽しい", 0.9, last_index=4, last_fp="abc", entry_id=11)
+    ConversationStateStore(path).save(conn, saved)
+    conn.commit()
+
+    store = ConversationStateStore(path)                    # 再起動後（LRU は空）
+    assert store.get("s1", DAY) == saved                    # SQLite の状態
+    boot = store.get("s2", DAY)                             # 状態なし → 今日の最新の emotion_logs 行
+    assert (boot.emotion, boot.confidence, boot.entry_id) == ("怒り", 0.9, 3)
+    assert (boot.last_index, boot.last_fp) == (0, "")
+    assert store.get("s3", DAY) == ConversationState("s3", DAY)
+
+    conn.execute("DELETE FROM conversation_state")
+    conn.commit()
+    assert store.get("s1", DAY) == saved                    # 2回目からは LRU（DB を読まない）
+
+def test_prune_keeps_only_today_and_runs_once_per_day(tmp_path):
+    path, conn = _db(tmp_path)
+    store = ConversationStateStore(path)
+    for day in ("2026-10-15", "2026-10-16", DAY):
+        st = ConversationState("s1", day, "中立", 0.3)
+        store.save(conn, st)
+        store.remember(st)
+    conn.commit()
+
+    assert store.prune(conn, DAY) == 2
+    conn.rollback()                                         # commit できなかったら次の呼び出しでやり直す
+    assert store.prune(conn, DAY) == 2
+    conn.commit()
+    store.mark_pruned(DAY)
+    assert [r[0] for r in conn.execute("SELECT day FROM conversation_state")] == [DAY]
+    assert list(store._lru) == [("s1", DAY)]
+    store.save(conn, ConversationState("s1", "2026-10-16", "中立", 0.3))
+    assert store.prune(conn, DAY) == 0                      # 同じ日は何もしない
+    assert store.prune(conn, "2026-10-18") == 2
+
+@pytest.fixture
+def api(tmp_path, monkeypatch):
+    path = str(tmp_path / "emotion_logs.db")
+    monkeypatch.setenv("OPENAI_API_KEY", "test")
+    monkeypatch.setenv("NOLOOK_FB_DB_PATH", path)          # import 時の init_db もソースツリーに DB を作らない
+    import main
+    store = ConversationStateStore(path)
+    monkeypatch.setattr(main, "DB_PATH", path)
+    monkeypatch.setattr(main, "conversation_states", store)
+    def no_llm(messages, emotion):
+        raise RuntimeError("offline")
+    monkeypatch.setattr(main, "call_llm_with_history", no_llm)
+    main.init_db()
+    return main, store, path
+
+def _stored(path, student_id):
+    with sqlite3.connect(path) as conn:
+        state = conn.execute("SELECT emotion, confidence, last_index, last_fp, entry_id FROM conversation_state "
+                             "WHERE student_id = ?", (student_id,)).fetchone()
+        logs = conn.execute("SELECT id, emotion, confidence FROM emotion_logs WHERE student_id = ?",
+                            (student_id,)).fetchall()
+    return state, logs
+
+def test_analyze_api_saves_state_with_the_log_row(api):
+    main, store, path = api
+    client = main.app.test_client()
+    day = datetime.utcnow().strftime("%Y-%m-%d")
+
+    first = _msgs(("user", "部活で疲れた"))
+    r1 = client.post("/api/analyze", json={"student_id": "a1", "messages": first}).get_json()
+    assert (r1["emotion"], r1["confidence"]) == detect_emotion_6("部活で疲れた") and r1["message"] == "created today record"
+    state, logs = _stored(path, "a1")
+    assert state == (r1["emotion"], r1["confidence"], 1, message_fingerprint(first[-1]), r1["entry_id"])
+    assert logs == [(r1["entry_id"], r1["emotion"], r1["confidence"])]
+
+    second = first + _msgs(("assistant", r1["reply"]), ("user", "明日の発表が不安"))
+    store._lru.clear()                                     # 再起動相当: LRU が外れても SQLite の続きから
+    r2 = client.post("/api/analyze", json={"student_id": "a1", "messages": second}).get_json()
+    assert (r2["emotion"], r2["confidence"]) == detect_emotion_6("明日の発表が不安", r1["emotion"])
+    assert r2["entry_id"] == r1["entry_id"] and r2["message"] == "updated today record"
+    state, logs = _stored(path, "a1")
+    assert state == (r2["emotion"], r2["confidence"], 3, message_fingerprint(second[-1]), r1["entry_id"])
+    assert logs == [(r1["entry_id"], r2["emotion"], r2["confidence"])]
+    assert store.get("a1", day).last_index == 3
+
+    r3 = client.post("/api/analyze", json={"student_id": "a1", "messages": second}).get_json()   # 再送
+    assert (r3["emotion"], r3["confidence"], r3["entry_id"]) == (r2["emotion"], r2["confidence"], r1["entry_id"])
+    assert _stored(path, "a1")[0][2] == 3
+
+def test_analyze_api_state_and_log_write_roll_back_together(api, monkeypatch):
+    main, store, path = api
+    client = main.app.test_client()
+    day = datetime.utcnow().strftime("%Y-%m-%d")
+    def broken_save(conn, st):
+        raise sqlite3.OperationalError("disk I/O error")
+    monkeypatch.setattr(store, "save", broken_save)
+
+    r = client.post("/api/analyze", json={"student_id": "a2", "text": "部活で疲れた"})
+    assert r.status_code == 500
+    assert _stored(path, "a2") == (None, [])                # 状態を保存できなければ今日の行も残らない
+    assert store.get("a2", day) == ConversationState("a2", day)   # LRU にも載っていない
+
+def test_stale_state_from_another_worker_does_not_duplicate_the_day(api, monkeypatch):
+    main, worker_a, path = api
+    worker_b = ConversationStateStore(path)                 # 別プロセスの LRU
+    client = main.app.test_client()
+    day = datetime.utcnow().strftime("%Y-%m-%d")
+    assert worker_b.get("a3", day) == ConversationState("a3", day)   # B は行ができる前の状態を覚えている
+
+    first = _msgs(("user", "部活で疲れた"))
+    r1 = client.post("/api/analyze", json={"student_id": "a3", "messages": first}).get_json()   # A が書く
+    second = first + _msgs(("assistant", r1["reply"]), ("user", "明日の発表が不安"))
+    monkeypatch.setattr(main, "conversation_states", worker_b)
+    r2 = client.post("/api/analyze", json={"student_id": "a3", "messages": second}).get_json()  # B が続きを受ける
+
+    assert r2["entry_id"] == r1["entry_id"] and r2["message"] == "updated today record"
+    assert (r2["emotion"], r2["confidence"]) == detect_emotion_6("明日の発表が不安", r1["emotion"])   # 続きから
+    state, logs = _stored(path, "a3")
+    assert state == (r2["emotion"], r2["confidence"], 3, message_fingerprint(second[-1]), r1["entry_id"])
+    assert logs == [(r1["entry_id"], r2["emotion"], r2["confidence"])]
+    assert worker_b.get("a3", day).last_index == 3
+
+def test_unknown_or_missing_entry_id_updates_todays_row(api):
+    main, store, path = api
+    client = main.app.test_client()
+    day = datetime.utcnow().strftime("%Y-%m-%d")
+    with sqlite3.connect(path) as conn:                     # 状態は行 id を知らないが、今日の行はある
+        conn.execute("INSERT INTO emotion_logs (student_id, emotion, confidence, created_at) "
+                      "VALUES ('a4', '中立', 0.3, datetime('now'))")
+        row_id = conn.execute("SELECT id FROM emotion_logs WHERE student_id = 'a4'").fetchone()[0]
+        store.save(conn, ConversationState("a4", day, "中立", 0.3))
+    r = client.post("/api/analyze", json={"student_id": "a4", "text": "部活で疲れた"}).get_json()
+    assert (r["entry_id"], r["message"]) == (row_id, "updated today record")
+
+    store.remember(replace(store.get("a4", day), entry_id=row_id + 100))   # 覚えている行が消えていた
+    with sqlite3.connect(path) as conn:
+        conn.execute("UPDATE conversation_state SET entry_id = ? WHERE student_id = 'a4'", (row_id + 100,))
+    r = client.post("/api/analyze", json={"student_id": "a4", "text": "明日の発表が不安"}).get_json()
+    assert (r["entry_id"], r["message"]) == (row_id, "updated today record")
+    assert len(_stored(path, "a4")[1]) == 1
@@ -0,0 +1,44 @@
+# tests/test_emotion_rules_parity.py
+import pytest
+
+from emotion_rules import detect_emotion_6
+from fixtures.emotion_rules_legacy import detect_emotion_6 as detect_emotion_6_legacy
+
+# (text, prev_emotion, 期待する感情) — 旧実装と感情・confidence まで一致すること
+CASES = [
+    # 危険ワードは他の語より優先
+    ("テスト楽しいけど死にたい", None, "しんどい"),
+    ("最高だったのに、もう無理", "楽しい", "しんどい"),
+    # 好き × 嫌い の葛藤
+    ("好きなのに嫌いになりそう", None, "しんどい"),
+    # ポジだけ / ポジ × ネガ混合 / ネガ優勢
+    ("今日は楽しかった、最高", None, "楽しい"),
+    ("楽しいけど疲れた", None, "しんどい"),
+    ("嬉しいけど発表が不安で緊張する、どうしよう", None, "不安"),
+    ("理不尽でムカつく", None, "怒り"),
+    # 否定の上書き
+    ("しんどいけど大丈夫", None, "中立"),
+    ("不安ではないかな", "不安", "中立"),
+    ("昨日はしんどかった、今日は大丈夫", None, "中立"),
+    # 「無理しないでね」でしんどいを打ち消し → ヒット無しで前フレーム継続
+    ("無理しないでね", "悲しい", "悲しい"),
+    # あいさつ・ヒット無し・空文字
+    ("おはよう", None, "中立"),
+    ("うん", "不安", "不安"),
+    ("うん", None, "中立"),
+    ("", "怒り", "怒り"),
+    # 全角/半角違いは別判定のまま（キャッシュで全角の結果を流用しない）
+    ("ムカつく", None, "怒り"),
+    ("ﾑｶつく", None, "中立"),
+]
+
+@pytest.mark.parametrize("text,prev,expected", CASES)
+def test_detect_emotion_6_matches_the_legacy_implementation(text, prev, expected):
+    emotion, confidence = detect_emotion_6(text, prev)
+    legacy_emotion, legacy_confidence = detect_emotion_6_legacy(text, prev)
+    assert emotion == legacy_emotion == expected
+    assert confidence == pytest.approx(legacy_confidence)
+
+def test_detect_emotion_6_does_not_print(capsys):
+    detect_emotion_6("テスト楽しいけど疲れた", "不安")
+    assert capsys.readouterr().out == ""
@@ -1,8 +1,28 @@
 ﻿# app/core/db.py
+import logging
 import os
-from sqlalchemy import create_engine
+import re
+import time
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import Engine, make_url
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
 from sqlalchemy.orm import sessionmaker, declarative_base
+from sqlalchemy.pool import AsyncAdaptedQueuePool, NullPool, QueuePool, StaticPool
 from contextlib import contextmanager
+from typing import Any, AsyncIterator, Callable, Optional, TypeVar
+
+from starlette.concurrency import run_in_threadpool
+
+try:
+    from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, async_sessionmaker, create_async_engine
+except Exception:  # greenlet が無い環境
+    AsyncEngine = AsyncSession = None  # type: ignore
+    async_sessionmaker = create_async_engine = None  # type: ignore
+
+try:
+    from app.metrics import DB_POOL_CHECKOUT_SECONDS, DB_POOL_TIMEOUTS
+except Exception:  # メトリクスは任意
+    DB_POOL_CHECKOUT_SECONDS = DB_POOL_TIMEOUTS = None
 
 # =========================
 # .env を読み込む（任意）
@@ -17,20 +37,263 @@ except Exception:
 # =========================================================
 # DB URL を .env から取得（なければ nolik.db にフォールバック）
 # =========================================================
-SQLALCHEMY_DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./nolik.db")
+def _normalize_url(url: str) -> str:
+    # requirements は psycopg（v3）なので、素の postgresql:// / postgres:// はそのドライバに向ける
+    for prefix in ("postgresql://", "postgres://"):
+        if url.startswith(prefix):
+            return "postgresql+psycopg://" + url[len(prefix):]
+    return url
+
+
+SQLALCHEMY_DATABASE_URL = _normalize_url(os.getenv("DATABASE_URL", "sqlite:///./nolik.db"))
 
 # ログ表示（デバッグ時のみ）
 if os.getenv("DEBUG_DB", "0") == "1":
     print(f"[DB] Using database URL: {SQLALCHEMY_DATABASE_URL}")
 
 # =========================================================
-# エンジン作成
+# SQLite 接続プロファイル（接続ごとに PRAGMA を当てる）
 # =========================================================
-engine = create_engine(
-    SQLALCHEMY_DATABASE_URL,
-    connect_args={"check_same_thread": False} if SQLALCHEMY_DATABASE_URL.startswith("sqlite") else {},
-)
+# 既定は WAL（読み手が書き手を待たない）＋ synchronous=NORMAL（コミット毎の fsync を省く。
+# WAL なら電源断でも壊れず、失うのは最後の数コミットだけ）。
+# NOLOOK_SQLITE_PROFILE=off で SQLite の素の設定に戻せる。個別の値は NOLOOK_SQLITE_<PRAGMA> で上書き。
+SQLITE_PROFILE_DEFAULTS = {
+    "journal_mode": "WAL",
+    "synchronous": "NORMAL",
+    "busy_timeout": "5000",        # ms：ロック中はエラーにせず待つ
+    "cache_size": "-16384",        # 負数は KiB（16 MiB）
+    "mmap_size": "268435456",      # 256 MiB
+    "temp_store": "MEMORY",
+}
+
+# PRAGMA の読み戻しは数値で返るものがあるので、名前 → 数値で比較する
+_PRAGMA_ENUMS = {
+    "synchronous": {"OFF": 0, "NORMAL": 1, "FULL": 2, "EXTRA": 3},
+    "temp_store": {"DEFAULT": 0, "FILE": 1, "MEMORY": 2},
+}
+
+
+def sqlite_profile() -> dict:
+    """環境変数から PRAGMA の組を作る（SQLite 以外・off なら空）。"""
+    if not SQLALCHEMY_DATABASE_URL.startswith("sqlite"):
+        return {}
+    if os.getenv("NOLOOK_SQLITE_PROFILE", "fast").strip().lower() in ("off", "0", "none", "default"):
+        return {}
+    profile = {}
+    for name, default in SQLITE_PROFILE_DEFAULTS.items():
+        env = f"NOLOOK_SQLITE_{name.upper()}"
+        value = os.getenv(env, default).strip()
+        if not value:
+            continue
+        # PRAGMA は文字列で組み立てるので、値は英数字と負号だけ許す
+        if not re.fullmatch(r"-?[A-Za-z0-9]+", value):
+            raise ValueError(f"{env} の値が不正です: {value!r}")
+        profile[name] = value
+    return profile
+
+
+def _is_memory_db(url: str) -> bool:
+    return url in ("sqlite://", "sqlite:///:memory:") or "mode=memory" in url
+
+
+def _apply_sqlite_pragmas(dbapi_conn, _record) -> None:
+    cur = dbapi_conn.cursor()
+    try:
+        for name, value in SQLITE_PRAGMAS.items():
+            cur.execute(f"PRAGMA {name}={value}")
+    finally:
+        cur.close()
+
+
+def _expected_pragma(name: str, value: str):
+    v = value.strip().upper()
+    if name == "journal_mode":
+        # インメモリ DB は WAL にできない（常に memory）
+        return "memory" if _is_memory_db(SQLALCHEMY_DATABASE_URL) else v.lower()
+    if name in _PRAGMA_ENUMS:
+        return _PRAGMA_ENUMS[name].get(v, int(v) if v.lstrip("-").isdigit() else v)
+    return int(v)
+
+
+def verify_sqlite_pragmas(startup: bool = False) -> dict:
+    """
+    実際の接続で PRAGMA を読み戻し、{名前: {expected, actual, ok}} を返す。
+    startup=True（lifespan から）なら結果を PRAGMA_REPORT に残す（/admin/diagnostics/db で見られる）。
+    """
+    global PRAGMA_REPORT
+    report = {}
+    if SQLITE_PRAGMAS:
+        with engine.connect() as conn:
+            for name, value in SQLITE_PRAGMAS.items():
+                actual = conn.exec_driver_sql(f"PRAGMA {name}").scalar()
+                if isinstance(actual, str):
+                    actual = actual.lower()
+                expected = _expected_pragma(name, value)
+                report[name] = {"expected": expected, "actual": actual, "ok": actual == expected}
+    bad = {k: v for k, v in report.items() if not v["ok"]}
+    if bad:
+        logging.getLogger(__name__).warning("SQLite PRAGMA が設定どおりになっていません: %s", bad)
+    if startup:
+        PRAGMA_REPORT = report
+    return report
+
+
+# =========================================================
+# エンジン作成（アプリ全体でこの1つを使う）
+# =========================================================
+# プールの既定値は方言ごと。NOLOOK_DB_* で上書きできる。
+#   SQLite     : 書き手は1つずつなので小さめ。pre_ping/recycle は不要（ファイルは切れない）
+#   PostgreSQL : サーバ側のアイドル切断に備えて pre_ping＋recycle、文のタイムアウトを接続時に設定
+POOL_DEFAULTS = {
+    "sqlite": {"pool_size": 5, "max_overflow": 10, "pool_timeout": 30, "pool_recycle": -1, "pool_pre_ping": False},
+    "postgresql": {"pool_size": 10, "max_overflow": 20, "pool_timeout": 10, "pool_recycle": 1800, "pool_pre_ping": True},
+}
+_POOL_ENV = {
+    "pool_size": ("NOLOOK_DB_POOL_SIZE", int),
+    "max_overflow": ("NOLOOK_DB_MAX_OVERFLOW", int),
+    "pool_timeout": ("NOLOOK_DB_POOL_TIMEOUT", float),
+    "pool_recycle": ("NOLOOK_DB_POOL_RECYCLE", int),
+    "pool_pre_ping": ("NOLOOK_DB_PRE_PING", lambda v: v.strip().lower() in ("1", "true", "yes", "on")),
+}
+
+
+class _CheckoutTimer:
+    """
+    接続を借りるまでの待ち時間を計る（nolik_db_pool_checkout_seconds）。
+    新しい接続を張る時間も含む。pool_timeout を超えたら nolik_db_pool_timeouts を数える。
+    """
+
+    def _do_get(self):
+        t0 = time.perf_counter()
+        try:
+            return super()._do_get()
+        except PoolTimeoutError:
+            if DB_POOL_TIMEOUTS is not None:
+                DB_POOL_TIMEOUTS.inc()
+            raise
+        finally:
+            if DB_POOL_CHECKOUT_SECONDS is not None:
+                DB_POOL_CHECKOUT_SECONDS.observe(time.perf_counter() - t0)
+
+
+class TimedQueuePool(_CheckoutTimer, QueuePool):
+    pass
+
+
+class TimedAsyncQueuePool(_CheckoutTimer, AsyncAdaptedQueuePool):
+    pass
+
+
+def pool_settings(url: str) -> dict:
+    """方言ごとの既定値に NOLOOK_DB_* を重ねたプール設定（インメモリ SQLite は空＝StaticPool）。"""
+    dialect = make_url(url).get_backend_name()
+    if dialect == "sqlite" and _is_memory_db(url):
+        return {}
+    settings = dict(POOL_DEFAULTS.get(dialect, POOL_DEFAULTS["postgresql"]))
+    for key, (env, conv) in _POOL_ENV.items():
+        raw = os.getenv(env)
+        if raw is not None and raw.strip():
+            try:
+                settings[key] = conv(raw)
+            except ValueError:
+                raise ValueError(f"{env} の値が不正です: {raw!r}")
+    return settings
+
+
+def _connect_args(url: str) -> dict:
+    dialect = make_url(url).get_backend_name()
+    if dialect == "sqlite":
+        return {"check_same_thread": False}
+    if dialect == "postgresql":
+        timeout_ms = int(os.getenv("NOLOOK_PG_STATEMENT_TIMEOUT_MS", "5000"))
+        return {
+            "connect_timeout": int(os.getenv("NOLOOK_PG_CONNECT_TIMEOUT", "5")),
+            "application_name": os.getenv("NOLOOK_PG_APPLICATION_NAME", "nolook"),
+            # 暴走したクエリでプールが埋まらないよう、文ごとの上限をサーバ側で切る
+            "options": f"-c statement_timeout={timeout_ms}",
+        }
+    return {}
+
+
+def make_engine(url: str) -> Engine:
+    """アプリ共通のエンジンを作る（プール設定・方言ごとの接続引数・SQLite の PRAGMA）。"""
+    settings = pool_settings(url)
+    if settings:
+        kwargs = {"poolclass": TimedQueuePool, **settings}
+    else:
+        kwargs = {"poolclass": StaticPool}  # インメモリ SQLite は1接続を共有しないと表が見えない
+    eng = create_engine(url, connect_args=_connect_args(url), **kwargs)
+    if eng.dialect.name == "sqlite" and SQLITE_PRAGMAS:
+        event.listen(eng, "connect", _apply_sqlite_pragmas)
+    return eng
+
+
+def pool_status() -> dict:
+    """プールの今の状態（/admin/diagnostics/db 用）。"""
+    pool = engine.pool
+    out = {"class": type(pool).__name__, "settings": POOL_SETTINGS}
+    if isinstance(pool, QueuePool):
+        out.update({"size": pool.size(), "checked_in": pool.checkedin(),
+                    "checked_out": pool.checkedout(), "overflow": pool.overflow()})
+    return out
+
+
+# ---- 非同期エンジン（/ask・/analyze・/teacher_dashboard・/weekly_report 用） ----
+# 同じ DB に aiosqlite / psycopg（async）で繋ぐ。NOLOOK_DB_ASYNC:
+#   auto（既定）: PostgreSQL だけ非同期。SQLite は書き込みが1本ずつなので、同時トランザクションを増やすと
+#                 ロック待ちで裾が伸びる（python -m bench.async_load で sync の方が p99 が短い）
+#   1 / 0       : 強制的に使う / 使わない
+# 使わない・ドライバが無い・インメモリ SQLite（同期側と表を共有できない）なら None で、
+# run_db はスレッドプールの同期 Session に落ちる（def ルートだった頃と同じ動き）。
+def async_enabled(url: str) -> bool:
+    mode = os.getenv("NOLOOK_DB_ASYNC", "auto").strip().lower()
+    if mode in ("0", "off", "false", "no"):
+        return False
+    if mode in ("1", "on", "true", "yes"):
+        return True
+    return make_url(url).get_backend_name() == "postgresql"
+
+
+def async_url(url: str) -> Optional[str]:
+    u = make_url(url)
+    if u.get_backend_name() == "sqlite":
+        return None if _is_memory_db(url) else str(u.set(drivername="sqlite+aiosqlite"))
+    if u.get_backend_name() == "postgresql":
+        return str(u.set(drivername="postgresql+psycopg"))  # psycopg v3 は同じドライバで async も使える
+    return None
+
+
+def make_async_engine(url: str) -> Optional["AsyncEngine"]:
+    if create_async_engine is None or not async_enabled(url):
+        return None
+    aurl = async_url(url)
+    if aurl is None:
+        return None
+    if make_url(url).get_backend_name() == "sqlite":
+        # aiosqlite は接続ごとにスレッドを持つので、プールに残さず使い終わったら閉じる
+        kwargs: dict = {"poolclass": NullPool}
+        connect_args = {}
+    else:
+        kwargs = {"poolclass": TimedAsyncQueuePool, **pool_settings(url)}
+        connect_args = _connect_args(url)
+    try:
+        eng = create_async_engine(aurl, connect_args=connect_args, **kwargs)
+    except ImportError as e:
+        logging.getLogger(__name__).warning("非同期 DB ドライバが無いので同期 Session で動かします: %s", e)
+        return None
+    if eng.dialect.name == "sqlite" and SQLITE_PRAGMAS:
+        event.listen(eng.sync_engine, "connect", _apply_sqlite_pragmas)
+    return eng
+
+
+SQLITE_PRAGMAS = sqlite_profile()
+PRAGMA_REPORT: dict = {}
+POOL_SETTINGS = pool_settings(SQLALCHEMY_DATABASE_URL)
+engine = make_engine(SQLALCHEMY_DATABASE_URL)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+async_engine = make_async_engine(SQLALCHEMY_DATABASE_URL)
+# commit 後に属性を読み直すと await が要るので expire_on_commit=False
+AsyncSessionLocal = async_sessionmaker(async_engine, expire_on_commit=False) if async_engine is not None else None
 Base = declarative_base()
 
 # =========================================================
@@ -44,6 +307,45 @@ def get_db():
     finally:
         db.close()
 
+# =========================================================
+# FastAPI Depends 用セッション（非同期）
+# =========================================================
+T = TypeVar("T")
+
+
+async def get_async_db() -> AsyncIterator[Optional["AsyncSession"]]:
+    """
+    async def のルート用。AsyncSession を渡す（非同期エンジンが無ければ None）。
+    ルートは DB 処理を同期関数 fn(session, ...) に書き、run_db(db, fn, ...) で呼ぶ。
+    """
+    if AsyncSessionLocal is None:
+        yield None
+        return
+    async with AsyncSessionLocal() as db:
+        yield db
+
+
+async def run_db(db: Optional["AsyncSession"], fn: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+    """
+    fn(session, *args, **kwargs) を実行する。
+    - AsyncSession があれば run_sync（ワーカースレッドを使わず、待ちはイベントループ側）
+    - 無ければ従来どおりスレッドプールで同期 Session（def ルートと同じ動き）
+    commit は fn の中で行う。
+    """
+    if db is not None:
+        return await db.run_sync(fn, *args, **kwargs)
+
+    def call() -> T:
+        with SessionLocal() as s:
+            return fn(s, *args, **kwargs)
+
+    return await run_in_threadpool(call)
+
+
+async def dispose_async_engine() -> None:
+    if async_engine is not None:
+        await async_engine.dispose()
+
 # =========================================================
 # with 文用スコープ付きセッション
 # =========================================================
@@ -69,6 +371,11 @@ def session_scope():
 def init_db() -> None:
     """
     モデルを **先に import** して Base.metadata にマップさせてから create_all。
+    ※ このモジュールが reload されると Base が作り直されるので、
+       モデル側が実際に参照している Base のメタデータを使う。
     """
-    from app.models import orm as _  # noqa: F401
-    Base.metadata.create_all(bind=engine, checkfirst=True)
+    from app.core.migrations import run_migrations
+    from app.models import orm as _orm
+    _orm.Base.metadata.create_all(bind=engine, checkfirst=True)
+    # 既存 DB 向けの追加インデックス等（app/core/migrations.py、schema_version に記録）
+    run_migrations(engine)
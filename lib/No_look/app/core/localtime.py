@@ -0,0 +1,49 @@
+# app/core/localtime.py
+"""
+学校のローカル時刻（日付・ISO 週・時）。
+
+emotion_logs は created_at（UTC）と一緒に、書き込み時に1回だけ計算した
+local_date / local_week / local_hour を持つ（app/models/orm.py のイベントで付与）。
+集計はこの列で GROUP BY すれば、行ごとに astimezone しなくて済む。
+
+- 学校のタイムゾーンは NOLOOK_SCHOOL_TZ（IANA 名、既定 Asia/Tokyo）
+- 変えたときは既存行を計算し直す: python -m app.core.migrations --backfill-local --all
+"""
+from __future__ import annotations
+import logging
+import os
+from datetime import datetime, timezone
+from functools import lru_cache
+from typing import Optional, Tuple
+from zoneinfo import ZoneInfo
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SCHOOL_TZ = "Asia/Tokyo"
+
+
+@lru_cache(maxsize=8)
+def _resolve(name: str) -> str:
+    try:
+        ZoneInfo(name)
+        return name
+    except Exception:
+        logger.warning("NOLOOK_SCHOOL_TZ: unknown time zone %r, using %s", name, DEFAULT_SCHOOL_TZ)
+        return DEFAULT_SCHOOL_TZ
+
+
+def school_tz() -> str:
+    """学校のタイムゾーン（IANA 名）。"""
+    return _resolve(os.getenv("NOLOOK_SCHOOL_TZ", DEFAULT_SCHOOL_TZ).strip() or DEFAULT_SCHOOL_TZ)
+
+
+def local_parts(dt: datetime, tz: Optional[str] = None) -> Tuple[str, str, int]:
+    """
+    UTC 時刻 → (ローカル日 "YYYY-MM-DD", ISO 週 "YYYY-Www", 時 0..23)。
+    naive は UTC とみなす（SQLite は tz を落として返すため）。
+    """
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    local = dt.astimezone(ZoneInfo(tz or school_tz()))
+    year, week, _ = local.isocalendar()
+    return local.date().isoformat(), f"{year:04d}-W{week:02d}", local.hour
@@ -0,0 +1,254 @@
+# app/core/migrations.py
+"""
+軽量なスキーマ移行（バージョン付き・何度流しても同じ結果）。
+
+create_all は「無いテーブルを作る」だけなので、既存 DB にはインデックスや列が増えない。
+ここに並べた移行を schema_version に記録しながら順に当てる（init_db から毎回呼ぶ）。
+
+- 各移行は冪等に書く（CREATE INDEX IF NOT EXISTS / 列の有無を見てから ALTER 等）。
+  記録前に落ちても、複数プロセスが同時に起動しても、もう一度流せば同じ状態になる。
+- 1移行 = 1トランザクション（移行本体と schema_version の記録を一緒に commit）。
+- 新しい DB では create_all が先にモデル定義どおり作るので、移行は「既にある」を確認して記録だけ進む。
+
+    python -m app.core.migrations              # DATABASE_URL の DB に未適用分を当てる
+    python -m app.core.migrations --backfill-local --all   # NOLOOK_SCHOOL_TZ を変えたとき
+"""
+from __future__ import annotations
+import json
+import logging
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from typing import Callable, List, Sequence
+
+from sqlalchemy import inspect, text
+from sqlalchemy.engine import Connection, Engine
+
+logger = logging.getLogger(__name__)
+
+VERSION_TABLE = "schema_version"
+
+
+@dataclass(frozen=True)
+class Migration:
+    version: int
+    name: str
+    apply: Callable[[Connection], None]
+
+
+def _create_index(conn: Connection, name: str, table: str, columns: Sequence[str], unique: bool = False) -> None:
+    # SQLite / PostgreSQL とも IF NOT EXISTS が使える
+    kind = "UNIQUE INDEX" if unique else "INDEX"
+    conn.execute(text(f"CREATE {kind} IF NOT EXISTS {name} ON {table} ({', '.join(columns)})"))
+
+
+def _m1_composite_indexes(conn: Connection) -> None:
+    """
+    ホットなクエリの複合インデックス。
+    - /analyze: class_id = ? AND student_id = ? AND created_at BETWEEN ... ORDER BY created_at DESC
+    - teacher_dashboard / weekly_report / summary: class_id = ? AND created_at BETWEEN ...
+      （emotion まで含めて、件数集計はテーブル本体を読まずに済むようにする）
+    """
+    _create_index(conn, "ix_emotion_logs_class_student_created", "emotion_logs",
+                  ("class_id", "student_id", "created_at"))
+    _create_index(conn, "ix_emotion_logs_class_created_emotion", "emotion_logs",
+                  ("class_id", "created_at", "emotion"))
+
+
+def _m2_daily_rollup(conn: Connection) -> None:
+    """
+    日次集計表を作り、既存の生ログから埋める（作り直しなので何度流しても同じ）。
+    ラベルがまだ JSON 列の DB では、移行5が列を分けたあとに埋める。
+    """
+    from app.models.orm import EmotionDailyRollup, EmotionDailyRollupStudent
+    from app.services.rollup_service import rebuild
+
+    EmotionDailyRollup.__table__.create(conn, checkfirst=True)
+    EmotionDailyRollupStudent.__table__.create(conn, checkfirst=True)
+    if "p_fun" in {c["name"] for c in inspect(conn).get_columns("emotion_logs")}:
+        rebuild(conn)
+
+
+def _add_column(conn: Connection, table: str, name: str, ddl_type: str) -> None:
+    # ADD COLUMN IF NOT EXISTS は SQLite に無いので、列の有無を見てから足す
+    if name not in {c["name"] for c in inspect(conn).get_columns(table)}:
+        conn.execute(text(f"ALTER TABLE {table} ADD COLUMN {name} {ddl_type}"))
+
+
+def backfill_local_columns(conn: Connection, batch_size: int = 5000, recompute: bool = False) -> int:
+    """
+    local_date / local_week / local_hour を created_at から埋める（id 昇順のキーセットで batch_size 行ずつ）。
+    recompute=False なら未設定の行だけ。NOLOOK_SCHOOL_TZ を変えたときは recompute=True。
+    更新した行数を返す。
+    """
+    from app.core.localtime import local_parts
+
+    done, last = 0, 0
+    pending = "" if recompute else " AND local_date IS NULL"
+    while True:
+        rows = conn.execute(
+            text(f"SELECT id, created_at FROM emotion_logs WHERE id > :last{pending} ORDER BY id LIMIT :n"),
+            {"last": last, "n": batch_size},
+        ).all()
+        if not rows:
+            return done
+        params = []
+        for rid, created in rows:
+            if isinstance(created, str):  # SQLite は文字列で返る
+                created = datetime.fromisoformat(created)
+            d, w, h = local_parts(created)
+            params.append({"id": rid, "d": d, "w": w, "h": h})
+        conn.execute(
+            text("UPDATE emotion_logs SET local_date = :d, local_week = :w, local_hour = :h WHERE id = :id"),
+            params,
+        )
+        done += len(params)
+        last = rows[-1][0]
+
+
+def _m3_local_columns(conn: Connection) -> None:
+    """学校ローカルの日・週・時の列と索引を足し、既存行を埋める。"""
+    _add_column(conn, "emotion_logs", "local_date", "VARCHAR(10)")
+    _add_column(conn, "emotion_logs", "local_week", "VARCHAR(8)")
+    _add_column(conn, "emotion_logs", "local_hour", "INTEGER")
+    _create_index(conn, "ix_emotion_logs_local_date", "emotion_logs", ("local_date",))
+    _create_index(conn, "ix_emotion_logs_class_local_date", "emotion_logs", ("class_id", "local_date", "emotion"))
+    _create_index(conn, "ix_emotion_logs_class_local_week", "emotion_logs", ("class_id", "local_week", "local_hour"))
+    backfill_local_columns(conn)
+
+
+def _m4_daily_key(conn: Connection) -> None:
+    """
+    /analyze の1日1レコードを一意キー (class_id, student_id, daily_date) にする。
+    daily_date は /analyze の行だけ local_date と同じ値、/ask の行は NULL（NULL 同士は重複扱いされない）。
+    既存行は、これまでの /analyze が UPDATE 対象にしていた「その生徒のその日の最新行」に付ける
+    （既に付いている日は飛ばすので、何度流しても一意のまま）。
+    """
+    _add_column(conn, "emotion_logs", "daily_date", "VARCHAR(10)")
+    conn.execute(text(
+        "UPDATE emotion_logs SET daily_date = local_date WHERE id IN ("
+        " SELECT t.id FROM ("
+        "  SELECT id, class_id, student_id, local_date, ROW_NUMBER() OVER ("
+        "   PARTITION BY class_id, student_id, local_date ORDER BY created_at DESC, id DESC) AS rn"
+        "  FROM emotion_logs WHERE student_id IS NOT NULL AND local_date IS NOT NULL"
+        " ) t WHERE t.rn = 1 AND NOT EXISTS ("
+        "  SELECT 1 FROM emotion_logs d"
+        "  WHERE d.class_id = t.class_id AND d.student_id = t.student_id AND d.daily_date = t.local_date))"
+    ))
+    _create_index(conn, "ux_emotion_logs_daily", "emotion_logs", ("class_id", "student_id", "daily_date"), unique=True)
+
+
+def backfill_label_columns(conn: Connection, batch_size: int = 5000) -> int:
+    """
+    JSON の labels 列から p_fun ... p_neutral を埋める（id 昇順のキーセットで batch_size 行ずつ）。
+    キーの空白・別名は再分類と同じく正規キーに寄せる。埋めた行数を返す。
+    """
+    from app.models.orm import label_values
+
+    done, last = 0, 0
+    while True:
+        rows = conn.execute(
+            text("SELECT id, labels FROM emotion_logs WHERE id > :last ORDER BY id LIMIT :n"),
+            {"last": last, "n": batch_size},
+        ).all()
+        if not rows:
+            return done
+        params = []
+        for rid, labels in rows:
+            if isinstance(labels, str):  # SQLite は文字列で返る
+                try:
+                    labels = json.loads(labels)
+                except ValueError:
+                    labels = None
+            params.append({"id": rid, **label_values(labels if isinstance(labels, dict) else None)})
+        conn.execute(
+            text("UPDATE emotion_logs SET p_fun = :p_fun, p_sad = :p_sad, p_angry = :p_angry,"
+                 " p_anxious = :p_anxious, p_tired = :p_tired, p_neutral = :p_neutral WHERE id = :id"),
+            params,
+        )
+        done += len(params)
+        last = rows[-1][0]
+
+
+def _m5_label_columns(conn: Connection) -> None:
+    """
+    labels（JSON）を6つの FLOAT 列に分ける。1日のラベル量は SUM(p_*) で取れ、
+    書き込みのたびに dict を JSON にしなくて済む。埋め終わったら JSON 列は落とす
+    （SQLite は 3.35 以降の DROP COLUMN。列が無ければ何もしないので何度流しても同じ）。
+    移行2で埋められなかった日次集計もここで作り直す。
+    """
+    from app.models.orm import LABEL_COLUMNS
+    from app.services.rollup_service import rebuild
+
+    for col in LABEL_COLUMNS.values():
+        _add_column(conn, "emotion_logs", col, "FLOAT NOT NULL DEFAULT 0")
+    if "labels" in {c["name"] for c in inspect(conn).get_columns("emotion_logs")}:
+        backfill_label_columns(conn)
+        conn.execute(text("ALTER TABLE emotion_logs DROP COLUMN labels"))
+        rebuild(conn)
+
+
+MIGRATIONS: List[Migration] = [
+    Migration(1, "emotion_logs composite indexes", _m1_composite_indexes),
+    Migration(2, "emotion_daily_rollup backfill", _m2_daily_rollup),
+    Migration(3, "emotion_logs local_date/local_week/local_hour", _m3_local_columns),
+    Migration(4, "emotion_logs unique daily key for /analyze", _m4_daily_key),
+    Migration(5, "emotion_logs labels JSON -> p_* float columns", _m5_label_columns),
+]
+
+
+def _ensure_version_table(conn: Connection) -> None:
+    conn.execute(text(
+        f"CREATE TABLE IF NOT EXISTS {VERSION_TABLE} ("
+        " version INTEGER PRIMARY KEY,"
+        " name VARCHAR NOT NULL,"
+        " applied_at VARCHAR NOT NULL)"
+    ))
+
+
+def current_version(engine: Engine) -> int:
+    """記録済みの最大バージョン（未移行の DB は 0）。"""
+    if not inspect(engine).has_table(VERSION_TABLE):
+        return 0
+    with engine.connect() as conn:
+        return int(conn.execute(text(f"SELECT COALESCE(MAX(version), 0) FROM {VERSION_TABLE}")).scalar() or 0)
+
+
+def run_migrations(engine: Engine, migrations: Sequence[Migration] = MIGRATIONS) -> List[int]:
+    """未適用の移行を番号順に当て、当てたバージョンを返す。"""
+    with engine.begin() as conn:
+        _ensure_version_table(conn)
+        done = {int(v) for v in conn.execute(text(f"SELECT version FROM {VERSION_TABLE}")).scalars()}
+
+    applied: List[int] = []
+    for m in sorted(migrations, key=lambda m: m.version):
+        if m.version in done:
+            continue
+        with engine.begin() as conn:
+            # 別プロセスが先に当てていたら記録だけ見て抜ける（本体は冪等なので二重実行でも壊れない）
+            if conn.execute(text(f"SELECT 1 FROM {VERSION_TABLE} WHERE version = :v"), {"v": m.version}).first():
+                continue
+            m.apply(conn)
+            conn.execute(
+                text(f"INSERT INTO {VERSION_TABLE} (version, name, applied_at) VALUES (:v, :n, :t)"),
+                {"v": m.version, "n": m.name, "t": datetime.now(timezone.utc).isoformat()},
+            )
+        logger.info("schema migration %d applied: %s", m.version, m.name)
+        applied.append(m.version)
+    return applied
+
+
+if __name__ == "__main__":
+    import argparse
+
+    from app.core.db import engine, init_db
+
+    parser = argparse.ArgumentParser(description="Apply pending schema migrations.")
+    parser.add_argument("--backfill-local", action="store_true", help="Fill local_date/local_week/local_hour.")
+    parser.add_argument("--all", action="store_true", help="With --backfill-local: recompute every row.")
+    args = parser.parse_args()
+
+    init_db()
+    print(f"schema version: {current_version(engine)}")
+    if args.backfill_local:
+        with engine.begin() as conn:
+            print(f"backfilled: {backfill_local_columns(conn, recompute=args.all)} rows")
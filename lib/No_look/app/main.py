@@ -17,11 +17,15 @@ from app.routes.teacher_dashboard import router as teacher_dashboard_router
 from app.routes.weekly import router as weekly_report_router  # ★ weekly_report
 from app.routes.weekly_view import router as weekly_view_router
 from app.routes.weekly_ascii import router as weekly_ascii_router
+from app.routes.admin import router as admin_router
+from app.routes.ingest import router as ingest_router
 # from app.routes.weekly_ascii import router as weekly_ascii_router  # ← 廃止
 
 # ====== メトリクス / DB ======
 from app.metrics import HTTP_REQUESTS_TOTAL
-from app.core.db import init_db
+from app.core.db import dispose_async_engine, init_db, verify_sqlite_pragmas
+from app.services import llm_client, log_queue
+from starlette.concurrency import run_in_threadpool
 
 # ====== lifespan（startup/shutdown置き換え） ======
 @asynccontextmanager
@@ -29,9 +33,14 @@ async def lifespan(app: FastAPI):
     # ---- startup 相当 ----
     # DB初期化（存在しないテーブル自動CREATEなど）
     init_db()
+    # SQLite の PRAGMA（WAL 等）が効いているか確認（食い違いは警告ログ、/admin/diagnostics/db でも見られる）
+    verify_sqlite_pragmas(startup=True)
     yield
     # ---- shutdown 相当 ----
-    # いまは特に無し（必要になったらここにクローズ処理等を追加）
+    # /ask の書き込み待ちキューを書き切ってから、非同期エンジンのプール（PostgreSQL）と LLM の接続を閉じる
+    await run_in_threadpool(log_queue.shutdown)
+    await dispose_async_engine()
+    await llm_client.aclose()
 
 # ====== FastAPI本体 ======
 app = FastAPI(
@@ -67,6 +76,8 @@ app.include_router(teacher_dashboard_router)
 app.include_router(weekly_report_router)
 app.include_router(weekly_view_router)
 app.include_router(weekly_ascii_router)
+app.include_router(admin_router)
+app.include_router(ingest_router)
 # app.include_router(weekly_ascii_router)  # ← 廃止
 
 # ====== ヘルスチェック ======
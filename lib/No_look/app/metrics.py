@@ -1,8 +1,53 @@
 # app/metrics.py
-from prometheus_client import Counter
+from prometheus_client import Counter, Gauge, Histogram
 
 # HTTPの総数カウンタ（テストがこれの存在をチェック）
 HTTP_REQUESTS_TOTAL = Counter("nolik_http_requests_total", "Total HTTP requests")
 
 # 感情イベントのカウンタ（/analyze 内で try インクリメント）
 EMOTION_TOTAL = Counter("nolik_emotion_created", "Emotion created counter", ["emotion"])
+
+# 分類結果メモ化（app/rules/memo.py）のヒット/ミス/追い出し件数（cache=分類関数名）
+CLASSIFY_CACHE_HITS = Counter("nolik_classify_cache_hits", "Classification cache hits", ["cache"])
+CLASSIFY_CACHE_MISSES = Counter("nolik_classify_cache_misses", "Classification cache misses", ["cache"])
+CLASSIFY_CACHE_EVICTIONS = Counter("nolik_classify_cache_evictions", "Classification cache LRU evictions", ["cache"])
+
+# 長文の分割走査が CPU 予算（NOLOOK_ANALYZE_BUDGET_MS）で打ち切られた回数
+ANALYZE_TRUNCATED = Counter("nolik_analyze_truncated", "Long-text analyses cut off by the CPU budget")
+
+# DB プール（app/core/db.py）から接続を借りるまでの待ち時間と、pool_timeout 超えの回数
+DB_POOL_CHECKOUT_SECONDS = Histogram(
+    "nolik_db_pool_checkout_seconds", "Time spent waiting for a pooled DB connection",
+    buckets=(0.0005, 0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0),
+)
+DB_POOL_TIMEOUTS = Counter("nolik_db_pool_timeouts", "DB pool checkouts that hit pool_timeout")
+
+# /ask の emotion_logs 書き込み待ちキュー（app/services/log_queue.py）
+LOG_QUEUE_DEPTH = Gauge("nolik_log_queue_depth", "Emotion log rows waiting to be flushed")
+LOG_QUEUE_FLUSH_SECONDS = Histogram(
+    "nolik_log_queue_flush_seconds", "Time to flush one batch of queued emotion log rows",
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0),
+)
+LOG_QUEUE_FLUSH_ROWS = Histogram(
+    "nolik_log_queue_flush_rows", "Rows per flushed batch",
+    buckets=(1, 2, 5, 10, 25, 50, 100, 200, 500, 1000),
+)
+LOG_QUEUE_FULL = Counter("nolik_log_queue_full", "Enqueue attempts that found the queue full (backpressure)")
+LOG_QUEUE_DROPPED = Counter("nolik_log_queue_dropped", "Queued emotion log rows that could not be written")
+
+# /analyze の今日の行の状態キャッシュ（app/services/today_cache.py）
+TODAY_CACHE_HITS = Counter("nolik_today_cache_hits", "/analyze updates that skipped reading today's row")
+TODAY_CACHE_MISSES = Counter("nolik_today_cache_misses", "/analyze calls that had no cached state for today")
+TODAY_CACHE_STALE = Counter("nolik_today_cache_stale", "Cached today states that no longer matched the row")
+
+# /ingest（NDJSON ストリーム）で受けた行
+INGEST_LINES = Counter("nolik_ingest_lines", "NDJSON lines received by /ingest", ["result"])
+
+# /ask の LLM 呼び出し（app/services/llm_client.py）
+LLM_CALLS = Counter("nolik_llm_calls", "LLM calls by outcome", ["outcome"])
+LLM_CALL_SECONDS = Histogram(
+    "nolik_llm_call_seconds", "Upstream LLM call latency (after acquiring a concurrency slot)",
+    buckets=(0.05, 0.1, 0.25, 0.5, 1.0, 2.0, 3.0, 5.0, 10.0),
+)
+LLM_INFLIGHT = Gauge("nolik_llm_inflight", "LLM calls currently in flight")
+LLM_BREAKER_OPEN = Gauge("nolik_llm_breaker_open", "1 while the LLM circuit breaker is open")
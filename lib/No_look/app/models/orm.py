@@ -1,11 +1,68 @@
 ﻿# app/models/orm.py
+from __future__ import annotations
+import math
 from datetime import datetime, timezone
-from sqlalchemy import Column, Integer, String, Float, Boolean, DateTime
+from typing import Any, Dict, Iterable, List, Mapping, Sequence, Tuple
+from sqlalchemy import Column, Integer, String, Float, Boolean, DateTime, Index, event
 from sqlalchemy.dialects.sqlite import JSON
 from app.core.db import Base
+from app.core.localtime import local_parts
+from app.models.schemas import Emotion
+
+# 感情ラベル → 確率の列名（EmotionLog.p_fun ... 並びは API の labels と同じ）。
+# 日次集計（EmotionDailyRollup.p_*）と同じ名前なので、ラベル量の合計はそのまま SQL の SUM で取れる
+LABEL_COLUMNS: Dict[str, str] = {e.value: f"p_{e.name}" for e in Emotion}
+_LABEL_NAMES: Tuple[str, ...] = tuple(LABEL_COLUMNS.values())
+
+
+def _label_column(key: Any) -> str | None:
+    if not isinstance(key, str):
+        return None
+    col = LABEL_COLUMNS.get(key) or LABEL_COLUMNS.get(key.strip())
+    if col is None:
+        # 古いクライアントの別名（"たのしい" 等）。通常経路は正規キーなのでここまで来ない
+        from app.services.normalizer import normalize_emotion
+        col = LABEL_COLUMNS.get(normalize_emotion(key.strip()) or "")
+    return col
+
+
+def label_values(labels: Mapping[str, Any] | None) -> Dict[str, float]:
+    """{"楽しい": 0.2, ...} → {"p_fun": 0.2, ...}（6列すべて。無いキーは0、数値でない値は無視、同じ列は合算）"""
+    out = dict.fromkeys(_LABEL_NAMES, 0.0)
+    for k, v in (labels or {}).items():
+        col = _label_column(k)
+        if col is None:
+            continue
+        try:
+            f = float(v)
+        except (TypeError, ValueError):
+            continue
+        if math.isfinite(f):
+            out[col] += f
+    return out
+
+
+def labels_from_values(values: Sequence[Any]) -> Dict[str, float]:
+    """6列の値（LABEL_COLUMNS の順）→ API の labels dict。レスポンスを作るところでだけ使う"""
+    return {e: float(v or 0.0) for e, v in zip(LABEL_COLUMNS, values)}
+
+
+def label_columns() -> List[Any]:
+    """select() に並べる6列（LABEL_COLUMNS の順）"""
+    return [getattr(EmotionLog, c) for c in _LABEL_NAMES]
 
 class EmotionLog(Base):
     __tablename__ = "emotion_logs"
+    # 複合インデックス（既存 DB には app/core/migrations.py の移行1で追加）
+    __table_args__ = (
+        Index("ix_emotion_logs_class_student_created", "class_id", "student_id", "created_at"),
+        Index("ix_emotion_logs_class_created_emotion", "class_id", "created_at", "emotion"),
+        # 移行3：学校ローカルの日・週で GROUP BY するため
+        Index("ix_emotion_logs_class_local_date", "class_id", "local_date", "emotion"),
+        Index("ix_emotion_logs_class_local_week", "class_id", "local_week", "local_hour"),
+        # 移行4：/analyze の1日1レコード（INSERT ... ON CONFLICT の衝突先）
+        Index("ux_emotion_logs_daily", "class_id", "student_id", "daily_date", unique=True),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
 
@@ -21,8 +78,84 @@ class EmotionLog(Base):
     student_id = Column(String, index=True, nullable=True)
     emotion = Column(String, nullable=False)
     score = Column(Float, nullable=False)
-    labels = Column(JSON, nullable=False)
+    # 6分類の確率（移行5で JSON の labels 列から移した）。dict は labels プロパティで組み立てる
+    p_fun = Column(Float, nullable=False, default=0.0)
+    p_sad = Column(Float, nullable=False, default=0.0)
+    p_angry = Column(Float, nullable=False, default=0.0)
+    p_anxious = Column(Float, nullable=False, default=0.0)
+    p_tired = Column(Float, nullable=False, default=0.0)
+    p_neutral = Column(Float, nullable=False, default=0.0)
     topic_tags = Column(JSON, nullable=False, default=list)
     relationship_mention = Column(Boolean, nullable=False, default=False)
     negation_index = Column(Integer, nullable=False, default=0)
     avoidance = Column(Integer, nullable=False, default=0)
+
+    # 学校ローカル（NOLOOK_SCHOOL_TZ）の日付・ISO 週・時。書き込み時に created_at から付ける
+    local_date = Column(String(10), nullable=True, index=True)   # "YYYY-MM-DD"
+    local_week = Column(String(8), nullable=True)                # "YYYY-Www"
+    local_hour = Column(Integer, nullable=True)                  # 0..23
+    # /analyze の1日1レコードだけ local_date と同じ値（/ask の行は NULL で一意制約の対象外）
+    daily_date = Column(String(10), nullable=True)
+
+    def label_vector(self) -> Tuple[float, ...]:
+        """6列の値（LABEL_COLUMNS の順）。dict を作らずに読む"""
+        return tuple(float(getattr(self, c) or 0.0) for c in _LABEL_NAMES)
+
+    def set_label_vector(self, values: Iterable[float]) -> None:
+        for c, v in zip(_LABEL_NAMES, values):
+            setattr(self, c, float(v))
+
+    @property
+    def labels(self) -> Dict[str, float]:
+        return labels_from_values(self.label_vector())
+
+    @labels.setter
+    def labels(self, value: Mapping[str, Any] | None) -> None:
+        for c, v in label_values(value).items():
+            setattr(self, c, v)
+
+
+@event.listens_for(EmotionLog, "before_insert")
+@event.listens_for(EmotionLog, "before_update")
+def _stamp_local_columns(mapper, connection, target: EmotionLog) -> None:
+    # 1日1レコードの UPDATE は created_at を進めるので、更新時も付け直す
+    if target.created_at is None:
+        target.created_at = datetime.now(timezone.utc)
+    target.local_date, target.local_week, target.local_hour = local_parts(target.created_at)
+
+
+class EmotionDailyRollup(Base):
+    """
+    クラス × ローカル日 × タイムゾーン の日次集計（app/services/rollup_service.py が書き込み時に増減）。
+    n_* は感情ごとの件数、p_* はラベル確率の合計、students はその日に記録のある生徒数。
+    """
+    __tablename__ = "emotion_daily_rollup"
+
+    class_id = Column(String, primary_key=True)          # class_id 無しの行は ""
+    local_date = Column(String(10), primary_key=True)    # "YYYY-MM-DD"（tz でのローカル日）
+    tz = Column(String, primary_key=True)                # IANA 名
+    total = Column(Integer, nullable=False, default=0)
+    students = Column(Integer, nullable=False, default=0)
+    n_fun = Column(Integer, nullable=False, default=0)
+    n_sad = Column(Integer, nullable=False, default=0)
+    n_angry = Column(Integer, nullable=False, default=0)
+    n_anxious = Column(Integer, nullable=False, default=0)
+    n_tired = Column(Integer, nullable=False, default=0)
+    n_neutral = Column(Integer, nullable=False, default=0)
+    p_fun = Column(Float, nullable=False, default=0.0)
+    p_sad = Column(Float, nullable=False, default=0.0)
+    p_angry = Column(Float, nullable=False, default=0.0)
+    p_anxious = Column(Float, nullable=False, default=0.0)
+    p_tired = Column(Float, nullable=False, default=0.0)
+    p_neutral = Column(Float, nullable=False, default=0.0)
+
+
+class EmotionDailyRollupStudent(Base):
+    """生徒ごとのその日の記録数（EmotionDailyRollup.students を増減するための参照カウント）。"""
+    __tablename__ = "emotion_daily_rollup_students"
+
+    class_id = Column(String, primary_key=True)
+    local_date = Column(String(10), primary_key=True)
+    tz = Column(String, primary_key=True)
+    student_id = Column(String, primary_key=True)
+    n = Column(Integer, nullable=False, default=0)
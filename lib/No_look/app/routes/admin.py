@@ -0,0 +1,91 @@
+# app/routes/admin.py
+from __future__ import annotations
+import os
+import secrets
+import threading
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+from fastapi import APIRouter, Header, HTTPException, Query
+
+from app.core import db as coredb
+from app.core.migrations import current_version
+from app.services.label_canonicalize_service import run_canonicalize
+
+router = APIRouter(prefix="/admin", tags=["admin"])
+
+# labels 正規化ジョブは1プロセスに1本だけ（バックグラウンドスレッドで回し、GET で状況を見る）
+_job_lock = threading.Lock()
+_job: Dict[str, Any] = {"state": "idle"}
+
+
+def _require_admin(token: Optional[str]) -> None:
+    expected = (os.getenv("NOLOOK_ADMIN_TOKEN") or "").strip()
+    if not expected:
+        raise HTTPException(status_code=403, detail="管理APIは無効です（NOLOOK_ADMIN_TOKEN 未設定）。")
+    # 定数時間で比較（一致するまでの文字数で時間が変わらないように）。非 ASCII も通るよう bytes で比べる
+    if not secrets.compare_digest((token or "").encode("utf-8"), expected.encode("utf-8")):
+        raise HTTPException(status_code=403, detail="管理トークンが違います。")
+
+
+def _run_job(dry_run: bool, chunk_size: int) -> None:
+    def progress(r) -> None:
+        _job["report"] = r.to_dict()
+
+    try:
+        report = run_canonicalize(
+            coredb.SessionLocal,
+            dry_run=dry_run,
+            chunk_size=chunk_size,
+            checkpoint=Path(os.getenv("NOLOOK_CANONICALIZE_CHECKPOINT", ".canonicalize_checkpoint.json")),
+            progress=progress,
+        )
+        _job.update(state="done", report=report.to_dict())
+    except Exception as e:
+        _job.update(state="failed", error=str(e))
+    finally:
+        _job["finished_at"] = datetime.now(timezone.utc).isoformat()
+
+
+@router.post("/canonicalize-labels", summary="emotion_logs の labels 正規化（既定は dry-run の差分集計）")
+def start_canonicalize(
+    dry_run: bool = Query(True),
+    chunk_size: int = Query(2000, ge=1, le=100000),
+    x_admin_token: Optional[str] = Header(None),
+):
+    _require_admin(x_admin_token)
+    with _job_lock:
+        if _job.get("state") == "running":
+            raise HTTPException(status_code=409, detail="labels 正規化ジョブは実行中です。")
+        _job.clear()
+        _job.update(
+            state="running",
+            dry_run=dry_run,
+            started_at=datetime.now(timezone.utc).isoformat(),
+        )
+        t = threading.Thread(
+            target=_run_job, args=(dry_run, chunk_size),
+            name="nolook-canonicalize", daemon=True,
+        )
+        t.start()
+    return dict(_job)
+
+
+@router.get("/canonicalize-labels", summary="labels 正規化ジョブの状況")
+def canonicalize_status(x_admin_token: Optional[str] = Header(None)):
+    _require_admin(x_admin_token)
+    return dict(_job)
+
+
+@router.get("/diagnostics/db", summary="DB 接続プロファイル（SQLite PRAGMA・スキーマ版・接続プール）")
+def db_diagnostics(x_admin_token: Optional[str] = Header(None)):
+    _require_admin(x_admin_token)
+    return {
+        "dialect": coredb.engine.dialect.name,
+        "profile": coredb.SQLITE_PRAGMAS,
+        "startup": coredb.PRAGMA_REPORT,
+        "current": coredb.verify_sqlite_pragmas(),
+        "schema_version": current_version(coredb.engine),
+        "pool": coredb.pool_status(),
+    }
@@ -1,22 +1,34 @@
 ﻿# app/routes/analyze.py
 from __future__ import annotations
 import os
-from datetime import datetime, timedelta, timezone
-from typing import Dict, Optional, Tuple, Any
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Tuple, Any
 
+import numpy as np
 from fastapi import APIRouter, Depends, Request, Response, HTTPException
 from pydantic import BaseModel
+from sqlalchemy import insert, update
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import Session
 
-from app.core.db import get_db
-from app.models.orm import EmotionLog
+from app.core.db import AsyncSession, get_async_db, get_db, run_db
+from app.core.localtime import local_parts
+from app.models.orm import EmotionLog, label_columns, label_values, labels_from_values
 from app.services.analyze_service import (
-    analyze_text_to_labels,
+    analyze_text_async,
+    analyze_texts_to_matrix,
     blend_labels_ema_with_latest_bonus,
+    blend_sequences_ema,
+    merge_signals,
     one_hot_from_selected,
+    row_to_labels,
     EMOTION_KEYS,
 )
 from app.services.normalizer import normalize_emotion
+from app.services import rollup_service
+from app.services.today_cache import TodayState, today_cache
 from app.metrics import EMOTION_TOTAL
 
 router = APIRouter(prefix="/analyze", tags=["analyze"])
@@ -39,10 +51,32 @@ class AnalyzeOutput(BaseModel):
     signals: Dict[str, Any]
     features: Dict[str, Any]
 
+class AnalyzeBatchItem(BaseModel):
+    class_id: Optional[str] = None
+    student_id: str
+    text: str
+    selected_emotion: Optional[str] = None
+
+class AnalyzeBatchInput(BaseModel):
+    items: List[AnalyzeBatchItem]
+
+class AnalyzeBatchResult(BaseModel):
+    index: int
+    id: int
+    class_id: Optional[str]
+    student_id: str
+    labels: Dict[str, float]
+    emotion: str
+    score: float
+
+class AnalyzeBatchOutput(BaseModel):
+    count: int
+    created_at: str
+    results: List[AnalyzeBatchResult]
+
 # ====== Consts / Helpers ======
 COOKIE_NAME = os.environ.get("NOLOOK_SID_COOKIE", "nll_sid")
 SID_LEN = int(os.environ.get("NOLOOK_SID_LEN", "18"))
-JST = timezone(timedelta(hours=9))
 
 def _ensure_student_id(request: Request, response: Response) -> str:
     sid = request.cookies.get(COOKIE_NAME)
@@ -59,13 +93,6 @@ def _ensure_student_id(request: Request, response: Response) -> str:
         )
     return sid
 
-def _today_range_jst(dt: datetime) -> Tuple[datetime, datetime]:
-    """JSTに変換した上で、その日の 00:00:00 ～ 23:59:59.999999 (JST) を返す（tz-aware）。"""
-    local = dt.astimezone(JST)
-    start = datetime(local.year, local.month, local.day, tzinfo=JST)
-    end = start + timedelta(days=1) - timedelta(microseconds=1)
-    return start, end
-
 def _require_or_default_class_id(v: Optional[str]) -> str:
     strict = os.getenv("NOLOOK_CLASS_ID_STRICT", "0") == "1"
     default_cid = os.getenv("NOLOOK_CLASS_ID_DEFAULT", "default")
@@ -95,6 +122,191 @@ def _strip_keys(d: Dict[str, float]) -> Dict[str, float]:
             continue
     return clean
 
+def _row_signals(row: EmotionLog) -> Dict[str, Any]:
+    return {
+        "topic_tags": list(row.topic_tags or []),
+        "relationship_mention": bool(row.relationship_mention),
+        "negation_index": int(row.negation_index or 0),
+        "avoidance": int(row.avoidance or 0),
+    }
+
+def _set_signals(row: EmotionLog, sig: Dict[str, Any]) -> None:
+    row.topic_tags = list(sig["topic_tags"])
+    row.relationship_mention = bool(sig["relationship_mention"])
+    row.negation_index = int(sig["negation_index"])
+    row.avoidance = int(sig["avoidance"])
+
+# ====== DB 処理（同期 Session 上で動く。run_db で AsyncSession.run_sync かスレッドプールから呼ぶ） ======
+def _insert_today(db: Session, values: Dict[str, Any]) -> Optional[int]:
+    """
+    今日の行が無ければ INSERT して id を返す（1文）。既にあれば何もせず None。
+    INSERT ... ON CONFLICT (class_id, student_id, daily_date) DO NOTHING RETURNING id。
+    衝突しても INSERT 文が書き込みロック（SQLite）を取るので、続く読み書きは他の書き込みと直列になる。
+    """
+    table = EmotionLog.__table__
+    dialect = db.get_bind().dialect.name
+    if dialect in ("sqlite", "postgresql"):
+        ins = sqlite_insert(table) if dialect == "sqlite" else pg_insert(table)
+        stmt = (ins.values(**values)
+                .on_conflict_do_nothing(index_elements=["class_id", "student_id", "daily_date"])
+                .returning(table.c.id))
+        return db.execute(stmt).scalar()
+    try:  # その他の DB：一意制約違反で判定
+        with db.begin_nested():
+            return db.execute(insert(table).values(**values).returning(table.c.id)).scalar()
+    except IntegrityError:
+        return None
+
+
+def _remember(row_id: int, class_id: str, sid: str, now: datetime, emotion: str,
+              blended: Dict[str, float], sig: Dict[str, Any]) -> None:
+    """commit した今日の行の状態を覚える（次のメッセージは読み直さずに UPDATE する）。"""
+    today_cache.put(class_id, sid, local_parts(now)[0], TodayState(
+        row_id=row_id,
+        created_at=now,
+        emotion=emotion,
+        score=float(blended[emotion]),
+        vector=tuple(label_values(blended).values()),
+        topic_tags=tuple(sig["topic_tags"]),
+        relationship_mention=bool(sig["relationship_mention"]),
+        negation_index=int(sig["negation_index"]),
+        avoidance=int(sig["avoidance"]),
+    ))
+
+
+def _update_cached(
+    db: Session,
+    class_id: str,
+    sid: str,
+    state: TodayState,
+    inferred_vec: Dict[str, float],
+    signals: Dict[str, Any],
+    now: datetime,
+) -> Optional[Tuple[int, datetime, Dict[str, float], str]]:
+    """
+    覚えている今日の状態からブレンドし、主キー指定の UPDATE 1文で書く（行は読まない）。
+    行が覚えている値のままのときだけ当たる。0行なら（他が先に書いた）None を返し、呼び出し側が DB から読み直す。
+    """
+    blended = _strip_keys(blend_labels_ema_with_latest_bonus(labels_from_values(state.vector), inferred_vec))
+    save_emotion = (max(blended, key=blended.get)).strip()
+    sig = merge_signals(state.signals(), signals)  # 1日分を積み上げ
+    local_date, local_week, local_hour = local_parts(now)
+    res = db.execute(
+        update(EmotionLog)
+        .where(
+            EmotionLog.id == state.row_id,
+            EmotionLog.created_at == state.created_at,
+            EmotionLog.emotion == state.emotion,
+            EmotionLog.score == state.score,
+            *(c == v for c, v in zip(label_columns(), state.vector)),
+        )
+        .values(
+            emotion=save_emotion,
+            score=float(blended[save_emotion]),
+            **label_values(blended),
+            topic_tags=list(sig["topic_tags"]),
+            relationship_mention=bool(sig["relationship_mention"]),
+            negation_index=int(sig["negation_index"]),
+            avoidance=int(sig["avoidance"]),
+            created_at=now,
+            local_date=local_date,
+            local_week=local_week,
+            local_hour=local_hour,
+        )
+    )
+    if res.rowcount != 1:
+        db.rollback()
+        return None
+    rollup_service.apply_changes(db, [(
+        rollup_service.Entry(class_id, sid, state.created_at, state.emotion, state.vector),
+        rollup_service.Entry(class_id, sid, now, save_emotion, blended),
+    )])
+    db.commit()
+    _remember(state.row_id, class_id, sid, now, save_emotion, blended, sig)
+    return state.row_id, now, blended, save_emotion
+
+
+def _save_today(
+    db: Session,
+    class_id: str,
+    sid: str,
+    inferred_vec: Dict[str, float],
+    signals: Dict[str, Any],
+) -> Tuple[int, datetime, Dict[str, float], str]:
+    """
+    今日の行を EMA ブレンドで UPDATE（無ければ INSERT）し、(id, created_at, blended, emotion) を返す。
+    1日1レコードは一意キー (class_id, student_id, daily_date) で守る：
+    ⓪ 今日の状態を覚えていれば（app/services/today_cache.py）、読まずに UPDATE 1文で終わる
+    ① その日の最初の1件は INSERT ... ON CONFLICT DO NOTHING の1文で終わる
+    ② 衝突したら（=今日の行がある）行をロックして読み、ブレンドして UPDATE
+       （PostgreSQL は FOR UPDATE、SQLite は①の INSERT で書き込みロックを持っている）
+    同じ生徒の同時リクエストでも行は増えず、更新も取りこぼさない。
+    """
+    now = datetime.now(timezone.utc)
+    local_date, local_week, local_hour = local_parts(now)
+
+    # ⓪ 覚えている状態で更新（食い違えば捨てて①②へ）
+    state = today_cache.get(class_id, sid, local_date)
+    if state is not None:
+        saved = _update_cached(db, class_id, sid, state, inferred_vec, signals, now)
+        if saved is not None:
+            return saved
+        today_cache.discard(class_id, sid, stale=True)
+
+    # ① 今日の最初の1件（前回なしでブレンド）
+    blended = _strip_keys(blend_labels_ema_with_latest_bonus(None, inferred_vec))
+    save_emotion = (max(blended, key=blended.get)).strip()
+    rec_id = _insert_today(db, {
+        "class_id": class_id,
+        "student_id": sid,
+        "emotion": save_emotion,
+        "score": float(blended[save_emotion]),
+        **label_values(blended),
+        "topic_tags": list(signals["topic_tags"]),
+        "relationship_mention": bool(signals["relationship_mention"]),
+        "negation_index": int(signals["negation_index"]),
+        "avoidance": int(signals["avoidance"]),
+        "created_at": now,
+        "local_date": local_date,
+        "local_week": local_week,
+        "local_hour": local_hour,
+        "daily_date": local_date,
+    })
+    if rec_id is not None:
+        # 日次集計（emotion_daily_rollup）も同じトランザクションで動かす
+        rollup_service.apply_changes(db, [(None, rollup_service.Entry(class_id, sid, now, save_emotion, blended))])
+        db.commit()
+        _remember(rec_id, class_id, sid, now, save_emotion, blended, signals)
+        return rec_id, now, blended, save_emotion
+
+    # ② 既存の今日のレコードを上書き（集計は前の感情から今の感情へ件数を移す）
+    row = (
+        db.query(EmotionLog)
+        .filter(EmotionLog.class_id == class_id)
+        .filter(EmotionLog.student_id == sid)
+        .filter(EmotionLog.daily_date == local_date)
+        .with_for_update()
+        .one()
+    )
+    prev = row.labels  # 6列から組み立て（キーは正規化済み）
+
+    # 保存用はEMA+最新ボーナスでブレンド、返却は selected 優先
+    blended = _strip_keys(blend_labels_ema_with_latest_bonus(prev, inferred_vec))
+    save_emotion = (max(blended, key=blended.get)).strip()
+
+    before = rollup_service.entry(row)
+    sig = merge_signals(_row_signals(row), signals)  # 1日分を積み上げ
+    row.emotion = save_emotion
+    row.score = float(blended[save_emotion])
+    row.labels = blended
+    _set_signals(row, sig)
+    row.created_at = now  # 最終更新時刻を記録
+    rollup_service.apply_changes(db, [(before, rollup_service.entry(row))])
+    rec_id = row.id
+    db.commit()
+    _remember(rec_id, class_id, sid, now, save_emotion, blended, sig)
+    return rec_id, now, blended, save_emotion
+
 # ====== Route ======
 # 📌 処理フロー：
 # ① 生徒がメッセージを送信
@@ -102,11 +314,11 @@ def _strip_keys(d: Dict[str, float]) -> Dict[str, float]:
 # ③ /analyze で感情分析 → 1日1レコード（UPDATE or INSERT）
 # つまり：AI返信は毎回、感情判定は最後のメッセージだけ（または定期的に）
 @router.post("", response_model=AnalyzeOutput)
-def analyze_route(
+async def analyze_route(
     payload: AnalyzeInput,
     request: Request,
     response: Response,
-    db: Session = Depends(get_db),
+    db: Optional[AsyncSession] = Depends(get_async_db),
 ):
     # 1) 入力取得
     print(f"🔍 [analyze] payload received: {payload.dict()}")  # ★ デバッグログ追加
@@ -119,70 +331,19 @@ def analyze_route(
     sid = _ensure_student_id(request, response)
 
     # 2) ラベル決定（selected 優先、無ければ自動）
+    #    補助指標（トピック・否定/回避の回数など）は selected があってもテキストから同じ走査で取る
     selected_vec = _selected_one_hot(payload.selected_emotion)
-    inferred_vec = analyze_text_to_labels(raw_text) if selected_vec is None else selected_vec
+    auto_vec, signals = await analyze_text_async(raw_text)
+    inferred_vec = auto_vec if selected_vec is None else selected_vec
 
     # ※ ラベルキーに空白が混じると集計でズレるので早めに正規化
     inferred_vec = _strip_keys(inferred_vec)
     if selected_vec is not None:
         selected_vec = _strip_keys(selected_vec)
 
-    # 3) 同一生徒・同一JST日内の既存レコード確認
-    #    ★ 重要：1日1レコード方式
-    #    同じ日に分析されたら UPDATE、新しい日なら INSERT
-    #    DBは tz-aware UTC 保存（DateTime(timezone=True)）が前提
-    now = datetime.now(timezone.utc)
-    start_jst, end_jst = _today_range_jst(now)
-    start_utc = start_jst.astimezone(timezone.utc)  # tz-aware UTC
-    end_utc = end_jst.astimezone(timezone.utc)      # tz-aware UTC
-
-    row = (
-        db.query(EmotionLog)
-        .filter(EmotionLog.class_id == class_id)
-        .filter(EmotionLog.student_id == sid)
-        .filter(EmotionLog.created_at >= start_utc)
-        .filter(EmotionLog.created_at <= end_utc)
-        .order_by(EmotionLog.created_at.desc())
-        .first()
-    )
-    prev = row.labels if row and row.labels else {k: 0.0 for k in EMOTION_KEYS}
-    prev = _strip_keys(prev)
-
-    # 4) 保存用はEMA+最新ボーナスでブレンド、返却は selected 優先
-    blended = blend_labels_ema_with_latest_bonus(prev, inferred_vec)
-    blended = _strip_keys(blended)
-    save_emotion = (max(blended, key=blended.get)).strip()
-    save_score = float(blended[save_emotion])
-
-    if row:
-        # ★ UPDATE: 既存の今日のレコードを上書き
-        row.emotion = save_emotion
-        row.score = save_score
-        row.labels = blended
-        row.created_at = datetime.now(timezone.utc)  # 最終更新時刻を記録
-        db.add(row)
-        db.commit()
-        db.refresh(row)
-        rec_id = row.id
-        created = row.created_at
-    else:
-        # ★ INSERT: 今日の新規レコードを作成
-        new_row = EmotionLog(
-            class_id=class_id,
-            student_id=sid,
-            emotion=save_emotion,
-            score=save_score,
-            labels=blended,
-            topic_tags=[],
-            relationship_mention=False,
-            negation_index=0,
-            avoidance=0,
-        )
-        db.add(new_row)
-        db.commit()
-        db.refresh(new_row)
-        rec_id = new_row.id
-        created = new_row.created_at
+    # 3) 同一生徒・同一日（学校ローカル日）の行を UPDATE / INSERT（DB 処理は同期関数にまとめて run_db で流す）
+    #    ★ 重要：1日1レコード方式（同じ日に分析されたら UPDATE、新しい日なら INSERT）
+    rec_id, created, blended, save_emotion = await run_db(db, _save_today, class_id, sid, inferred_vec, signals)
 
     labels_for_return = selected_vec if selected_vec is not None else blended
     labels_for_return = _strip_keys(labels_for_return)
@@ -196,7 +357,6 @@ def analyze_route(
         pass
 
     created_str = created.isoformat() if hasattr(created, "isoformat") else str(created)
-    signals = {"relationship_mention": False, "negation_index": 0, "avoidance": 0, "topic_tags": []}
 
     return AnalyzeOutput(
         id=rec_id,
@@ -209,3 +369,177 @@ def analyze_route(
         signals=signals,
         features=dict(signals),
     )
+
+
+# ====== Batch Route ======
+# オフライン端末の溜め込み分などをまとめて解析する。
+# - 推定は (n, 6) 行列で一括、EMA は生徒ごとの時系列を行列演算で畳み込む
+# - 既存の「今日の行」は1回の SELECT でまとめて取得
+# - 書き込みは1トランザクション（1日1レコード方式・日次集計の更新は /analyze と同じ）
+MAX_BATCH_ITEMS = int(os.environ.get("NOLOOK_BATCH_MAX_ITEMS", "5000"))
+
+DayKey = Tuple[str, str, str]  # (class_id, student_id, 学校ローカル日)
+
+def _as_utc(dt: datetime) -> datetime:
+    # SQLite からは tz なしで返る（保存は UTC）
+    return dt.replace(tzinfo=timezone.utc) if dt.tzinfo is None else dt
+
+def _upsert_days(
+    db: Session,
+    group_keys: List[DayKey],
+    groups: List[List[int]],
+    latest: np.ndarray,
+    item_signals: List[Dict[str, Any]],
+    stamps: List[datetime],
+) -> Tuple[Dict[DayKey, EmotionLog], np.ndarray]:
+    """
+    (生徒, 日) ごとの1日1レコードへまとめて UPDATE / INSERT（/analyze/batch と /ingest の 4)〜6)）。
+    stamps[g] はそのグループの最後の時刻で、既存行より新しければ created_at を進める。
+    (グループごとの保存行, 各アイテムまで反映したブレンド行列) を返す。commit まで行う。
+    """
+    # 4) 対象日の既存行を1回で取得（一意キー class_id, student_id, daily_date）
+    existing = (
+        db.query(EmotionLog)
+        .filter(EmotionLog.class_id.in_({k[0] for k in group_keys}))
+        .filter(EmotionLog.student_id.in_({k[1] for k in group_keys}))
+        .filter(EmotionLog.daily_date.in_({k[2] for k in group_keys}))
+        .with_for_update()
+        .all()
+    )
+    day_rows: Dict[DayKey, EmotionLog] = {(r.class_id, r.student_id, r.daily_date): r for r in existing}
+
+    prev = np.zeros((len(groups), len(EMOTION_KEYS)), dtype=np.float64)
+    for g, key in enumerate(group_keys):
+        row = day_rows.get(key)
+        if row is not None:
+            prev[g] = row.label_vector()
+
+    # 5) 生徒ごとの EMA（各行は「そのアイテムまで反映した結果」）
+    blended = blend_sequences_ema(prev, latest, groups)
+
+    # 6) 1トランザクションで UPDATE / INSERT
+    saved: Dict[DayKey, EmotionLog] = {}
+    changes = []
+    remember = []
+    for g, key in enumerate(group_keys):
+        final = blended[groups[g][-1]]
+        k = int(np.argmax(final))
+        emo = EMOTION_KEYS[k]
+        row = day_rows.get(key)
+        before = rollup_service.entry(row) if row is not None else None
+        sig = _row_signals(row) if row is not None else None
+        for i in groups[g]:
+            sig = merge_signals(sig, item_signals[i])
+        stamp = stamps[g]
+        if row is None:
+            row = EmotionLog(class_id=key[0], student_id=key[1], daily_date=key[2])
+        elif row.created_at is not None:
+            stamp = max(stamp, _as_utc(row.created_at))  # 遅れて届いた古い投稿で最終更新時刻を戻さない
+        _set_signals(row, sig)
+        row.emotion = emo
+        row.score = float(final[k])
+        row.set_label_vector(final)
+        row.created_at = stamp
+        db.add(row)
+        saved[key] = row
+        changes.append((before, rollup_service.entry(row)))
+        remember.append((key, stamp, emo, final, sig))
+    rollup_service.apply_changes(db, changes)
+    db.commit()
+    # 続く /analyze が読み直さずに済むよう、今日の状態キャッシュにも書く（今日以外の日は入らない）
+    for key, stamp, emo, final, sig in remember:
+        _remember(saved[key].id, key[0], key[1], stamp, emo, row_to_labels(final), sig)
+    return saved, blended
+
+
+def _upsert_batch(
+    db: Session,
+    group_keys: List[Tuple[str, str]],
+    groups: List[List[int]],
+    latest: np.ndarray,
+    item_signals: List[Dict[str, Any]],
+    now: datetime,
+) -> Tuple[Dict[Tuple[str, str], EmotionLog], np.ndarray]:
+    """バッチの 4)〜6)。全件を今日の行へ。(生徒ごとの保存行, 各アイテムまで反映したブレンド行列) を返す。"""
+    today = local_parts(now)[0]
+    saved, blended = _upsert_days(db, [(c, s, today) for c, s in group_keys], groups, latest,
+                                  item_signals, [now] * len(group_keys))
+    return {k[:2]: row for k, row in saved.items()}, blended
+
+
+@router.post("/batch", response_model=AnalyzeBatchOutput)
+def analyze_batch_route(payload: AnalyzeBatchInput, db: Session = Depends(get_db)):
+    items = payload.items
+    if not items:
+        raise HTTPException(status_code=400, detail="items は1件以上必要です。")
+    if len(items) > MAX_BATCH_ITEMS:
+        raise HTTPException(status_code=413, detail=f"items は最大 {MAX_BATCH_ITEMS} 件までです。")
+
+    # 1) 入力検証（1件でも不正ならバッチ全体を弾く）
+    texts: List[str] = []
+    selected: List[Optional[str]] = []
+    keys: List[Tuple[str, str]] = []
+    for i, it in enumerate(items):
+        text = (it.text or "").strip()
+        if not text:
+            raise HTTPException(status_code=400, detail=f"items[{i}]: text は必須です。")
+        sid = (it.student_id or "").strip()
+        if not sid:
+            raise HTTPException(status_code=422, detail=f"items[{i}]: student_id は必須です。")
+        norm = None
+        if it.selected_emotion is not None:
+            norm = normalize_emotion(it.selected_emotion)
+            if norm is None:
+                raise HTTPException(status_code=422, detail=f"items[{i}]: selected_emotion を正規化できません。")
+        texts.append(text)
+        selected.append(norm)
+        keys.append((_require_or_default_class_id(it.class_id), sid))
+
+    # 2) 一括推定（selected は one-hot 行）。補助指標も同じ走査で取る
+    item_signals: List[Dict[str, Any]] = []
+    latest = analyze_texts_to_matrix(texts, selected, signals_out=item_signals)
+
+    # 3) 生徒（class_id, student_id）ごとに到着順でグループ化
+    group_of: Dict[Tuple[str, str], int] = {}
+    groups: List[List[int]] = []
+    for i, key in enumerate(keys):
+        g = group_of.setdefault(key, len(groups))
+        if g == len(groups):
+            groups.append([])
+        groups[g].append(i)
+    group_keys = list(group_of.keys())
+
+    # 4)〜6) 今日の行をまとめて UPDATE / INSERT。同じ生徒の /analyze と競合して一意キーに
+    #        当たったら（相手の行ができている）読み直してもう1回
+    now = datetime.now(timezone.utc)
+    for attempt in range(2):
+        try:
+            saved, blended = _upsert_batch(db, group_keys, groups, latest, item_signals, now)
+            break
+        except IntegrityError:
+            db.rollback()
+            if attempt:
+                raise
+
+    # 7) 返却は /analyze と同じく selected 優先、それ以外はブレンド後
+    results: List[AnalyzeBatchResult] = []
+    for i, key in enumerate(keys):
+        labels = row_to_labels(latest[i] if selected[i] is not None else blended[i])
+        emo = max(labels, key=labels.get)
+        results.append(AnalyzeBatchResult(
+            index=i,
+            id=saved[key].id,
+            class_id=key[0],
+            student_id=key[1],
+            labels=labels,
+            emotion=emo,
+            score=float(labels[emo]),
+        ))
+
+    for row in saved.values():
+        try:
+            EMOTION_TOTAL.labels(emotion=row.emotion).inc()
+        except Exception:
+            pass
+
+    return AnalyzeBatchOutput(count=len(results), created_at=now.isoformat(), results=results)
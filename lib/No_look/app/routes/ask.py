@@ -8,10 +8,10 @@ from fastapi import APIRouter, HTTPException, Request, Response, Depends
 from pydantic import BaseModel
 from sqlalchemy.orm import Session
 
-from app.core.db import get_db
-from app.models.orm import EmotionLog
-from app.services.analyze_service import analyze_text_to_labels, one_hot_from_selected
+from app.core.db import AsyncSession, get_async_db, run_db
+from app.services.analyze_service import analyze_text_async, one_hot_from_selected
 from app.services.normalizer import normalize_emotion
+from app.services import llm_client, log_queue, log_service
 
 logger = logging.getLogger(__name__)
 router = APIRouter(prefix="/ask", tags=["ask"])
@@ -70,29 +70,14 @@ def pick_rule_reply(emotion: str, style: Optional[str], followup: bool) -> str:
         base += FOLLOWUP_TAIL.get(s, FOLLOWUP_TAIL["buddy"])
     return base
 
-# ====== OpenAI（あれば上書き） ======
-try:
-    from openai import OpenAI
-except Exception:
-    OpenAI = None  # type: ignore
-
-def _get_openai():
-    if OpenAI is None:
-        return None
-    key = os.getenv("OPENAI_API_KEY") or ""
-    return OpenAI(api_key=key) if key else None
-
+# ====== OpenAI（あれば上書き。クライアント・タイムアウト・同時実行数・遮断は app/services/llm_client.py） ======
 def _get_model_name() -> str:
     name = (os.getenv("NOLOOK_LLM_MODEL") or "").strip()
     if not name or name.endswith("-"):
         return "gpt-4o-mini"
     return name
 
-def llm_reply(user_text: str, emotion: str, style: str, followup: bool) -> Tuple[Optional[str], Optional[str]]:
-    client = _get_openai()
-    if not client:
-        return None, "no_client"
-
+async def llm_reply(user_text: str, emotion: str, style: str, followup: bool) -> Tuple[Optional[str], Optional[str]]:
     style_guides = {
         "buddy": "フレンドリーで寄り添う口調。やさしく短く。絵文字は使わない。",
         "teacher": "落ち着いた丁寧語。学習支援の観点で簡潔に助言。一文は短く。",
@@ -111,19 +96,16 @@ def llm_reply(user_text: str, emotion: str, style: str, followup: bool) -> Tuple
         f"# 方針: {style_guides.get(style, style_guides['buddy'])}\n"
         f"# フォローアップ: {'あり' if followup else 'なし'}（末尾: {tail if followup else 'なし'}）\n"
     )
-    try:
-        resp = client.chat.completions.create(
-            model=_get_model_name(),
-            messages=[{"role": "system", "content": sys}, {"role": "user", "content": user}],
-            temperature=0.3,
-            max_tokens=120,
-        )
-        out = (resp.choices[0].message.content or "").strip()
-        if not out:
-            return None, "empty_output"
-        return out[: int(os.getenv("NOLOOK_REPLY_MAX_CHARS", "160"))], None
-    except Exception as e:
-        return None, f"{type(e).__name__}: {e}"
+    # 上限時間切れ・上流エラー・遮断中は (None, 理由)。呼び出し側はルール返信のまま返す
+    out, reason = await llm_client.complete(
+        [{"role": "system", "content": sys}, {"role": "user", "content": user}],
+        model=_get_model_name(),
+        temperature=0.3,
+        max_tokens=120,
+    )
+    if not out:
+        return None, reason
+    return out[: int(os.getenv("NOLOOK_REPLY_MAX_CHARS", "160"))], None
 
 # ====== I/O ======
 class AskIn(BaseModel):
@@ -142,8 +124,17 @@ class AskOut(BaseModel):
     style: Optional[str] = "buddy"
     followup: bool = False
 
+def _save_log(db: Session, values: Dict[str, Any]) -> None:
+    """emotion_logs に1件 INSERT（失敗してもユーザー応答は返すのでログだけ残す）。"""
+    try:
+        log_service.insert_rows(db, [values])  # 日次集計も同じトランザクションで
+    except Exception as e:
+        db.rollback()
+        logger.exception("failed to insert emotion_log from /ask: %s", e)
+
 @router.post("", response_model=AskOut)
-def ask_route(payload: AskIn, request: Request, response: Response, db: Session = Depends(get_db)):
+async def ask_route(payload: AskIn, request: Request, response: Response,
+                    db: Optional[AsyncSession] = Depends(get_async_db)):
     manual_only = os.getenv("NOLOOK_MANUAL_ONLY", "0") == "1"
     if not payload.prompt or not payload.prompt.strip():
         raise HTTPException(status_code=400, detail="'prompt' is required.")
@@ -160,16 +151,18 @@ def ask_route(payload: AskIn, request: Request, response: Response, db: Session
         sel = None
 
     # --- ラベル決定 ---
+    # 補助指標（topic_tags / 否定・回避の回数など）は selected の有無に関係なく同じ走査で取る
     if sel is not None:
         norm = normalize_emotion(sel)
         if norm is None:
             if manual_only:
                 raise HTTPException(status_code=422, detail="selected_emotion を正規化できません。")
-            vec = analyze_text_to_labels(payload.prompt.strip())
+            vec, signals = await analyze_text_async(payload.prompt.strip())
         else:
+            _, signals = await analyze_text_async(payload.prompt.strip())
             vec = one_hot_from_selected(norm)
     else:
-        vec = analyze_text_to_labels(payload.prompt.strip())
+        vec, signals = await analyze_text_async(payload.prompt.strip())
 
     emo = max(vec, key=vec.get)
     score = float(vec[emo])
@@ -177,8 +170,8 @@ def ask_route(payload: AskIn, request: Request, response: Response, db: Session
     # --- まずはルール返信 ---
     reply_text = pick_rule_reply(emo, payload.style, bool(payload.followup))
 
-    # --- LLM 試行 ---
-    llm_text, reason = llm_reply(payload.prompt.strip(), emo, payload.style or "buddy", bool(payload.followup))
+    # --- LLM 試行（NOLOOK_LLM_TIMEOUT_MS で打ち切り。スレッドは使わない） ---
+    llm_text, reason = await llm_reply(payload.prompt.strip(), emo, payload.style or "buddy", bool(payload.followup))
     try:
         w = float(os.getenv("NOLOOK_LLM_WEIGHT", "1.0"))
         w = 0.0 if w < 0 else 1.0 if w > 1 else w
@@ -200,23 +193,14 @@ def ask_route(payload: AskIn, request: Request, response: Response, db: Session
         )
 
     # --- ★ DB保存（/analyze と同じ emotion_logs を使用） ---
-    try:
-        row = EmotionLog(
-            class_id=class_id,
-            student_id=sid,
-            emotion=emo,
-            score=score,
-            labels=vec,
-            topic_tags=[],
-            relationship_mention=False,
-            negation_index=0,
-            avoidance=0,
-        )
-        db.add(row)
-        db.commit()
-    except Exception as e:
-        # 失敗してもユーザー応答は返す（ログだけ残す）
-        logger.exception("failed to insert emotion_log from /ask: %s", e)
+    # 書き込み待ちキューに積んで返す（まとめて commit されるので返信は fsync を待たない）。
+    # キュー無効・満杯で積めなかったときはこの場で書く
+    values = log_service.emotion_row_values(
+        class_id=class_id, student_id=sid, emotion=emo, score=score,
+        labels=vec, signals=signals, topic_tags=signals["topic_tags"],
+    )
+    if not (log_queue.enabled() and await log_queue.submit(values)):
+        await run_db(db, _save_log, values)
 
     return AskOut(
         reply=reply_text,
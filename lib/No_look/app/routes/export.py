@@ -5,7 +5,7 @@ from typing import Dict, Any, Optional, List
 from fastapi import APIRouter, Query, Response
 from sqlalchemy import select, desc, and_
 from app.core.db import session_scope, init_db
-from app.models.orm import EmotionLog
+from app.models.orm import EmotionLog, label_columns, labels_from_values
 
 import io
 import json
@@ -18,8 +18,8 @@ router = APIRouter(prefix="/export", tags=["export"])
 _initialized = False
 
 def _row_to_dict(
-    created_at, id, class_id, student_id, emotion, score, labels,
-    topic_tags, relationship_mention, negation_index, avoidance
+    created_at, id, class_id, student_id, emotion, score,
+    topic_tags, relationship_mention, negation_index, avoidance, *probs
 ) -> Dict[str, Any]:
     created = created_at
     if isinstance(created, datetime) and created.tzinfo is None:
@@ -31,7 +31,7 @@ def _row_to_dict(
         "student_id": student_id,
         "emotion": emotion,
         "score": score,
-        "labels": labels,
+        "labels": labels_from_values(probs),
         "topic_tags": topic_tags,
         "relationship_mention": relationship_mention,
         "negation_index": negation_index,
@@ -58,8 +58,9 @@ def export_logs(
         stmt = (
             select(
                 EmotionLog.created_at, EmotionLog.id, EmotionLog.class_id, EmotionLog.student_id,
-                EmotionLog.emotion, EmotionLog.score, EmotionLog.labels, EmotionLog.topic_tags,
-                EmotionLog.relationship_mention, EmotionLog.negation_index, EmotionLog.avoidance
+                EmotionLog.emotion, EmotionLog.score, EmotionLog.topic_tags,
+                EmotionLog.relationship_mention, EmotionLog.negation_index, EmotionLog.avoidance,
+                *label_columns(),
             )
             .where(and_(*where) if where else True)
             .order_by(desc(EmotionLog.created_at))
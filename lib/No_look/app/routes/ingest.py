@@ -0,0 +1,256 @@
+# app/routes/ingest.py
+"""
+オフライン端末の溜め込み分を NDJSON のストリームでまとめて受ける /ingest。
+
+電波の弱い教室のタブレットは投稿を端末に溜め、つながったときに /analyze を1件ずつ呼び直していた。
+/ingest は1行1イベントの NDJSON（chunked でよい）を読みながら NOLOOK_INGEST_BATCH 行ずつ
+まとめて推定・保存し、行ごとの結果を NDJSON で順に返す。
+
+    {"class_id": "1-A", "student_id": "s1", "text": "部活で疲れた", "created_at": "2026-10-16T15:20:00+09:00"}
+
+- 1日1レコードの日付は受信時刻ではなくイベントの created_at（学校ローカル日）で決める。
+  created_at が無ければ受信時刻、tz なしは UTC として扱う。NOLOOK_INGEST_MAX_SKEW_S 秒より先の未来は弾く
+- 同じ生徒・同じ日のイベントは created_at 順に EMA でブレンドする（/analyze/batch と同じ保存処理）
+- 1バッチ = 1トランザクション。不正な行はその行だけエラーを返し、残りは続ける
+- メモリは「1バッチ分の行」だけ（1行は NOLOOK_INGEST_MAX_LINE_BYTES まで。超えた行は読み飛ばしてエラー）
+- 返却の各行は {"line": 行番号, "ok": true, "id", "class_id", "student_id", "local_date", "emotion", "score", "labels"}
+  か {"line": 行番号, "ok": false, "error": ...}。最後に {"summary": {"lines", "ok", "errors"}}。
+  ?results=errors ならエラー行と summary だけ返す（応答を読まずに送り切るクライアント向け）
+"""
+from __future__ import annotations
+import json
+import logging
+import os
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple, Union
+
+from fastapi import APIRouter, HTTPException, Query, Request
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel, ValidationError
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from starlette.requests import ClientDisconnect
+
+from app.core.db import run_db
+from app.core.localtime import local_parts
+from app.models.orm import labels_from_values
+from app.routes.analyze import DayKey, _require_or_default_class_id, _upsert_days
+from app.services.analyze_service import analyze_texts_to_matrix
+from app.services.normalizer import normalize_emotion
+
+try:
+    from app.metrics import EMOTION_TOTAL, INGEST_LINES
+except Exception:  # メトリクスは任意
+    EMOTION_TOTAL = INGEST_LINES = None
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter(prefix="/ingest", tags=["ingest"])
+
+DEFAULT_BATCH = 500
+DEFAULT_MAX_LINE_BYTES = 64 * 1024
+DEFAULT_MAX_SKEW_S = 300
+
+
+def _env_int(name: str, default: int) -> int:
+    try:
+        return int(os.getenv(name, str(default)))
+    except ValueError:
+        return default
+
+
+class IngestEvent(BaseModel):
+    class_id: Optional[str] = None
+    student_id: str
+    text: Optional[str] = None
+    prompt: Optional[str] = None
+    selected_emotion: Optional[str] = None
+    created_at: Optional[datetime] = None  # 端末で投稿した時刻
+
+
+@dataclass
+class _Event:
+    line: int
+    key: DayKey
+    text: str
+    selected: Optional[str]
+    created_at: datetime
+
+
+def _error(line: int, msg: str) -> Dict[str, Any]:
+    return {"line": line, "ok": False, "error": msg}
+
+
+async def _lines(chunks: AsyncIterator[bytes], max_line: int) -> AsyncIterator[Tuple[int, Optional[bytes]]]:
+    """
+    受信チャンクを行に切って (行番号, 行) を流す。max_line バイトを超えた行は中身を溜めずに (行番号, None)。
+    改行がチャンクの途中で切れていてもよい。
+    """
+    buf = bytearray()
+    too_long = False
+    n = 0
+    async for chunk in chunks:
+        start = 0
+        while True:
+            i = chunk.find(b"\n", start)
+            part = chunk[start:] if i < 0 else chunk[start:i]
+            if not too_long:
+                buf += part
+                if len(buf) > max_line:
+                    too_long = True
+                    buf.clear()
+            if i < 0:
+                break
+            n += 1
+            yield n, (None if too_long else bytes(buf))
+            buf.clear()
+            too_long = False
+            start = i + 1
+    if buf or too_long:
+        yield n + 1, (None if too_long else bytes(buf))
+
+
+def _parse(line: int, raw: bytes, now: datetime, max_skew: timedelta) -> Union[_Event, Dict[str, Any]]:
+    try:
+        ev = IngestEvent.model_validate_json(raw)
+    except ValidationError as e:
+        return _error(line, f"イベントを読めません: {e.errors()[0].get('msg', '')}")
+    text = ((ev.prompt if ev.prompt is not None else ev.text) or "").strip()
+    if not text:
+        return _error(line, "prompt/text は必須です。")
+    sid = (ev.student_id or "").strip()
+    if not sid:
+        return _error(line, "student_id は必須です。")
+    try:
+        class_id = _require_or_default_class_id(ev.class_id)
+    except HTTPException as e:
+        return _error(line, str(e.detail))
+    selected = None
+    if ev.selected_emotion is not None:
+        selected = normalize_emotion(ev.selected_emotion)
+        if selected is None:
+            return _error(line, "selected_emotion を正規化できません。")
+    created = ev.created_at or now
+    if created.tzinfo is None:
+        created = created.replace(tzinfo=timezone.utc)
+    created = created.astimezone(timezone.utc)
+    if created > now + max_skew:
+        return _error(line, "created_at が未来の時刻です。")
+    return _Event(line, (class_id, sid, local_parts(created)[0]), text, selected, created)
+
+
+def _ingest_batch(db: Session, events: List[_Event]) -> List[Dict[str, Any]]:
+    """1バッチ分を一括推定し、(生徒, 日) ごとの1日1レコードへ保存して行ごとの結果を返す。"""
+    item_signals: List[Dict[str, Any]] = []
+    latest = analyze_texts_to_matrix([e.text for e in events], [e.selected for e in events],
+                                     signals_out=item_signals)
+
+    # (生徒, 日) ごとに created_at 順（同時刻は到着順）
+    group_of: Dict[DayKey, int] = {}
+    groups: List[List[int]] = []
+    for i, e in enumerate(events):
+        g = group_of.setdefault(e.key, len(groups))
+        if g == len(groups):
+            groups.append([])
+        groups[g].append(i)
+    for members in groups:
+        members.sort(key=lambda i: events[i].created_at)
+    group_keys = list(group_of)
+    stamps = [events[members[-1]].created_at for members in groups]
+
+    # 同じ生徒の /analyze と一意キーで当たったら（相手の行ができている）読み直してもう1回
+    for attempt in range(2):
+        try:
+            saved, blended = _upsert_days(db, group_keys, groups, latest, item_signals, stamps)
+            break
+        except IntegrityError:
+            db.rollback()
+            if attempt:
+                raise
+
+    out: List[Dict[str, Any]] = []
+    for i, e in enumerate(events):
+        # 返却は /analyze と同じく selected 優先、それ以外はそのイベントまで反映したブレンド
+        labels = labels_from_values((latest[i] if e.selected is not None else blended[i]).tolist())
+        emo = max(labels, key=labels.get)
+        out.append({
+            "line": e.line, "ok": True, "id": saved[e.key].id,
+            "class_id": e.key[0], "student_id": e.key[1], "local_date": e.key[2],
+            "emotion": emo, "score": labels[emo], "labels": labels,
+        })
+    if EMOTION_TOTAL is not None:
+        for row in saved.values():
+            EMOTION_TOTAL.labels(emotion=row.emotion).inc()
+    return out
+
+
+def _ndjson(rows: List[Dict[str, Any]]) -> bytes:
+    return b"".join(json.dumps(r, ensure_ascii=False).encode("utf-8") + b"\n" for r in rows)
+
+
+class _DuplexStreamingResponse(StreamingResponse):
+    """
+    リクエスト本文を読みながら応答を流す StreamingResponse。
+    既定の実装は切断監視のために receive を横取りするので、本文の読み取りと競合しないよう送るだけにする
+    （切断は本文側の ClientDisconnect で気付く）。
+    """
+
+    async def __call__(self, scope, receive, send) -> None:
+        await self.stream_response(send)
+        if self.background is not None:
+            await self.background()
+
+
+async def _stream(request: Request, errors_only: bool) -> AsyncIterator[bytes]:
+    batch_size = max(_env_int("NOLOOK_INGEST_BATCH", DEFAULT_BATCH), 1)
+    max_line = _env_int("NOLOOK_INGEST_MAX_LINE_BYTES", DEFAULT_MAX_LINE_BYTES)
+    max_skew = timedelta(seconds=_env_int("NOLOOK_INGEST_MAX_SKEW_S", DEFAULT_MAX_SKEW_S))
+    counts = {"lines": 0, "ok": 0, "errors": 0}
+    pending: List[_Event] = []
+
+    def tally(rows: List[Dict[str, Any]]) -> bytes:
+        ok = sum(1 for r in rows if r["ok"])
+        counts["ok"] += ok
+        counts["errors"] += len(rows) - ok
+        if INGEST_LINES is not None:
+            INGEST_LINES.labels(result="ok").inc(ok)
+            INGEST_LINES.labels(result="error").inc(len(rows) - ok)
+        return _ndjson([r for r in rows if not (errors_only and r["ok"])])
+
+    async def flush() -> bytes:
+        events = pending[:]
+        pending.clear()
+        try:
+            rows = await run_db(None, _ingest_batch, events)
+        except Exception:
+            logger.exception("ingest batch of %d events failed", len(events))
+            rows = [_error(e.line, "保存に失敗しました。") for e in events]
+        return tally(rows)
+
+    try:
+        async for n, raw in _lines(request.stream(), max_line):
+            counts["lines"] = n
+            if raw is None:
+                yield tally([_error(n, f"1行は {max_line} バイトまでです。")])
+                continue
+            if not raw.strip():
+                continue
+            ev = _parse(n, raw, datetime.now(timezone.utc), max_skew)
+            if isinstance(ev, dict):
+                yield tally([ev])
+                continue
+            pending.append(ev)
+            if len(pending) >= batch_size:
+                yield await flush()
+        if pending:
+            yield await flush()
+    except ClientDisconnect:
+        logger.info("ingest client disconnected after %d lines", counts["lines"])
+        return
+    yield _ndjson([{"summary": counts}])
+
+
+@router.post("", summary="オフライン端末の投稿を NDJSON ストリームで一括登録（行ごとの結果を NDJSON で返す）")
+async def ingest_route(request: Request, results: str = Query("all", pattern="^(all|errors)$")):
+    return _DuplexStreamingResponse(_stream(request, results == "errors"), media_type="application/x-ndjson")
@@ -10,6 +10,7 @@ from sqlalchemy import select, and_
 
 from app.core.db import session_scope, init_db
 from app.models.orm import EmotionLog
+from app.services import rollup_service
 from app.services.summary_service import generate_week_summary_view
 
 router = APIRouter(prefix="/summary", tags=["summary"])
@@ -62,32 +63,39 @@ def summary(
     today_local = datetime.now(tzinfo).date()
     start_date_local = today_local - timedelta(days=days - 1)
     start_local_aware = datetime.combine(start_date_local, dtime(0, 0), tzinfo=tzinfo)
-    start_utc_naive = start_local_aware.astimezone(timezone.utc).replace(tzinfo=None)
-
-    where = [EmotionLog.created_at >= start_utc_naive]
-    if class_id:
-        where.append(EmotionLog.class_id == class_id)
-
-    # データ取得
-    with session_scope() as s:
-        rows = s.execute(
-            select(EmotionLog.created_at, EmotionLog.emotion).where(and_(*where))
-        ).all()
-
-    def to_local_date_str(dtobj: datetime) -> str:
-        if dtobj.tzinfo is None:
-            dtobj = dtobj.replace(tzinfo=timezone.utc)
-        return dtobj.astimezone(tzinfo).date().isoformat()
+    # weekly / teacher_dashboard と同じく tz-aware の UTC で比べる（naive だと DB によってずれる）
+    start_utc = start_local_aware.astimezone(timezone.utc)
 
     # 日別カウント
     by_day: Dict[str, Dict[str, int]] = {
         (start_date_local + timedelta(days=i)).isoformat(): {k: 0 for k in EMOTION_KEYS}
         for i in range(days)
     }
-    for created_at, emo in rows:
-        d = to_local_date_str(created_at)
-        if d in by_day and emo in by_day[d]:
-            by_day[d][emo] += 1
+
+    # データ取得（日次集計・学校 tz の local_date で SQL 集計、どちらも無い tz だけ生ログを行ごとに）
+    with session_scope() as s:
+        rolled = rollup_service.read_daily(s, tz, start_date_local, today_local, class_id=class_id or None)
+        if rolled is not None:
+            for d, v in rolled.items():
+                if d in by_day:
+                    by_day[d].update(v["counts"])
+        else:
+            where = [EmotionLog.created_at >= start_utc]
+            if class_id:
+                where.append(EmotionLog.class_id == class_id)
+            rows = s.execute(
+                select(EmotionLog.created_at, EmotionLog.emotion).where(and_(*where))
+            ).all()
+
+            def to_local_date_str(dtobj: datetime) -> str:
+                if dtobj.tzinfo is None:
+                    dtobj = dtobj.replace(tzinfo=timezone.utc)
+                return dtobj.astimezone(tzinfo).date().isoformat()
+
+            for created_at, emo in rows:
+                d = to_local_date_str(created_at)
+                if d in by_day and emo in by_day[d]:
+                    by_day[d][emo] += 1
 
     totals = {k: 0 for k in EMOTION_KEYS}
     for counts in by_day.values():
@@ -2,34 +2,36 @@ from __future__ import annotations
 
 from collections import defaultdict
 from datetime import datetime, timedelta, timezone
-from typing import Dict
+from typing import Dict, Optional
 
 from fastapi import APIRouter, Depends, Query
 from sqlalchemy import and_
 from sqlalchemy.orm import Session
 from zoneinfo import ZoneInfo
 
-from app.core.db import get_db
+from app.core.db import AsyncSession, get_async_db, run_db
 from app.models.orm import EmotionLog
+from app.services import rollup_service
 from app.schemas.dashboard import DashboardResponse  # ★ 追加
 
 router = APIRouter(prefix="/teacher_dashboard", tags=["teacher"])
 
 @router.get("", response_model=DashboardResponse)  # ★ response_model 追加
-def teacher_dashboard(
+async def teacher_dashboard(
     class_id: str = Query(..., description="クラスID（例: 1-A）"),
     days: int = Query(7, ge=1, le=60, description="過去n日分（1〜60）"),
     tz: str = Query("Asia/Tokyo", description="タイムゾーン（IANA名）"),
-    db: Session = Depends(get_db),
+    db: Optional[AsyncSession] = Depends(get_async_db),
 ):
     """
-    UTC保存の EmotionLog をローカルタイムゾーン単位（日）で集計して返す。
-    - DB検索はUTC between
-    - 日毎のバケツはローカルTZに変換して date() キー化
+    EmotionLog をローカルタイムゾーン単位（日）で集計して返す。
+    - tz が日次集計（emotion_daily_rollup）にあれば「日数」行だけ読む
+    - 学校の tz（NOLOOK_SCHOOL_TZ）なら保存済みの local_date で SQL 集計
+    - どちらでもなければ従来どおり UTC between で生ログを読み、ローカルTZに変換して date() キー化
     返却:
       {
         class_id, range_days, start_date, end_date,
-        daily: [{date, counts{6感情}, ratios{6感情}, total}]
+        daily: [{date, counts{6感情}, ratios{6感情}, total, students}]
       }
     """
     # ---- TZ 解決（不正指定は JST にフォールバック） ----
@@ -42,6 +44,41 @@ def teacher_dashboard(
     end_local = datetime.now(Z).replace(hour=23, minute=59, second=59, microsecond=999_999)
     start_local = (end_local - timedelta(days=days - 1)).replace(hour=0, minute=0, second=0, microsecond=0)
 
+    EMOTIONS = ("楽しい", "悲しい", "怒り", "不安", "しんどい", "中立")
+
+    rolled = await run_db(db, _read_days, class_id, start_local, end_local, Z)
+
+    # ---- 欠け日も0で埋める・ratiosを計算 ----
+    daily = []
+    cur = start_local.date()
+    while cur <= end_local.date():
+        key = cur.isoformat()
+        day = rolled.get(key)
+        counts: Dict[str, int] = dict(day["counts"]) if day else {e: 0 for e in EMOTIONS}
+        total = day["total"] if day else 0
+        ratios = {k: (float(counts[k]) / float(total) if total else 0.0) for k in counts.keys()}  # ★ 小数統一
+        daily.append({"date": key, "counts": counts, "ratios": ratios, "total": total,
+                      "students": day["students"] if day else 0})
+        cur += timedelta(days=1)
+
+    return {
+        "class_id": class_id,
+        "range_days": days,
+        "start_date": start_local.date().isoformat(),
+        "end_date": end_local.date().isoformat(),
+        "daily": daily,
+    }
+
+
+def _read_days(db: Session, class_id: str, start_local: datetime, end_local: datetime, Z) -> Dict[str, dict]:
+    rolled = rollup_service.read_daily(db, Z.key, start_local.date(), end_local.date(), class_id=class_id)
+    if rolled is None:
+        rolled = _daily_from_logs(db, class_id, start_local, end_local, Z)
+    return rolled
+
+
+def _daily_from_logs(db: Session, class_id: str, start_local: datetime, end_local: datetime, Z) -> Dict[str, dict]:
+    """日次集計の無い tz 用：生ログを読んでローカル日ごとに数える（read_daily と同じ形で返す）。"""
     # ---- 検索はUTCで ----
     start_utc = start_local.astimezone(timezone.utc)
     end_utc = end_local.astimezone(timezone.utc)
@@ -62,36 +99,20 @@ def teacher_dashboard(
     # ---- 日毎バケツ（ローカル日に変換してキー化）----
     day_buckets: Dict[str, list[EmotionLog]] = defaultdict(list)
     for r in rows:
-        local_dt = r.created_at.astimezone(Z)  # tz-aware UTC -> ローカルTZへ
-        key = local_dt.date().isoformat()      # "YYYY-MM-DD"
+        dt = r.created_at if r.created_at.tzinfo else r.created_at.replace(tzinfo=timezone.utc)
+        key = dt.astimezone(Z).date().isoformat()  # tz-aware UTC -> ローカルTZへ "YYYY-MM-DD"
         day_buckets[key].append(r)
 
-    # ---- 欠け日も0で埋める・counts/ratiosを計算 ----
-    EMOTIONS = ("楽しい", "悲しい", "怒り", "不安", "しんどい", "中立")
-
-    daily = []
-    cur = start_local.date()
-    while cur <= end_local.date():
-        key = cur.isoformat()
-        bucket = day_buckets.get(key, [])
-        counts: Dict[str, int] = {e: 0 for e in EMOTIONS}
+    out: Dict[str, dict] = {}
+    for key, bucket in day_buckets.items():
+        counts: Dict[str, int] = {e: 0 for e in rollup_service.EMOTIONS}
         for r in bucket:
             e = (r.emotion or "").strip()
             if e in counts:
                 counts[e] += 1
-            else:
-                # 万一未知ラベルが来ても落ちないよう保険
-                counts.setdefault(e, 0)
-                counts[e] += 1
-        total = sum(counts.values())
-        ratios = {k: (float(counts[k]) / float(total) if total else 0.0) for k in counts.keys()}  # ★ 小数統一
-        daily.append({"date": key, "counts": counts, "ratios": ratios, "total": total})
-        cur += timedelta(days=1)
-
-    return {
-        "class_id": class_id,
-        "range_days": days,
-        "start_date": start_local.date().isoformat(),
-        "end_date": end_local.date().isoformat(),
-        "daily": daily,
-    }
+        out[key] = {
+            "counts": counts,
+            "total": len(bucket),
+            "students": len({r.student_id for r in bucket if r.student_id}),
+        }
+    return out
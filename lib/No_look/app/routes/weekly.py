@@ -10,8 +10,9 @@ from sqlalchemy.orm import Session
 from sqlalchemy import and_
 from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
 
-from app.core.db import get_db
+from app.core.db import AsyncSession, get_async_db, run_db
 from app.models.orm import EmotionLog
+from app.services import rollup_service
 from app.services.summary_service import generate_week_summary_view
 
 router = APIRouter(prefix="/weekly_report", tags=["weekly"])
@@ -42,39 +43,44 @@ def _daterange(start_date: datetime, end_date: datetime) -> List[str]:
     return out
 
 
-def _calc_weekly(db: Session, days: int, tz: str, class_id: Optional[str]) -> Dict[str, Any]:
-    Z = _safe_zoneinfo(tz or "Asia/Tokyo")
-    end_local = datetime.now(Z).replace(hour=23, minute=59, second=59, microsecond=999_999)
-    start_local = (end_local - timedelta(days=days - 1)).replace(hour=0, minute=0, second=0, microsecond=0)
-    start_utc = start_local.astimezone(timezone.utc)
-    end_utc = end_local.astimezone(timezone.utc)
-
-    q = db.query(EmotionLog).filter(
-        and_(EmotionLog.created_at >= start_utc, EmotionLog.created_at <= end_utc)
+def _day_counts_from_logs(db: Session, start_local: datetime, end_local: datetime, Z,
+                          class_id: Optional[str]) -> Dict[str, Dict[str, int]]:
+    """日次集計の無い tz 用：{ローカル日: {感情: 件数}}（6感情以外は数えない）。"""
+    q = db.query(EmotionLog.created_at, EmotionLog.emotion).filter(
+        and_(EmotionLog.created_at >= start_local.astimezone(timezone.utc),
+             EmotionLog.created_at <= end_local.astimezone(timezone.utc))
     )
     if class_id:
         q = q.filter(EmotionLog.class_id == class_id)
-    rows = q.all()
 
-    day_buckets: Dict[str, list[EmotionLog]] = defaultdict(list)
-    for r in rows:
-        dt = r.created_at or datetime.now(timezone.utc)
+    out: Dict[str, Dict[str, int]] = defaultdict(lambda: {e: 0 for e in EMOTIONS})
+    for created_at, emotion in q.all():
+        dt = created_at or datetime.now(timezone.utc)
         if dt.tzinfo is None:
             dt = dt.replace(tzinfo=timezone.utc)
-        local_dt = dt.astimezone(Z)
-        day_buckets[local_dt.date().isoformat()].append(r)
+        e = (emotion or "").strip()
+        if e in EMOTIONS:
+            out[dt.astimezone(Z).date().isoformat()][e] += 1
+    return out
+
+
+def _calc_weekly(db: Session, days: int, tz: str, class_id: Optional[str]) -> Dict[str, Any]:
+    Z = _safe_zoneinfo(tz or "Asia/Tokyo")
+    end_local = datetime.now(Z).replace(hour=23, minute=59, second=59, microsecond=999_999)
+    start_local = (end_local - timedelta(days=days - 1)).replace(hour=0, minute=0, second=0, microsecond=0)
+    # 日次集計（emotion_daily_rollup）→ 学校 tz なら local_date の SQL 集計 → どちらも無ければ生ログから数える
+    rolled = rollup_service.read_daily(db, getattr(Z, "key", ""), start_local.date(), end_local.date(),
+                                       class_id=class_id or None)
+    day_counts = ({d: v["counts"] for d, v in rolled.items()} if rolled is not None
+                  else _day_counts_from_logs(db, start_local, end_local, Z, class_id))
 
     days_keys = _daterange(start_local, end_local)
     daily_list: List[Dict[str, Any]] = []
     totals = {e: 0 for e in EMOTIONS}
 
     for key in days_keys:
-        bucket = day_buckets.get(key, [])
         counts = {e: 0 for e in EMOTIONS}
-        for r in bucket:
-            e = (r.emotion or "").strip()
-            if e in counts:
-                counts[e] += 1
+        counts.update(day_counts.get(key, {}))
         total = sum(counts.values())
         ratios = {k: (float(counts[k]) / float(total) if total else 0.0) for k in counts.keys()}
         for e, v in counts.items():
@@ -132,19 +138,19 @@ def _cache_set(key: Tuple[Any, ...], data: Dict[str, Any]):
 
 
 @router.get("")  # レスポンス形が full/compact で変わるので response_model は外す
-def weekly_report(
+async def weekly_report(
     days: int = Query(7, ge=3, le=31),
     tz: str = Query("Asia/Tokyo"),
     class_id: Optional[str] = Query(None),
     view: Literal["full", "compact"] = Query("compact"),
-    db: Session = Depends(get_db),
+    db: Optional[AsyncSession] = Depends(get_async_db),
 ):
     key = ("weekly_report_v4", days, tz, class_id)
     cached = _cache_get(key)
     if cached:
         data = cached
     else:
-        data = _calc_weekly(db, days=days, tz=tz, class_id=class_id)
+        data = await run_db(db, _calc_weekly, days=days, tz=tz, class_id=class_id)
         _cache_set(key, data)
 
     if view == "compact":
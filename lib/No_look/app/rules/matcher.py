@@ -0,0 +1,283 @@
+# app/rules/matcher.py
+from __future__ import annotations
+import re
+from dataclasses import dataclass, field
+from typing import Dict, FrozenSet, List, Mapping, NamedTuple, Optional, Sequence, Tuple, Union
+
+try:
+    from re import _parser as _sre_parse  # Python 3.11+
+except ImportError:  # pragma: no cover
+    import sre_parse as _sre_parse  # type: ignore[no-redef]
+
+# リテラル選択肢だけで書かれたパターン（例: "(嬉し|うれし|最高)"）を判定する
+_META = set(".^$*+?{}[]\\|()")
+_GROUPED = re.compile(r"^\(([^()]*)\)$")
+
+
+_CHAR_CLASS = re.compile(r"^\[([^\]\\^-]+)\]$")
+
+
+def literal_alternatives(pattern: str) -> Tuple[str, ...]:
+    """
+    "(a|b|c)" / "abc" 形式のパターンを選択肢タプルに分解する。
+    正規表現メタ文字を含むものは一括走査できないので ValueError。
+    """
+    m = _GROUPED.match(pattern)
+    body = m.group(1) if m else pattern
+    alts = tuple(body.split("|"))
+    for a in alts:
+        if not a or any(ch in _META for ch in a):
+            raise ValueError(f"literal alternation expected: {pattern!r}")
+    return alts
+
+
+class Hit(NamedTuple):
+    """1件のヒット（どのパターンが・どの感情に・どの重みで・どこに）。"""
+    pattern: int
+    emotion: str
+    weight: float
+    start: int
+    end: int
+
+
+def first_chars(fragment: str) -> Optional[FrozenSet[str]]:
+    """断片がマッチし得る先頭文字の集合。求められなければ None（=どこでも試す）。"""
+    m = _CHAR_CLASS.match(fragment)
+    if m:
+        return frozenset(m.group(1))
+    try:
+        return frozenset(a[0] for a in literal_alternatives(fragment))
+    except ValueError:
+        return None
+
+
+@dataclass
+class Scan:
+    """LexiconMatcher.scan の結果。hits はパターン順→出現位置順に並ぶ。"""
+    hits: List[Hit] = field(default_factory=list)
+    markers: Dict[str, List[Tuple[int, int]]] = field(default_factory=dict)
+
+    def has(self, name: str) -> bool:
+        return bool(self.markers.get(name))
+
+
+class LexiconMatcher:
+    """
+    {感情: {パターン: 重み}} を import 時に1本の先読み正規表現へコンパイルし、
+    テキストを1回だけ走査してヒット位置とマーカー位置を返す。
+
+    - パターン毎のヒットは re.finditer(pattern, text) と同じ
+      （左から・選択肢は書いた順・同一パターン内では重ならない）。
+    - markers は {名前: 固定長の正規表現断片}。否定語や「！」の有無など、
+      語彙ヒット以外に欲しい位置情報を同じ走査で拾う。
+    """
+
+    def __init__(self,
+                 lexicon: Mapping[str, Mapping[str, float]],
+                 markers: Mapping[str, str] | None = None):
+        self._patterns: List[Tuple[str, float, Tuple[str, ...]]] = []
+        by_first: Dict[str, List[Tuple[int, Tuple[str, ...]]]] = {}
+        literals: List[str] = []
+        for emo, pats in lexicon.items():
+            for pat, w in pats.items():
+                idx = len(self._patterns)
+                alts = literal_alternatives(pat)
+                self._patterns.append((emo, float(w), alts))
+                for ch in {a[0] for a in alts}:
+                    # 先頭文字が同じ選択肢だけを渡す（書いた順は維持）
+                    by_first.setdefault(ch, []).append(
+                        (idx, tuple(a for a in alts if a[0] == ch))
+                    )
+                literals.extend(alts)
+        self._by_first = by_first
+
+        self._markers: List[Tuple[str, re.Pattern[str]]] = [
+            (name, re.compile(frag)) for name, frag in (markers or {}).items()
+        ]
+        # マーカーも先頭文字で振り分け（求められない断片は毎回試す）
+        self._marker_by_first: Dict[str, List[Tuple[str, re.Pattern[str]]]] = {}
+        self._marker_any: List[Tuple[str, re.Pattern[str]]] = []
+        for name, mre in self._markers:
+            chars = first_chars(mre.pattern)
+            if chars is None:
+                self._marker_any.append((name, mre))
+                continue
+            for ch in chars:
+                self._marker_by_first.setdefault(ch, []).append((name, mre))
+        # 先読みで「何かが始まる位置」だけを C レベルで列挙する
+        parts = [re.escape(a) for a in sorted(set(literals), key=len, reverse=True)]
+        for i, (_, mre) in enumerate(self._markers):
+            # 各断片のグループ名/後方参照が衝突しないよう名前空間を分ける
+            parts.append(_rename_groups(mre.pattern, f"m{i}_"))
+        self._trigger = re.compile("(?=" + "|".join(f"(?:{p})" for p in parts) + ")", re.S)
+        # 1つのヒット/マーカーが最長で何文字先まで読むか（区間走査で stop の先をどこまで見せるか）。
+        # 上限の無い断片があれば None（末尾まで見せる）
+        widths = [len(a) for a in literals] + [_max_width(mre.pattern) for _, mre in self._markers]
+        self.max_width: Optional[int] = None if None in widths else max(widths, default=0)
+
+    @property
+    def patterns(self) -> Sequence[Tuple[str, float, Tuple[str, ...]]]:
+        return self._patterns
+
+    def scan(self, text: str) -> Scan:
+        return self.scan_range(text, 0, None, [0] * len(self._patterns))
+
+    def scan_range(self, text: str, start: int, stop: Optional[int], next_free: List[int]) -> Scan:
+        """
+        開始位置が [start, stop) のヒット/マーカーだけを拾う（stop=None なら末尾まで）。
+        next_free はパターン毎の「次に探してよい位置」で、呼び出しをまたいで引き継ぐ
+        （境界をまたぐヒットの続きで同じパターンが重ならないように）。
+        text 自体は切り出さないので、境界をまたぐ語やマーカーもそのまま照合できる。
+        区間を順に全部なめると scan(text) と同じヒット/マーカーになる。
+        """
+        n_pat = len(self._patterns)
+        per_pat: List[List[Hit]] = [[] for _ in range(n_pat)]
+        markers: Dict[str, List[Tuple[int, int]]] = {name: [] for name, _ in self._markers}
+        by_first = self._by_first
+        marker_by_first = self._marker_by_first
+        marker_any = self._marker_any
+        patterns = self._patterns
+        startswith = text.startswith
+
+        if stop is None or self.max_width is None:
+            endpos = len(text)
+        else:
+            endpos = min(len(text), stop + self.max_width)
+        # endpos で切らないと、区間内に語が1つも無いとき finditer が末尾まで探しに行く（区間数×全長）
+        for m in self._trigger.finditer(text, start, endpos):
+            i = m.start()
+            if stop is not None and i >= stop:
+                break
+            ch = text[i]
+            for idx, alts in by_first.get(ch, ()):
+                if i < next_free[idx]:
+                    continue
+                for a in alts:
+                    if startswith(a, i):
+                        end = i + len(a)
+                        emo, w, _ = patterns[idx]
+                        per_pat[idx].append(Hit(idx, emo, w, i, end))
+                        next_free[idx] = end
+                        break
+            for name, mre in marker_by_first.get(ch, ()):
+                mm = mre.match(text, i)
+                if mm:
+                    markers[name].append((i, mm.end()))
+            for name, mre in marker_any:
+                mm = mre.match(text, i)
+                if mm:
+                    markers[name].append((i, mm.end()))
+
+        hits: List[Hit] = []
+        for lst in per_pat:
+            hits.extend(lst)
+        return Scan(hits=hits, markers=markers)
+
+
+def _max_width(fragment: str) -> Optional[int]:
+    """断片がマッチし得る最大文字数（上限なし・解析不能なら None）。"""
+    try:
+        hi = _sre_parse.parse(fragment).getwidth()[1]
+    except Exception:
+        return None
+    return None if hi >= _sre_parse.MAXREPEAT else int(hi)
+
+
+_GROUP_NAME = re.compile(r"\(\?P<(\w+)>|\(\?P=(\w+)\)")
+
+
+def _rename_groups(frag: str, prefix: str) -> str:
+    """名前付きグループ/後方参照にプレフィックスを付け、結合時の衝突を避ける。"""
+    def repl(m: re.Match[str]) -> str:
+        if m.group(1):
+            return f"(?P<{prefix}{m.group(1)}>"
+        return f"(?P={prefix}{m.group(2)})"
+    return _GROUP_NAME.sub(repl, frag)
+
+
+class OrderedKeywords:
+    """
+    "A.*B|C.*D" 形式（A〜D はリテラル選択肢）の正規表現を線形時間で判定する。
+
+    re.search は A の出現ごとに行末まで B を探し直すので、A だけが大量に並ぶ長文では
+    O(n^2) になる。ここでは行ごとに「A が最初に終わる位置」を求め、そこから行末までに
+    B が始まるかだけを見る（'.' は改行に合わないので行をまたがない）。
+    search() は re.search と同じ真偽を返す（Match は返さない）。
+    """
+
+    def __init__(self, pattern: str, pairs: Sequence[Tuple[Tuple[str, ...], Tuple[str, ...]]]):
+        self.pattern = pattern
+        self._pairs = tuple(pairs)
+
+    def __repr__(self) -> str:
+        return f"OrderedKeywords({self.pattern!r})"
+
+    def search(self, text: str) -> bool:
+        return any(_ordered_in_line(text, first, second) for first, second in self._pairs)
+
+
+def _ordered_in_line(text: str, first: Tuple[str, ...], second: Tuple[str, ...]) -> bool:
+    find = text.find
+    n = len(text)
+    start = 0
+    while start <= n:
+        nl = find("\n", start)
+        end = n if nl < 0 else nl
+        earliest = -1
+        for a in first:
+            p = find(a, start, end)
+            if p >= 0 and (earliest < 0 or p + len(a) < earliest):
+                earliest = p + len(a)
+        if earliest >= 0:
+            for b in second:
+                if find(b, earliest, end) >= 0:
+                    return True
+        if nl < 0:
+            return False
+        start = nl + 1
+    return False
+
+
+def _split_top(pattern: str, sep: str) -> List[str]:
+    """括弧の外にある sep で分割する。"""
+    parts, depth, cur, i = [], 0, [], 0
+    while i < len(pattern):
+        ch = pattern[i]
+        if ch == "\\":
+            cur.append(pattern[i:i + 2])
+            i += 2
+            continue
+        if ch == "(":
+            depth += 1
+        elif ch == ")":
+            depth -= 1
+        if depth == 0 and pattern.startswith(sep, i):
+            parts.append("".join(cur))
+            cur = []
+            i += len(sep)
+            continue
+        cur.append(ch)
+        i += 1
+    parts.append("".join(cur))
+    return parts
+
+
+Searchable = Union["re.Pattern[str]", OrderedKeywords]
+
+
+def compile_pattern(pattern: str) -> Searchable:
+    """
+    ルールファイルの patterns / scored_patterns 用。
+    全枝が「リテラル選択肢 .* リテラル選択肢」なら OrderedKeywords（線形時間）、
+    それ以外は通常の re.compile。
+    """
+    pairs = []
+    for branch in _split_top(pattern, "|"):
+        halves = _split_top(branch, ".*")
+        if len(halves) != 2:
+            return re.compile(pattern)
+        try:
+            pairs.append((literal_alternatives(halves[0]), literal_alternatives(halves[1])))
+        except ValueError:
+            return re.compile(pattern)
+    return OrderedKeywords(pattern, pairs)
@@ -0,0 +1,155 @@
+# app/rules/memo.py
+"""
+分類結果のメモ化（LRU）。
+
+生徒は「疲れた」「だるい」「テストやばい」のような定型の短文を何度も送るので、
+(テキスト, 追加引数, ルール版 RuleSet.key) をキーに結果を覚えておく。
+
+- 件数上限（maxsize）を超えたら最も古く使われたものから捨てる（LRU）。
+- max_text 文字を超える長文はキャッシュしない（メモリ上限を件数×長さで固定するため）。
+- ルールがホットリロードされたら全キャッシュを破棄する（RuleRegistry.on_swap）。
+  キーにもルール版が入っているので、差し替え途中に計算された結果が混ざっても古い版は返らない。
+- 分類関数には呼び出し側のテキストをそのまま渡し、キーも正規化しない。
+  全角/半角違いで判定が変わりうるので（半角ｶﾅは辞書に当たらない等）、同じキーにまとめると
+  先に来た方の結果を返してしまう。
+
+標準ライブラリのみに依存する（firebase_backend からも nolook_rules.memo として使う）。
+ヒット/ミス/追い出しの件数は prometheus_client があれば app.metrics に流す。
+"""
+from __future__ import annotations
+import os
+import threading
+import unicodedata
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, List, Optional, Tuple, TypeVar
+
+from .registry import RuleRegistry, RuleSet, get_registry
+
+try:
+    from ..metrics import (
+        CLASSIFY_CACHE_EVICTIONS,
+        CLASSIFY_CACHE_HITS,
+        CLASSIFY_CACHE_MISSES,
+    )
+except Exception:  # prometheus_client が無い・app パッケージの外から読まれた（firebase_backend）
+    CLASSIFY_CACHE_HITS = CLASSIFY_CACHE_MISSES = CLASSIFY_CACHE_EVICTIONS = None
+
+T = TypeVar("T")
+
+
+def _env_int(name: str, default: int) -> int:
+    try:
+        return int(os.getenv(name, str(default)))
+    except ValueError:
+        return default
+
+
+DEFAULT_MAXSIZE = _env_int("NOLOOK_CLASSIFY_CACHE_SIZE", 4096)
+DEFAULT_MAX_TEXT = _env_int("NOLOOK_CLASSIFY_CACHE_MAX_TEXT", 200)
+
+
+def normalize_text(text: str) -> str:
+    """n-gram 特徴量用の正規化（NFKC）。ルール分類とキャッシュキーには使わない。"""
+    return unicodedata.normalize("NFKC", text or "")
+
+
+class LabelCache:
+    """
+    1つの分類関数ぶんの LRU キャッシュ（スレッドセーフ）。
+    get_or_compute(text, fn, *extra) は fn(text, *extra) の結果を返す。
+    戻り値は共有されるので、呼び出し側で書き換える場合はコピーすること。
+    """
+
+    def __init__(self, name: str, maxsize: int = DEFAULT_MAXSIZE, max_text: int = DEFAULT_MAX_TEXT):
+        self.name = name
+        self.maxsize = maxsize
+        self.max_text = max_text
+        self._data: "OrderedDict[Tuple[Hashable, ...], Any]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        # labels() の引き当ては遅いので子カウンタを先に作っておく
+        self._hit_counter = _child(CLASSIFY_CACHE_HITS, name)
+        self._miss_counter = _child(CLASSIFY_CACHE_MISSES, name)
+        self._evict_counter = _child(CLASSIFY_CACHE_EVICTIONS, name)
+        _caches.append(self)
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "size": len(self._data),
+            "maxsize": self.maxsize,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
+
+    def get_or_compute(self, text: str, fn: Callable[..., T], *extra: Hashable) -> T:
+        if self.maxsize <= 0 or len(text) > self.max_text:
+            return fn(text, *extra)
+
+        key = (get_registry().current.key, text) + extra
+        with self._lock:
+            value = self._data.get(key, _MISSING)
+            if value is not _MISSING:
+                self._data.move_to_end(key)
+                self.hits += 1
+        if value is not _MISSING:
+            if self._hit_counter is not None:
+                self._hit_counter.inc()
+            return value
+
+        # 計算はロックの外で（同じキーが同時に来たら両方計算し、後勝ちで入れる）
+        value = fn(text, *extra)
+        evicted = 0
+        with self._lock:
+            self.misses += 1
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                evicted += 1
+            self.evictions += evicted
+        if self._miss_counter is not None:
+            self._miss_counter.inc()
+            if evicted:
+                self._evict_counter.inc(evicted)
+        return value
+
+
+_MISSING = object()
+
+
+def _child(counter: Optional[Any], name: str) -> Optional[Any]:
+    return counter.labels(cache=name) if counter is not None else None
+
+
+_caches: List[LabelCache] = []
+
+
+def clear_all() -> None:
+    """全キャッシュを破棄する（ルール差し替え時に自動で呼ばれる）。"""
+    for c in list(_caches):
+        c.clear()
+
+
+def _on_rules_swap(old: RuleSet, new: RuleSet) -> None:
+    clear_all()
+
+
+def invalidate_on_swap(registry: RuleRegistry) -> None:
+    """registry でルールが差し替わったら全キャッシュを破棄するよう登録する。"""
+    registry.on_swap(_on_rules_swap)
+
+
+invalidate_on_swap(get_registry())
+
+
+__all__ = ["LabelCache", "normalize_text", "clear_all", "invalidate_on_swap"]
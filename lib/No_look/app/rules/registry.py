@@ -0,0 +1,278 @@
+# app/rules/registry.py
+"""
+全分類器が共有する感情ルールのレジストリ。
+
+- ルールは config/emotion_rules.json（"version" 付き）から読み込み、
+  import 時に1回だけコンパイルしてプロセス内で共有する。
+- ファイルが更新されたらバックグラウンドのスレッドが読み直し・コンパイルし、
+  完成した RuleSet を参照1本の差し替えで公開する（リクエスト経路では再コンパイルしない）。
+- 各エントリポイントは lexicon(name) で自分用の区画を取り出し、
+  スコアリング方針（重み加算・件数・優先順など）は自分の側で持つ。
+
+このモジュールは標準ライブラリのみに依存し、パッケージ内は相対 import だけを使う
+（firebase_backend は sys.path を触らずに app/rules をファイルパスから nolook_rules として読み込む）。
+"""
+from __future__ import annotations
+import hashlib
+import json
+import logging
+import os
+import re
+import threading
+from dataclasses import dataclass, field
+from functools import cached_property
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Mapping, Optional, Tuple
+
+from .matcher import LexiconMatcher, Searchable, compile_pattern
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_RULES_PATH = Path(__file__).resolve().parents[2] / "config" / "emotion_rules.json"
+
+
+@dataclass(frozen=True)
+class Lexicon:
+    """1つの分類器向けにコンパイル済みの区画。"""
+    name: str
+    weights: Mapping[str, Mapping[str, float]]
+    matcher: LexiconMatcher
+    # "A.*B" 形式は OrderedKeywords（線形時間）、それ以外は re.Pattern。どちらも .search() で真偽を見る
+    patterns: Mapping[str, Searchable] = field(default_factory=dict)
+    scored_patterns: Mapping[str, Tuple[Searchable, ...]] = field(default_factory=dict)
+    params: Mapping[str, Any] = field(default_factory=dict)
+
+
+@dataclass(frozen=True)
+class RuleSet:
+    """ルールファイル1版分。生成後は不変なので参照を差し替えるだけで公開できる。"""
+    version: str
+    digest: str
+    lexicons: Mapping[str, Lexicon]
+
+    @cached_property
+    def key(self) -> str:
+        """キャッシュキー等に使う識別子（宣言 version + 内容ハッシュ）。"""
+        return f"{self.version}:{self.digest[:12]}"
+
+    def lexicon(self, name: str) -> Lexicon:
+        try:
+            return self.lexicons[name]
+        except KeyError:
+            raise KeyError(f"rule lexicon not found: {name!r} (rules {self.key})") from None
+
+
+# 分類器がキーで直接読む項目。欠けたファイルを差し替えると全リクエストが KeyError になるので、
+# コンパイル時に弾いて旧版を維持する（区画そのものの有無は RuleRegistry の required_lexicons で見る）
+REQUIRED_KEYS: Mapping[str, Mapping[str, Tuple[str, ...]]] = {
+    "analyze": {
+        "markers": ("negation", "excla", "repeat", "confident", "hedge"),
+        "params": ("excla_boost", "repeat_boost", "neutral_floor", "winner_bonus"),
+    },
+    "rule_counts": {"markers": ("force_sad",)},
+    "detect6": {
+        "markers": ("crisis", "greeting", "kind_muri", "shindoi", "shindoi_neg", "fuan", "fuan_neg"),
+        "patterns": ("ambivalent", "recovery_before", "recovery_after"),
+    },
+}
+
+# 各エントリポイントが読む区画（get_registry が使う。どれか欠けたファイルは読み込まない）
+ENTRY_POINT_LEXICONS: Tuple[str, ...] = (
+    "analyze", "rule_counts", "rule_priority", "detect6", "simple_server", "working_ask_server",
+)
+
+
+def _mapping(name: str, sec: Mapping[str, Any], key: str) -> Mapping[str, Any]:
+    value = sec.get(key)
+    if value is None:
+        return {}
+    if not isinstance(value, Mapping):
+        raise ValueError(f"lexicon {name!r}: {key!r} must be an object")
+    return value
+
+
+def _check_required(name: str, sec: Mapping[str, Any]) -> None:
+    for key, required in REQUIRED_KEYS.get(name, {}).items():
+        present = _mapping(name, sec, key)
+        missing = [k for k in required if k not in present]
+        if missing:
+            raise ValueError(f"lexicon {name!r}: missing {key} {missing}")
+    params = _mapping(name, sec, "params")
+    for k in REQUIRED_KEYS.get(name, {}).get("params", ()):
+        if isinstance(params[k], bool) or not isinstance(params[k], (int, float)):
+            raise ValueError(f"lexicon {name!r}: param {k!r} must be a number")
+
+
+def _as_weights(raw: Mapping[str, Any]) -> Dict[str, Dict[str, float]]:
+    """{感情: [語, ...]} は各語を重み1.0のパターンとして、{感情: {パターン: 重み}} はそのまま。"""
+    out: Dict[str, Dict[str, float]] = {}
+    for emo, v in raw.items():
+        if isinstance(v, Mapping):
+            out[emo] = {str(p): float(w) for p, w in v.items()}
+        else:
+            out[emo] = {str(p): 1.0 for p in v}
+    return out
+
+
+def compile_rules(data: Mapping[str, Any], digest: str = "",
+                  required_lexicons: Tuple[str, ...] = ()) -> RuleSet:
+    """
+    パース済み JSON から RuleSet を構築する（不正なら ValueError）。
+    required_lexicons の区画が無い・REQUIRED_KEYS の項目が欠けている場合も ValueError。
+    """
+    if not isinstance(data, Mapping):
+        raise ValueError("rules file must be a JSON object")
+    version = str(data.get("version") or "").strip()
+    if not version:
+        raise ValueError("rules file must declare a non-empty 'version'")
+    sections = data.get("lexicons")
+    if not isinstance(sections, Mapping) or not sections:
+        raise ValueError("rules file must contain 'lexicons'")
+    missing = [name for name in required_lexicons if name not in sections]
+    if missing:
+        raise ValueError(f"rules file is missing lexicons {missing}")
+
+    lexicons: Dict[str, Lexicon] = {}
+    for name, sec in sections.items():
+        if not isinstance(sec, Mapping):
+            raise ValueError(f"lexicon {name!r} must be an object")
+        _check_required(name, sec)
+        try:
+            weights = _as_weights(_mapping(name, sec, "weights"))
+            matcher = LexiconMatcher(weights, _mapping(name, sec, "markers"))
+            patterns = {k: compile_pattern(p) for k, p in _mapping(name, sec, "patterns").items()}
+            scored = {
+                emo: tuple(compile_pattern(p) for p in pats)
+                for emo, pats in _mapping(name, sec, "scored_patterns").items()
+            }
+        except (TypeError, ValueError, re.error) as e:
+            raise ValueError(f"lexicon {name!r}: {e}") from e
+        lexicons[name] = Lexicon(
+            name=name,
+            weights=weights,
+            matcher=matcher,
+            patterns=patterns,
+            scored_patterns=scored,
+            params=dict(_mapping(name, sec, "params")),
+        )
+    return RuleSet(version=version, digest=digest, lexicons=lexicons)
+
+
+def load_rules(path: Path, required_lexicons: Tuple[str, ...] = ()) -> RuleSet:
+    raw = path.read_bytes()
+    data = json.loads(raw.decode("utf-8-sig"))
+    return compile_rules(data, hashlib.sha1(raw).hexdigest(), required_lexicons)
+
+
+class RuleRegistry:
+    """
+    現行 RuleSet の保持とホットリロード。
+    - current: いま有効な RuleSet（読み取りはロック不要）
+    - check(): ファイルが変わっていれば読み直して差し替え（失敗時は旧版を維持）
+    - start_watcher(): check() を poll_seconds 間隔で回すデーモンスレッドを起動
+    再読込では、いま有効な版にある区画が1つでも消えたファイルは受け付けない（読んでいる分類器が落ちるため）。
+    """
+
+    def __init__(self, path: Path, poll_seconds: float = 2.0, required_lexicons: Tuple[str, ...] = ()):
+        self.path = Path(path)
+        self.poll_seconds = poll_seconds
+        self.required_lexicons = tuple(required_lexicons)
+        self._lock = threading.Lock()
+        self._stamp = self._stat()
+        self._current = load_rules(self.path, self.required_lexicons)
+        self._listeners: List[Callable[[RuleSet, RuleSet], None]] = []
+        self._watcher: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+
+    @property
+    def current(self) -> RuleSet:
+        return self._current
+
+    def _stat(self) -> Tuple[int, int]:
+        st = self.path.stat()
+        return (st.st_mtime_ns, st.st_size)
+
+    def on_swap(self, fn: Callable[[RuleSet, RuleSet], None]) -> None:
+        """差し替え時に fn(old, new) を呼ぶ（キャッシュ破棄など）。"""
+        self._listeners.append(fn)
+
+    def check(self) -> bool:
+        """ファイル更新を検知したら再読込。差し替えたら True。"""
+        with self._lock:
+            try:
+                stamp = self._stat()
+            except OSError as e:
+                logger.warning("rules file unavailable, keeping %s: %s", self._current.key, e)
+                return False
+            if stamp == self._stamp:
+                return False
+            self._stamp = stamp
+            try:
+                required = tuple(dict.fromkeys((*self.required_lexicons, *self._current.lexicons)))
+                new = load_rules(self.path, required)
+            except Exception as e:
+                logger.error("rules reload failed, keeping %s: %s", self._current.key, e)
+                return False
+            if new.digest == self._current.digest:
+                return False
+            old, self._current = self._current, new
+        logger.info("rules swapped %s -> %s", old.key, new.key)
+        for fn in list(self._listeners):
+            try:
+                fn(old, new)
+            except Exception:
+                logger.exception("rules swap listener failed")
+        return True
+
+    def start_watcher(self) -> None:
+        if self.poll_seconds <= 0 or self._watcher is not None:
+            return
+        t = threading.Thread(target=self._watch, name="nolook-rules-watcher", daemon=True)
+        self._watcher = t
+        t.start()
+
+    def stop_watcher(self) -> None:
+        self._stop.set()
+
+    def _watch(self) -> None:
+        while not self._stop.wait(self.poll_seconds):
+            self.check()
+
+
+_registry: Optional[RuleRegistry] = None
+_registry_lock = threading.Lock()
+
+
+def get_registry() -> RuleRegistry:
+    """プロセス共通のレジストリ（初回呼び出しでロード＆監視開始）。"""
+    global _registry
+    if _registry is None:
+        with _registry_lock:
+            if _registry is None:
+                path = Path(os.getenv("NOLOOK_RULES_PATH") or DEFAULT_RULES_PATH)
+                try:
+                    poll = float(os.getenv("NOLOOK_RULES_POLL_SECONDS", "2"))
+                except ValueError:
+                    poll = 2.0
+                reg = RuleRegistry(path, poll_seconds=poll, required_lexicons=ENTRY_POINT_LEXICONS)
+                reg.start_watcher()
+                _registry = reg
+    return _registry
+
+
+def get_rules() -> RuleSet:
+    """現行 RuleSet（リクエスト経路ではこれを呼ぶだけ）。"""
+    return get_registry().current
+
+
+__all__ = [
+    "ENTRY_POINT_LEXICONS",
+    "REQUIRED_KEYS",
+    "Lexicon",
+    "RuleSet",
+    "RuleRegistry",
+    "compile_rules",
+    "load_rules",
+    "get_registry",
+    "get_rules",
+]
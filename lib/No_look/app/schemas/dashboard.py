@@ -12,6 +12,7 @@ class DayItem(BaseModel):
     counts: Dict[str, int] = Field(..., description="感情ごとの件数")
     ratios: Dict[str, float] = Field(..., description="感情ごとの比率 (0.0〜1.0)")
     total: int = Field(..., description="当日合計件数")
+    students: Optional[int] = Field(None, description="当日記録のある生徒数")
 
 class DashboardResponse(BaseModel):
     """教師ダッシュボード・週報共通レスポンス（基本構造）"""
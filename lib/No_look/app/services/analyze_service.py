@@ -1,87 +1,250 @@
 # app/services/analyze_service.py
 from __future__ import annotations
+import logging
 import os
-import re
-from typing import Dict
+import time
+from bisect import bisect_left
+from typing import Any, Callable, Dict, List, Mapping, Optional, Sequence, Tuple
+
+import numpy as np
+
+from app.rules.matcher import Hit, Scan
+from app.rules.memo import LabelCache
+from app.rules.registry import Lexicon, get_registry, get_rules
+from app.services.ngram_model import NgramModel, active_model
+
+try:
+    from app.metrics import ANALYZE_TRUNCATED
+except Exception:  # prometheus_client が無い環境
+    ANALYZE_TRUNCATED = None
+
+logger = logging.getLogger(__name__)
 
 EMOTION_KEYS = ("楽しい", "悲しい", "怒り", "不安", "しんどい", "中立")
 
-# 単語重み（弱:1.0 / 中:1.5 / 強:2.0 くらい）
-WORD_WEIGHTS = {
-    "楽しい": {
-        r"(楽しい|嬉し|うれし|最高|自己ベスト|優勝|合格|盛れた|神った)": 1.8,
-        r"(よかった|助かった|順調|ワクワク|楽しみ|期待してる|期待している)": 1.3,
-        r"(自信|自信ある|自信あり|自信がある)": 1.4,  # 自信はポジ寄り
-    },
-    "悲しい": {
-        r"(悲し|かなしい|落ち込|萎え|萎えた|泣きたい|ショック|へこむ)": 1.8,
-        r"(失敗|ミス|うまくいかない|つらい)": 1.3,
-    },
-    "怒り": {
-        r"(ムカつ|むかつ|イラつ|腹立|許せない|キレそう|納得いかない)": 1.8,
-        r"(不公平|理不尽|雑|舐めてる|雑に)": 1.4,
-    },
-    "不安": {
-        r"(不安|心配|焦る|焦っ|緊張|プレッシャ|間に合わない|大丈夫かな)": 1.8,
-        r"(でも|けど|ただ|かも)": 0.6,  # 逆接・不確実語の不安加点を弱める
-    },
-    "しんどい": {
-        r"(しんど|つら|きつ|だる|疲れ|つかれ|眠い|頭痛|体調悪)": 1.8,
-        r"(限界|もう無理|休みたい)": 2.0,
-    },
-}
-
-# 否定・反転（“嬉しくない”→ポジ減/ネガ増）
-NEGATIONS = (r"ない", r"じゃない", r"なく", r"ません", r"できない", r"無理")
-
-# 記号・感嘆ブースト
-EXCLA_BOOST = 1.15   # “！”があると感情全体を少し強める
-REPEAT_BOOST = 1.10  # 連長音/同語繰り返しに微加点（例: つらーーい/ムカつくうう）
-
-# 中立化しきい値（max がこの値未満なら中立に落とす）
-NEUTRAL_FLOOR = 0.45
-
-# “中立落ち”しにくくするため、最大ラベルに微ボーナス
-WINNER_BONUS = 0.05
+# 単語重み・否定語・ブースト係数・中立しきい値などは
+# config/emotion_rules.json の lexicons.analyze にある（app.rules.registry 経由で共有・ホットリロード）。
+# - weights: 単語重み（弱:1.0 / 中:1.5 / 強:2.0 くらい）
+# - markers.negation: 否定・反転（“嬉しくない”→ポジ減/ネガ増）。同じ開始位置なら短い方を拾えるよう長さ昇順
+# - params.excla_boost / repeat_boost: “！”・連長音/同語繰り返しで感情全体を少し強める
+# - params.neutral_floor: max がこの値未満なら中立に落とす
+# - params.winner_bonus: “中立落ち”しにくくするため、最大ラベルに微ボーナス
+# - markers.signal_* / topic:*: 補助指標（EmotionLog の topic_tags / relationship_mention /
+#   negation_index / avoidance）。感情と同じ1回の走査で拾う
+RULES_LEXICON = "analyze"
+TOPIC_MARKER_PREFIX = "topic:"
+
+# 長文（日記の貼り付け等）は NOLOOK_ANALYZE_CHUNK_CHARS 文字ずつ分割走査し、
+# 1リクエストあたり NOLOOK_ANALYZE_BUDGET_MS（スレッド CPU 時間）で打ち切る。0 ならそれぞれ無効
+DEFAULT_CHUNK_CHARS = 8192
+DEFAULT_BUDGET_MS = 250
+# async ルート（analyze_text_async）でこの文字数を超える本文はスレッドプールで解析する
+DEFAULT_INLINE_CHARS = 2000
+
+get_registry()  # import 時にロード＆コンパイルしておく（リクエスト経路では参照のみ）
 
 
 def _base_vec() -> Dict[str, float]:
     return {k: 0.0 for k in EMOTION_KEYS}
 
 
+def _negated_after(neg: List[Tuple[int, int]], neg_starts: List[int], end: int, window: int) -> bool:
+    """ヒット直後 window 文字（t[end:end+window]）に否定語が丸ごと収まっているか。"""
+    limit = end + window
+    i = bisect_left(neg_starts, end)
+    while i < len(neg) and neg[i][0] < limit:
+        if neg[i][1] <= limit:
+            return True
+        i += 1
+    return False
+
+
+def empty_signals() -> Dict[str, Any]:
+    return {"topic_tags": [], "relationship_mention": False, "negation_index": 0, "avoidance": 0}
+
+
+def _signals_from_scan(scan: Scan) -> Dict[str, Any]:
+    """
+    走査結果のマーカーから補助指標を作る（旧 compute_signals 相当、テキストは読み直さない）。
+    - topic_tags: ヒットした topic:* の名前（ルールファイルの順）
+    - relationship_mention: 人間関係語が1つでもあるか
+    - negation_index / avoidance: 否定語・回避語の出現回数
+    """
+    return _signals_from_counts({name: len(pos) for name, pos in scan.markers.items()})
+
+
+def _signals_from_counts(counts: Mapping[str, int]) -> Dict[str, Any]:
+    """マーカー名 → 出現回数 から補助指標を作る（長文の分割走査では区間ごとに足し込んだ回数）。"""
+    return {
+        "topic_tags": [
+            name[len(TOPIC_MARKER_PREFIX):]
+            for name, n in counts.items()
+            if n and name.startswith(TOPIC_MARKER_PREFIX)
+        ],
+        "relationship_mention": bool(counts.get("signal_relationship")),
+        "negation_index": counts.get("signal_negation", 0),
+        "avoidance": counts.get("signal_avoidance", 0),
+    }
+
+
+def merge_signals(prev: Optional[Dict[str, Any]], new: Dict[str, Any]) -> Dict[str, Any]:
+    """1日1レコードの更新用：タグは和集合（出現順）、言及は OR、回数は加算。"""
+    if not prev:
+        return {**new, "topic_tags": list(new.get("topic_tags") or [])}
+    tags = list(prev.get("topic_tags") or [])
+    tags += [t for t in (new.get("topic_tags") or []) if t not in tags]
+    return {
+        "topic_tags": tags,
+        "relationship_mention": bool(prev.get("relationship_mention")) or bool(new.get("relationship_mention")),
+        "negation_index": int(prev.get("negation_index") or 0) + int(new.get("negation_index") or 0),
+        "avoidance": int(prev.get("avoidance") or 0) + int(new.get("avoidance") or 0),
+    }
+
+
+# 定型の短文が多いので結果をメモ化（テキスト＋ルール版がキー、ルール差し替えで破棄）
+_label_cache = LabelCache("analyze_text_to_labels")
+
+
 def analyze_text_to_labels(text: str) -> Dict[str, float]:
-    t = text.strip()
-    vec = _base_vec()
+    model, weight = active_model()
+    # キャッシュ上の dict は共有なのでコピーして返す
+    return dict(_label_cache.get_or_compute(text.strip(), _analyze_uncached, model, weight)[0])
+
+
+def analyze_text(text: str) -> Tuple[Dict[str, float], Dict[str, Any]]:
+    """(感情ラベル, 補助指標) を1回の走査で返す。"""
+    model, weight = active_model()
+    labels, signals = _label_cache.get_or_compute(text.strip(), _analyze_uncached, model, weight)
+    # キャッシュ上の dict は共有なのでコピーして返す
+    return dict(labels), {**signals, "topic_tags": list(signals["topic_tags"])}
+
+
+async def analyze_text_async(text: str) -> Tuple[Dict[str, float], Dict[str, Any]]:
+    """
+    async def のルート用 analyze_text。
+    短文はそのまま（スレッド切替の方が高い）、NOLOOK_ANALYZE_INLINE_CHARS（既定 2000）を超える
+    長文だけスレッドプールに逃がしてイベントループを塞がない。
+    """
+    if len(text) <= _env_int("NOLOOK_ANALYZE_INLINE_CHARS", DEFAULT_INLINE_CHARS):
+        return analyze_text(text)
+    from starlette.concurrency import run_in_threadpool
+    return await run_in_threadpool(analyze_text, text)
+
+
+def _analyze_uncached(t: str, model: Optional[NgramModel] = None,
+                        weight: float = 0.0) -> Tuple[Dict[str, float], Dict[str, Any]]:
+    lex = get_rules().lexicon(RULES_LEXICON)
+    chunk = _env_int("NOLOOK_ANALYZE_CHUNK_CHARS", DEFAULT_CHUNK_CHARS)
+    if 0 < chunk < len(t):
+        labels, signals = _analyze_streaming(t, lex, chunk, _env_int("NOLOOK_ANALYZE_BUDGET_MS", DEFAULT_BUDGET_MS))
+    else:
+        scan = lex.matcher.scan(t)
+        labels, signals = _labels_from_scan(scan, lex.params), _signals_from_scan(scan)
+    if model is not None:
+        # 任意の n-gram モデル（NOLOOK_NGRAM_MODEL）と weight の比率で混ぜる。キーにモデルが入るので差し替えで混ざらない
+        row = (1.0 - weight) * labels_to_row(labels) + weight * model.predict_proba([t])[0]
+        labels = row_to_labels(row)
+    return labels, signals
+
+
+def _env_int(name: str, default: int) -> int:
+    try:
+        return int(os.getenv(name, str(default)))
+    except ValueError:
+        return default
 
-    # 単語重み加算
-    for emo, patterns in WORD_WEIGHTS.items():
-        for pat, w in patterns.items():
-            for m in re.finditer(pat, t):
-                vec[emo] += w
-
-                # 直後5文字内に否定があれば反転（簡易）
-                tail = t[m.end(): m.end() + 5]
-                if any(ng in tail for ng in NEGATIONS):
-                    if emo == "楽しい":
-                        vec["悲しい"] += w * 0.7
-                        vec["不安"] += w * 0.5
-                        vec[emo] -= w * 0.8
-                    else:
-                        # ネガ系の否定は中立/楽しいへ分散
-                        vec["楽しい"] += w * 0.4
-                        vec["中立"] += w * 0.3
-                        vec[emo] -= w * 0.6
 
+def _analyze_streaming(t: str, lex: Lexicon, chunk: int,
+                       budget_ms: int) -> Tuple[Dict[str, float], Dict[str, Any]]:
+    """
+    長文を chunk 文字ずつ区切って走査し、重みを区間ごとに足し込む（結果は1回走査と同じ）。
+    - 区間の境界をまたぐ語・否定語は text を切り出さずに照合するので取りこぼさない
+    - 否定窓（直後 negation_window 文字）が次の区間に掛かるヒットは、次の区間を見てから確定する
+    - 感嘆/繰り返し/自信/逆接は「どこかで出たか」だけ持ち越し、最後にまとめてブースト
+    - budget_ms（スレッド CPU 時間）を超えたら残りは読まずに、そこまでの結果で返す
+    """
+    params = lex.params
+    matcher = lex.matcher
+    window = int(params.get("negation_window", 5))
+    deadline = time.thread_time() + budget_ms / 1000 if budget_ms > 0 else None
+
+    vec = _base_vec()
+    counts: Dict[str, int] = {}          # マーカー名 → 回数（ルールファイルの順を保つ）
+    next_free = [0] * len(matcher.patterns)
+    pending: List[Hit] = []              # 否定窓がまだ読んでいない位置に掛かるヒット
+    neg: List[Tuple[int, int]] = []      # 未確定ヒットの判定に要る否定語だけ残す
+
+    def settle(hits: List[Hit], final: bool, known_to: int) -> List[Hit]:
+        neg_starts = [s for s, _ in neg]
+        rest = []
+        for hit in hits:
+            if final or hit.end + window <= known_to:
+                _add_hit(vec, hit.emotion, hit.weight, bool(neg) and _negated_after(neg, neg_starts, hit.end, window))
+            else:
+                rest.append(hit)
+        return rest
+
+    n = len(t)
+    pos = 0
+    while pos < n:
+        stop = min(n, pos + chunk)
+        scan = matcher.scan_range(t, pos, stop, next_free)
+        for name, found in scan.markers.items():
+            counts[name] = counts.get(name, 0) + len(found)
+        neg.extend(scan.markers["negation"])
+        pending = settle(pending + scan.hits, stop >= n, stop)
+        lowest = min((h.end for h in pending), default=stop)
+        neg = [m for m in neg if m[0] >= lowest]
+        pos = stop
+        if deadline is not None and pos < n and time.thread_time() > deadline:
+            logger.warning("analyze: CPU budget %dms exceeded, stopped at %d/%d chars", budget_ms, pos, n)
+            if ANALYZE_TRUNCATED is not None:
+                ANALYZE_TRUNCATED.inc()
+            settle(pending, True, pos)
+            break
+
+    return _finish_labels(vec, lambda name: counts.get(name, 0) > 0, params), _signals_from_counts(counts)
+
+
+def _labels_from_scan(scan: Scan, params: Mapping[str, Any]) -> Dict[str, float]:
+    vec = _base_vec()
+    window = int(params.get("negation_window", 5))
+    neg = scan.markers["negation"]
+    neg_starts = [s for s, _ in neg]
+
+    # 単語重み加算（ヒットは 感情→パターン→出現位置 の順で並んでいる）
+    for hit in scan.hits:
+        # 直後5文字内に否定があれば反転（簡易）
+        _add_hit(vec, hit.emotion, hit.weight, bool(neg) and _negated_after(neg, neg_starts, hit.end, window))
+
+    return _finish_labels(vec, scan.has, params)
+
+
+def _add_hit(vec: Dict[str, float], emo: str, w: float, negated: bool) -> None:
+    vec[emo] += w
+    if negated:
+        if emo == "楽しい":
+            vec["悲しい"] += w * 0.7
+            vec["不安"] += w * 0.5
+            vec[emo] -= w * 0.8
+        else:
+            # ネガ系の否定は中立/楽しいへ分散
+            vec["楽しい"] += w * 0.4
+            vec["中立"] += w * 0.3
+            vec[emo] -= w * 0.6
+
+
+def _finish_labels(vec: Dict[str, float], has: Callable[[str], bool], params: Mapping[str, Any]) -> Dict[str, float]:
+    """加算済みの重みにブースト・正規化・中立判定をかける（has はマーカーが1つでもあったか）。"""
     # 感嘆/繰り返しブースト
-    if "！" in t or "!" in t:
+    if has("excla"):
         for k in EMOTION_KEYS:
             if k != "中立":
-                vec[k] *= EXCLA_BOOST
-    # 非捕捉グループで安全化：長音「ー」連続 or 同一文字3連以上
-    if re.search(r"(?:ー{2,}|(.)\1{2,})", t):
+                vec[k] *= params["excla_boost"]
+    if has("repeat"):
         for k in EMOTION_KEYS:
             if k != "中立":
-                vec[k] *= REPEAT_BOOST
+                vec[k] *= params["repeat_boost"]
 
     # スコアの正規化（0..1）
     total = sum(v for k, v in vec.items() if k != "中立")
@@ -96,21 +259,21 @@ def analyze_text_to_labels(text: str) -> Dict[str, float]:
             vec[k] = vec[k] / total
 
     # 調整：自信ワード＋軽い逆接なら不安をやや減衰
-    if re.search(r"自信", t):
-        if re.search(r"(でも|けど|ただ|かも)", t) and vec.get("不安", 0.0) > 0:
+    if has("confident"):
+        if has("hedge") and vec.get("不安", 0.0) > 0:
             vec["不安"] *= 0.7  # 30% 減衰
 
     # 中立判定（最大が弱ければ中立）
     max_label = max((k for k in EMOTION_KEYS if k != "中立"), key=lambda x: vec[x])
     max_val = vec[max_label]
 
-    if max_val < NEUTRAL_FLOOR:
+    if max_val < params["neutral_floor"]:
         out = _base_vec()
         out["中立"] = 1.0
         return out
 
     # 勝者ボーナス（わずかに押し上げて中立落ち回避）
-    vec[max_label] = min(1.0, vec[max_label] + WINNER_BONUS)
+    vec[max_label] = min(1.0, vec[max_label] + params["winner_bonus"])
 
     # 中立は 1 - sum(他) で埋める（下限0）
     s = sum(vec[k] for k in EMOTION_KEYS if k != "中立")
@@ -156,14 +319,7 @@ def _renorm01(vec: Dict[str, float]) -> Dict[str, float]:
     return vec
 
 
-def blend_labels_ema_with_latest_bonus(prev: Dict[str, float] | None,
-                                       latest: Dict[str, float]) -> Dict[str, float]:
-    """
-    直近推定(latest)を前回(prev)と指数移動平均でブレンドし、
-    さらに latest の最大ラベルにボーナスを与える。
-    - NOLOOK_EMA_ALPHA: 既定0.8（過去をどれだけ残すか）
-    - NOLOOK_LATEST_BONUS: 既定0.2（最新勝者に加点して中立落ちを防ぐ）
-    """
+def _ema_params() -> Tuple[float, float]:
     try:
         alpha = float(os.getenv("NOLOOK_EMA_ALPHA", "0.8"))
     except Exception:
@@ -172,6 +328,18 @@ def blend_labels_ema_with_latest_bonus(prev: Dict[str, float] | None,
         bonus = float(os.getenv("NOLOOK_LATEST_BONUS", "0.2"))
     except Exception:
         bonus = 0.2
+    return alpha, bonus
+
+
+def blend_labels_ema_with_latest_bonus(prev: Dict[str, float] | None,
+                                       latest: Dict[str, float]) -> Dict[str, float]:
+    """
+    直近推定(latest)を前回(prev)と指数移動平均でブレンドし、
+    さらに latest の最大ラベルにボーナスを与える。
+    - NOLOOK_EMA_ALPHA: 既定0.8（過去をどれだけ残すか）
+    - NOLOOK_LATEST_BONUS: 既定0.2（最新勝者に加点して中立落ちを防ぐ）
+    """
+    alpha, bonus = _ema_params()
 
     prev = _ensure_vec_keys(prev or {})
     latest = _renorm01(_ensure_vec_keys(latest))
@@ -191,3 +359,106 @@ def blend_labels_ema_with_latest_bonus(prev: Dict[str, float] | None,
     blended = _renorm01(blended)
     return blended
 # --- ここまで ---
+
+
+# --- ここから：バッチ用（EMOTION_KEYS 順の6列 NumPy 配列） ---
+# 列の並びは EMOTION_KEYS と同じ。最後の列（_NEU）が中立。
+_NEU = EMOTION_KEYS.index("中立")
+
+
+def labels_to_row(vec: Dict[str, float] | None) -> np.ndarray:
+    """ラベル辞書 → 長さ6の float64 配列（欠損は0.0）。"""
+    return np.array([_ensure_vec_keys(vec)[k] for k in EMOTION_KEYS], dtype=np.float64)
+
+
+def row_to_labels(row: np.ndarray) -> Dict[str, float]:
+    """長さ6の配列 → ラベル辞書（API の返却境界でだけ使う）。"""
+    return {k: float(v) for k, v in zip(EMOTION_KEYS, row.tolist())}
+
+
+def analyze_texts_to_matrix(texts: Sequence[str],
+                            selected: Optional[Sequence[Optional[str]]] = None,
+                            signals_out: Optional[List[Dict[str, Any]]] = None) -> np.ndarray:
+    """
+    テキスト列をまとめて推定し (n, 6) 行列で返す。
+    selected[i] に正規化済みの感情名があればその行は one-hot。
+    signals_out を渡すと各テキストの補助指標を順に追加する（selected の行もテキストから算出）。
+    """
+    out = np.zeros((len(texts), len(EMOTION_KEYS)), dtype=np.float64)
+    model, weight = active_model()
+    auto: List[int] = []
+    for i, t in enumerate(texts):
+        sel = selected[i] if selected is not None else None
+        if sel is None or signals_out is not None:
+            # n-gram モデルは後でまとめて1回（辞書ルールの結果だけここで取る）
+            labels, sig = _label_cache.get_or_compute(t.strip(), _analyze_uncached, None, 0.0)
+            if signals_out is not None:
+                signals_out.append({**sig, "topic_tags": list(sig["topic_tags"])})
+        if sel is not None:
+            out[i, EMOTION_KEYS.index(sel)] = 1.0
+            continue
+        out[i] = [labels[k] for k in EMOTION_KEYS]
+        auto.append(i)
+    if model is not None and auto:
+        proba = model.predict_proba([texts[i].strip() for i in auto])
+        out[auto] = (1.0 - weight) * out[auto] + weight * proba
+    return out
+
+
+def _renorm01_rows(m: np.ndarray) -> np.ndarray:
+    """_renorm01 の行列版：各行の中立以外を合計1に、中立は 1-sum(他)。"""
+    m = np.maximum(m, 0.0)
+    emo = np.delete(m, _NEU, axis=1)
+    total = emo.sum(axis=1)
+    ok = total > 0
+    out = np.zeros_like(m)
+    scaled = emo[ok] / total[ok, None]
+    cols = [j for j in range(m.shape[1]) if j != _NEU]
+    out[np.ix_(ok, cols)] = scaled
+    out[ok, _NEU] = np.maximum(0.0, 1.0 - scaled.sum(axis=1))
+    out[~ok, _NEU] = 1.0
+    return out
+
+
+def blend_labels_ema_rows(prev: np.ndarray, latest: np.ndarray) -> np.ndarray:
+    """
+    blend_labels_ema_with_latest_bonus の行列版（行ごとに独立した1ステップ）。
+    prev / latest は (n, 6)。
+    """
+    alpha, bonus = _ema_params()
+    cols = [j for j in range(prev.shape[1]) if j != _NEU]
+    prev = np.maximum(prev, 0.0)
+    latest = _renorm01_rows(latest)
+
+    blended = np.zeros_like(prev)
+    blended[:, cols] = alpha * prev[:, cols] + (1 - alpha) * latest[:, cols]
+    blended = _renorm01_rows(blended)
+
+    # 最新の勝者（中立以外・同点は先頭）にボーナス
+    winner = np.asarray(cols)[np.argmax(latest[:, cols], axis=1)]
+    rows = np.arange(blended.shape[0])
+    blended[rows, winner] = np.minimum(1.0, blended[rows, winner] + max(0.0, bonus))
+    return _renorm01_rows(blended)
+
+
+def blend_sequences_ema(prev: np.ndarray,
+                        latest: np.ndarray,
+                        groups: Sequence[Sequence[int]]) -> np.ndarray:
+    """
+    グループ（=生徒）ごとに順序付きの latest 行を EMA で畳み込む。
+    - prev: (G, 6) 各グループの直前ベクトル
+    - latest: (n, 6) 全アイテムの推定
+    - groups[g]: latest の行番号を時系列順に並べたもの
+    返り値は (n, 6) で、各行は「そのアイテムまで反映したブレンド結果」。
+    ステップ t ごとに全グループをまとめて1回の行列演算で進める。
+    """
+    out = np.zeros_like(latest)
+    state = prev.copy()
+    depth = max((len(g) for g in groups), default=0)
+    for t in range(depth):
+        live = np.array([g_i for g_i, g in enumerate(groups) if len(g) > t], dtype=np.intp)
+        rows = np.array([groups[g_i][t] for g_i in live], dtype=np.intp)
+        state[live] = blend_labels_ema_rows(state[live], latest[rows])
+        out[rows] = state[live]
+    return out
+# --- ここまで ---
@@ -1,19 +1,13 @@
+# app/services/db.py
+"""
+互換用：エンジン・セッションは app/core/db.py の1つだけを使う。
+以前はここで別のエンジン（既定 no_look.db）を作っていたが、同じ名前で app.core.db のものを返す。
+"""
 from __future__ import annotations
-import os
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker
 
-DB_URL = os.getenv("DATABASE_URL", "sqlite:///./no_look.db")
+from app.core import db as _core
 
-# SQLiteの場合に必要な設定
-connect_args = {"check_same_thread": False} if DB_URL.startswith("sqlite") else {}
 
-engine = create_engine(DB_URL, echo=False, future=True, connect_args=connect_args)
-SessionLocal = sessionmaker(bind=engine, autoflush=False, autocommit=False)
-
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
+def __getattr__(name: str):
+    # app.core.db はテストで reload されるので、都度そちらを引く
+    return getattr(_core, name)
@@ -0,0 +1,240 @@
+# app/services/label_canonicalize_service.py
+"""
+emotion_logs の labels 正規化ジョブ（CLI: canonicalize_labels.py / 管理API: /admin/canonicalize-labels）。
+
+古いコードが残した行（ラベルキーの空白・別名、emotion/score と labels の食い違い）を
+現行の形に揃える。分類のやり直しではない：本文テキストは保存しない方針なので、
+WORD_WEIGHTS / NEUTRAL_FLOOR などルールを変えても過去の行の判定は導き直せない
+（daily の行は EMA ブレンド後の labels なので、ラベルだけでしきい値を当て直すと現行コードの行まで変わる）。
+
+- テーブルを id 昇順のチャンク（WHERE id > 最終id ORDER BY id LIMIT n）で読み、このプロセスで計算する
+  （1行あたり辞書1つの整形で DB の読み書きの方が重いので、プロセスには分けない）。
+- 書き戻しは主キー指定の一括 UPDATE（executemany）をチャンク毎に1コミット（日次集計の移動も同じコミット）。
+- コミットしたら checkpoint（JSON）に最終 id を書くので、中断しても続きから再開できる。
+- dry_run=True なら書き込まず、変わる件数をクラス別・感情別（旧→新）に集計して返す。
+"""
+from __future__ import annotations
+import json
+import logging
+import math
+import os
+from collections import Counter
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+from sqlalchemy import select, update
+from sqlalchemy.orm import Session, sessionmaker
+
+from app.models.orm import EmotionLog, label_columns, label_values, labels_from_values
+from app.services.analyze_service import EMOTION_KEYS
+from app.services.normalizer import normalize_emotion
+from app.services import rollup_service
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CHUNK_SIZE = 2000
+
+# (id, class_id, emotion, score, labels)
+Row = Tuple[int, Optional[str], str, float, Any]
+# (id, class_id, 旧emotion, 新emotion, 新score, 新labels)
+Change = Tuple[int, Optional[str], str, str, float, Dict[str, float]]
+
+
+def canonicalize_labels(labels: Any) -> Tuple[str, float, Dict[str, float]]:
+    """
+    保存済み labels から (emotion, score, labels) を現行の形で導き直す。
+    - キーは前後空白除去＋normalize_emotion で正規キーに寄せる（同じキーは合算）
+    - 欠損キーは0、負値・非数は0に丸める。全部0なら中立=1.0（analyze と同じ）
+    - emotion は最大ラベル（同点は EMOTION_KEYS 順で先）、score はその値
+    現行コードが書いた行はそのまま（変化なし）になる。
+    """
+    if isinstance(labels, str):
+        try:
+            labels = json.loads(labels)
+        except ValueError:
+            labels = {}
+    vec = {k: 0.0 for k in EMOTION_KEYS}
+    if isinstance(labels, dict):
+        for k, v in labels.items():
+            key = normalize_emotion(k.strip()) if isinstance(k, str) else None
+            if key is None:
+                continue
+            try:
+                f = float(v)
+            except (TypeError, ValueError):
+                continue
+            if math.isfinite(f):
+                vec[key] += max(0.0, f)
+    if not any(vec.values()):
+        vec["中立"] = 1.0
+    emotion = max(vec, key=vec.get)
+    return emotion, float(vec[emotion]), vec
+
+
+def _differs(row: Row, emotion: str, score: float, labels: Dict[str, float]) -> bool:
+    _, _, old_emotion, old_score, old_labels = row
+    if old_emotion != emotion or not isinstance(old_labels, dict):
+        return True
+    if old_score is None or not math.isclose(float(old_score), score, abs_tol=1e-9):
+        return True
+    if set(old_labels) != set(labels):
+        return True
+    return any(
+        not isinstance(old_labels[k], (int, float))
+        or not math.isclose(float(old_labels[k]), v, abs_tol=1e-9)
+        for k, v in labels.items()
+    )
+
+
+def canonicalize_chunk(rows: Sequence[Row]) -> List[Change]:
+    """1チャンク分を整形し、変わる行だけ返す。"""
+    out: List[Change] = []
+    for row in rows:
+        emotion, score, labels = canonicalize_labels(row[4])
+        if _differs(row, emotion, score, labels):
+            out.append((row[0], row[1], row[2], emotion, score, labels))
+    return out
+
+
+@dataclass
+class CanonicalizeReport:
+    dry_run: bool
+    scanned: int = 0
+    changed: int = 0
+    updated: int = 0
+    last_id: int = 0
+    resumed_from: int = 0
+    by_class: Counter = field(default_factory=Counter)
+    by_emotion: Counter = field(default_factory=Counter)
+
+    def add(self, changes: Sequence[Change]) -> None:
+        self.changed += len(changes)
+        for _, class_id, old, new, _, _ in changes:
+            self.by_class[class_id or "(none)"] += 1
+            if old != new:
+                self.by_emotion[f"{old}→{new}"] += 1
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "dry_run": self.dry_run,
+            "scanned": self.scanned,
+            "changed": self.changed,
+            "updated": self.updated,
+            "last_id": self.last_id,
+            "resumed_from": self.resumed_from,
+            "by_class": dict(self.by_class.most_common()),
+            "by_emotion": dict(self.by_emotion.most_common()),
+        }
+
+
+def _iter_chunks(SessionLocal: sessionmaker, after_id: int, chunk_size: int) -> Iterator[List[Row]]:
+    """id 昇順のキーセットページングでチャンクを流す（OFFSET は使わない）。"""
+    last = after_id
+    while True:
+        with SessionLocal() as s:
+            rows = s.execute(
+                select(
+                    EmotionLog.id, EmotionLog.class_id, EmotionLog.emotion,
+                    EmotionLog.score, *label_columns(),
+                )
+                .where(EmotionLog.id > last)
+                .order_by(EmotionLog.id)
+                .limit(chunk_size)
+            ).all()
+        if not rows:
+            return
+        # canonicalize_labels が受ける {感情: 確率} の形にする
+        yield [(*r[:4], labels_from_values(r[4:])) for r in rows]
+        last = rows[-1][0]
+
+
+def _load_checkpoint(path: Optional[Path]) -> int:
+    if path is None or not path.is_file():
+        return 0
+    try:
+        data = json.loads(path.read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        logger.warning("checkpoint unreadable, starting over: %s", path)
+        return 0
+    return int(data.get("last_id") or 0)
+
+
+def _save_checkpoint(path: Optional[Path], report: CanonicalizeReport) -> None:
+    if path is None:
+        return
+    tmp = path.with_suffix(path.suffix + ".tmp")
+    tmp.write_text(json.dumps({
+        "last_id": report.last_id,
+        "updated": report.updated,
+        "saved_at": datetime.now(timezone.utc).isoformat(),
+    }, ensure_ascii=False), encoding="utf-8")
+    os.replace(tmp, path)  # 書きかけのファイルを残さない
+
+
+def _apply(SessionLocal: sessionmaker, changes: Sequence[Change]) -> None:
+    if not changes:
+        return
+    with SessionLocal() as s:  # type: Session
+        # 日次集計は「前の感情・ラベル」を引いて新しい方を足す（同じトランザクション）
+        new_by_id = {c[0]: c for c in changes}
+        before = s.execute(
+            select(EmotionLog.id, EmotionLog.class_id, EmotionLog.student_id,
+                   EmotionLog.created_at, EmotionLog.emotion, *label_columns())
+            .where(EmotionLog.id.in_(list(new_by_id)))
+        ).all()
+        s.execute(
+            update(EmotionLog),
+            [{"id": c[0], "emotion": c[3], "score": c[4], **label_values(c[5])} for c in changes],
+        )
+        rollup_service.apply_changes(s, [
+            (rollup_service.Entry(*r[1:5], tuple(r[5:])),
+             rollup_service.Entry(r[1], r[2], r[3], new_by_id[r[0]][3], new_by_id[r[0]][5]))
+            for r in before
+        ])
+        s.commit()
+
+
+def run_canonicalize(
+    SessionLocal: sessionmaker,
+    *,
+    dry_run: bool = True,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+    checkpoint: Optional[Path] = None,
+    restart: bool = False,
+    progress: Optional[Callable[[CanonicalizeReport], None]] = None,
+) -> CanonicalizeReport:
+    """
+    emotion_logs 全体の labels を正規化する。
+    checkpoint: 進捗ファイル（dry_run では読み書きしない）
+    """
+    report = CanonicalizeReport(dry_run=dry_run)
+    if dry_run:
+        checkpoint = None
+    elif checkpoint is not None and restart and checkpoint.exists():
+        checkpoint.unlink()
+    start = _load_checkpoint(checkpoint)
+    report.resumed_from = report.last_id = start
+
+    for rows in _iter_chunks(SessionLocal, start, chunk_size):
+        changes = canonicalize_chunk(rows)
+        report.scanned += len(rows)
+        report.add(changes)
+        if not dry_run:
+            _apply(SessionLocal, changes)
+            report.updated += len(changes)
+        report.last_id = rows[-1][0]
+        if not dry_run:
+            _save_checkpoint(checkpoint, report)
+        if progress:
+            progress(report)
+    return report
+
+
+__all__ = [
+    "CanonicalizeReport",
+    "canonicalize_chunk",
+    "canonicalize_labels",
+    "run_canonicalize",
+]
@@ -0,0 +1,265 @@
+# app/services/llm_client.py
+"""
+/ask の LLM 呼び出し（AsyncOpenAI をプロセスで1つ使い回す）。
+
+以前はリクエストごとに OpenAI クライアントを作り、タイムアウトなしの同期呼び出しを
+スレッドプールで待っていたので、上流が遅いとリクエストの数だけスレッドが塞がっていた。
+
+- クライアントと HTTP 接続プールは使い回す（イベントループごとに1つ。通常の起動ではプロセスに1つ）
+- 1回の呼び出しは NOLOOK_LLM_TIMEOUT_MS で打ち切る（同時実行枠の空き待ちも含めた上限、リトライなし）
+- 同時に上流へ出す呼び出しは NOLOOK_LLM_MAX_INFLIGHT 本まで（超えた分は上限時間まで待つ）
+- 失敗（例外・タイムアウト）が NOLOOK_LLM_BREAKER_FAILURES 回続いたら NOLOOK_LLM_BREAKER_COOLDOWN_S 秒は
+  呼ばずにすぐ返す（サーキットブレーカー）。明けたら1本だけ試し、成功すれば元に戻る
+- どの失敗でも (None, 理由) を返すだけなので、呼び出し側はルール返信（pick_rule_reply）のまま返す
+
+接続先は OPENAI_BASE_URL（または NOLOOK_LLM_BASE_URL）で変えられる。オフラインの負荷試験は
+    python -m bench.llm_stub --port 9911 --latency-ms 300
+    NOLOOK_LLM_BASE_URL=http://127.0.0.1:9911/v1 uvicorn app.main:app
+メトリクス: nolik_llm_calls{outcome} / nolik_llm_call_seconds / nolik_llm_inflight / nolik_llm_breaker_open
+"""
+from __future__ import annotations
+import asyncio
+import logging
+import os
+import threading
+import time
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+try:
+    import httpx
+    from openai import AsyncOpenAI
+except Exception:  # openai 未インストールならルール返信だけ
+    httpx = None  # type: ignore
+    AsyncOpenAI = None  # type: ignore
+
+try:
+    from app.metrics import LLM_BREAKER_OPEN, LLM_CALL_SECONDS, LLM_CALLS, LLM_INFLIGHT
+except Exception:  # メトリクスは任意
+    LLM_BREAKER_OPEN = LLM_CALL_SECONDS = LLM_CALLS = LLM_INFLIGHT = None
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TIMEOUT_MS = 3000
+DEFAULT_MAX_INFLIGHT = 16
+DEFAULT_BREAKER_FAILURES = 5
+DEFAULT_BREAKER_COOLDOWN_S = 30.0
+
+
+def _env_int(name: str, default: int) -> int:
+    try:
+        return int(os.getenv(name, str(default)))
+    except ValueError:
+        return default
+
+
+def _env_float(name: str, default: float) -> float:
+    try:
+        return float(os.getenv(name, str(default)))
+    except ValueError:
+        return default
+
+
+class CircuitBreaker:
+    """
+    連続失敗で開く（closed → open）。cooldown 秒たったら1本だけ通し（half-open）、
+    成功で閉じ、失敗で開き直す。スレッドセーフ。
+    """
+
+    def __init__(self, failures: int, cooldown_s: float, clock: Callable[[], float] = time.monotonic):
+        self.failures = max(failures, 1)
+        self.cooldown_s = cooldown_s
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._count = 0
+        self._opened_at: Optional[float] = None
+        self._probing = False
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            if self._opened_at is None:
+                return "closed"
+            return "half_open" if self._clock() - self._opened_at >= self.cooldown_s else "open"
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self._opened_at is None:
+                return True
+            if self._probing or self._clock() - self._opened_at < self.cooldown_s:
+                return False
+            self._probing = True  # 試しの1本
+            return True
+
+    def success(self) -> None:
+        with self._lock:
+            self._count = 0
+            self._opened_at = None
+            self._probing = False
+        self._publish()
+
+    def failure(self) -> None:
+        with self._lock:
+            self._count += 1
+            if self._probing or self._count >= self.failures:
+                if self._opened_at is None or self._probing:
+                    logger.warning("LLM circuit opened after %d consecutive failures", self._count)
+                self._opened_at = self._clock()
+            self._probing = False
+        self._publish()
+
+    def abandon(self) -> None:
+        """上流に届かずに終わった呼び出し（枠の空き待ちで時間切れ等）。成否に数えず試しの枠を返す。"""
+        with self._lock:
+            self._probing = False
+
+    def _publish(self) -> None:
+        if LLM_BREAKER_OPEN is not None:
+            LLM_BREAKER_OPEN.set(0 if self._opened_at is None else 1)
+
+
+@dataclass
+class _LoopClient:
+    loop: asyncio.AbstractEventLoop
+    client: Any
+    sem: asyncio.Semaphore
+
+
+_lock = threading.Lock()
+_current: Optional[_LoopClient] = None
+_transport: Optional[Any] = None   # テスト・ベンチ用（httpx の transport を差し込む）
+breaker = CircuitBreaker(
+    _env_int("NOLOOK_LLM_BREAKER_FAILURES", DEFAULT_BREAKER_FAILURES),
+    _env_float("NOLOOK_LLM_BREAKER_COOLDOWN_S", DEFAULT_BREAKER_COOLDOWN_S),
+)
+
+
+def _base_url() -> Optional[str]:
+    return (os.getenv("NOLOOK_LLM_BASE_URL") or os.getenv("OPENAI_BASE_URL") or "").strip() or None
+
+
+def _budget_s() -> float:
+    return max(_env_int("NOLOOK_LLM_TIMEOUT_MS", DEFAULT_TIMEOUT_MS), 1) / 1000.0
+
+
+def _make_client() -> Optional[Any]:
+    if AsyncOpenAI is None:
+        return None
+    base_url = _base_url()
+    key = os.getenv("OPENAI_API_KEY") or ""
+    if not key and base_url is None and _transport is None:
+        return None
+    inflight = max(_env_int("NOLOOK_LLM_MAX_INFLIGHT", DEFAULT_MAX_INFLIGHT), 1)
+    http_client = httpx.AsyncClient(
+        transport=_transport,
+        limits=httpx.Limits(max_connections=inflight, max_keepalive_connections=inflight),
+        timeout=httpx.Timeout(_budget_s(), connect=min(_budget_s(), 1.0)),
+    )
+    return AsyncOpenAI(api_key=key or "stub", base_url=base_url, http_client=http_client, max_retries=0)
+
+
+def _loop_client() -> Optional[_LoopClient]:
+    """いまのイベントループ用のクライアント（無ければ作る）。API キーも接続先も無ければ None。"""
+    global _current
+    loop = asyncio.get_running_loop()
+    cur = _current
+    if cur is not None and cur.loop is loop:
+        return cur
+    with _lock:
+        if _current is None or _current.loop is not loop:
+            # 別ループ（テストの TestClient 等）で作った接続は使えないので作り直す
+            client = _make_client()
+            if client is None:
+                return None
+            _current = _LoopClient(loop, client, asyncio.Semaphore(
+                max(_env_int("NOLOOK_LLM_MAX_INFLIGHT", DEFAULT_MAX_INFLIGHT), 1)))
+        return _current
+
+
+def _count(outcome: str, started: Optional[float] = None) -> None:
+    if LLM_CALLS is not None:
+        LLM_CALLS.labels(outcome=outcome).inc()
+        if started is not None:
+            LLM_CALL_SECONDS.observe(time.perf_counter() - started)
+
+
+async def complete(messages: List[Dict[str, str]], *, model: str, temperature: float,
+                   max_tokens: int) -> Tuple[Optional[str], Optional[str]]:
+    """
+    chat.completions を1回呼んで (本文, None) か (None, 理由) を返す（例外は投げない）。
+    理由: no_client / circuit_open / busy（枠待ちで時間切れ）/ timeout / empty_output / 例外名
+    """
+    lc = _loop_client()
+    if lc is None:
+        return None, "no_client"
+    if not breaker.allow():
+        _count("circuit_open")
+        return None, "circuit_open"
+
+    budget = _budget_s()
+    deadline = time.perf_counter() + budget
+    started: Optional[float] = None
+
+    async def call() -> Any:
+        nonlocal started
+        async with lc.sem:
+            started = time.perf_counter()
+            if LLM_INFLIGHT is not None:
+                LLM_INFLIGHT.inc()
+            try:
+                return await lc.client.chat.completions.create(
+                    model=model, messages=messages, temperature=temperature, max_tokens=max_tokens,
+                    timeout=max(deadline - started, 0.001),
+                )
+            finally:
+                if LLM_INFLIGHT is not None:
+                    LLM_INFLIGHT.dec()
+
+    try:
+        resp = await asyncio.wait_for(call(), budget)
+    except asyncio.CancelledError:  # クライアント切断など。成否に数えない
+        breaker.abandon()
+        raise
+    except asyncio.TimeoutError:
+        if started is None:
+            breaker.abandon()
+            _count("busy")
+            return None, "busy"
+        breaker.failure()
+        _count("timeout", started)
+        return None, "timeout"
+    except Exception as e:
+        if started is None:
+            breaker.abandon()
+        else:
+            breaker.failure()
+        _count("error", started)
+        name = type(e).__name__
+        return None, "timeout" if "Timeout" in name else f"{name}: {e}"
+    breaker.success()
+    _count("ok", started)
+    out = (resp.choices[0].message.content or "").strip() if resp.choices else ""
+    return (out, None) if out else (None, "empty_output")
+
+
+def configure(transport: Optional[Any] = None) -> None:
+    """クライアントを作り直す（テスト・ベンチで httpx の transport を差し込む / 環境変数を反映し直す）。"""
+    global _current, _transport, breaker
+    with _lock:
+        _current, _transport = None, transport
+        breaker = CircuitBreaker(
+            _env_int("NOLOOK_LLM_BREAKER_FAILURES", DEFAULT_BREAKER_FAILURES),
+            _env_float("NOLOOK_LLM_BREAKER_COOLDOWN_S", DEFAULT_BREAKER_COOLDOWN_S),
+        )
+
+
+async def aclose() -> None:
+    """いまのループのクライアントの接続を閉じる（lifespan 終了時）。"""
+    global _current
+    with _lock:
+        cur, _current = _current, None
+    if cur is not None and cur.loop is asyncio.get_running_loop():
+        await cur.client.close()
+
+
+__all__ = ["CircuitBreaker", "aclose", "breaker", "complete", "configure"]
@@ -0,0 +1,262 @@
+# app/services/log_queue.py
+"""
+/ask の emotion_logs INSERT 用の書き込み待ちキュー（write-behind / group commit）。
+
+チャットの返信が1件ごとの commit（fsync）を待たないよう、行の値をキューに積んで返す。
+バックグラウンドのスレッドが NOLOOK_LOG_FLUSH_MS ミリ秒か NOLOOK_LOG_FLUSH_ROWS 行の
+早い方でまとめて1トランザクションで書く（日次集計の更新も同じトランザクション）。
+
+- 容量は NOLOOK_LOG_QUEUE_MAX 行。満杯なら NOLOOK_LOG_QUEUE_WAIT_MS まで空きを待ち（背圧）、
+  それでも空かなければ呼び出し側がその場で同期書き込みする（取りこぼさない）
+- lifespan の終了時（app/main.py）とプロセス終了時に残りを書き切る
+- まとめ書きが失敗したら1行ずつ書き直し、書けなかった行は nolik_log_queue_dropped に数える
+- NOLOOK_LOG_WRITE_BEHIND=0 で無効（従来どおりリクエスト内で commit）
+- 書かれるまで最大 NOLOOK_LOG_FLUSH_MS の遅れがある。直後に読む必要があれば drain() を呼ぶ
+
+メトリクス: nolik_log_queue_depth / nolik_log_queue_flush_seconds / nolik_log_queue_flush_rows /
+nolik_log_queue_full
+"""
+from __future__ import annotations
+import atexit
+import logging
+import os
+import queue
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
+
+from app.core import db as coredb
+from app.services import log_service
+
+try:
+    from app.metrics import (
+        LOG_QUEUE_DEPTH,
+        LOG_QUEUE_DROPPED,
+        LOG_QUEUE_FLUSH_ROWS,
+        LOG_QUEUE_FLUSH_SECONDS,
+        LOG_QUEUE_FULL,
+    )
+except Exception:  # メトリクスは任意
+    LOG_QUEUE_DEPTH = LOG_QUEUE_DROPPED = LOG_QUEUE_FLUSH_ROWS = LOG_QUEUE_FLUSH_SECONDS = LOG_QUEUE_FULL = None
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_FLUSH_MS = 50
+DEFAULT_FLUSH_ROWS = 200
+DEFAULT_CAPACITY = 10000
+DEFAULT_WAIT_MS = 2000
+
+
+def _env_int(name: str, default: int) -> int:
+    try:
+        return int(os.getenv(name, str(default)))
+    except ValueError:
+        return default
+
+
+def enabled() -> bool:
+    return os.getenv("NOLOOK_LOG_WRITE_BEHIND", "1").strip().lower() not in ("0", "off", "false", "no")
+
+
+class WriteBehindQueue:
+    """
+    行の値（log_service.emotion_row_values の dict）を溜めて、まとめて INSERT する。
+    スレッドセーフ。ワーカースレッドは最初の offer/put で起動する。
+    """
+
+    def __init__(
+        self,
+        session_factory: Callable[[], Session],
+        *,
+        flush_ms: int = DEFAULT_FLUSH_MS,
+        flush_rows: int = DEFAULT_FLUSH_ROWS,
+        capacity: int = DEFAULT_CAPACITY,
+    ) -> None:
+        self.session_factory = session_factory
+        self.flush_s = max(flush_ms, 0) / 1000.0
+        self.flush_rows = max(flush_rows, 1)
+        self._q: "queue.Queue[Dict[str, Any]]" = queue.Queue(maxsize=max(capacity, 1))
+        self._stop = threading.Event()      # close 後は待たずに書き切る
+        self._start_lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._done = threading.Condition()
+        self._submitted = 0
+        self._completed = 0
+        self._flush_until = 0               # drain が待っている行数。ここまでは待たずに書く（以降はまた溜める）
+
+    # ---- 積む側 ----
+    def offer(self, values: Dict[str, Any]) -> bool:
+        """空きがあれば積んで True。満杯なら False（待たない）。"""
+        return self.put(values, timeout=None)
+
+    def put(self, values: Dict[str, Any], timeout: Optional[float] = 0.0) -> bool:
+        """空きを最大 timeout 秒待って積む（None/0 は待たない）。積めなければ False。"""
+        # 受付判定と件数の加算は close と同じロックの中で（close 後に受け付けた行を残さない）。
+        # ワーカーは受け付けた行が書き終わるまで止まらないので、加算のあとに積んでも取りこぼさない
+        with self._done:
+            if self._stop.is_set():
+                return False
+            self._submitted += 1
+        self._ensure_started()
+        try:
+            if timeout:
+                self._q.put(values, timeout=timeout)
+            else:
+                self._q.put_nowait(values)
+        except queue.Full:
+            with self._done:
+                self._submitted -= 1
+            return False
+        self._set_depth()
+        return True
+
+    def depth(self) -> int:
+        """まだ commit されていない行数（キュー内＋書き込み中のまとまり）。"""
+        with self._done:
+            return self._submitted - self._completed
+
+    def drain(self, timeout: float = 10.0) -> bool:
+        """ここまでに積んだ行が書き終わるまで待つ（テストや、直後に読む処理用）。"""
+        with self._done:
+            target = self._submitted
+            self._flush_until = max(self._flush_until, target)
+            return self._done.wait_for(lambda: self._completed >= target, timeout=timeout)
+
+    def close(self, timeout: float = 10.0) -> None:
+        """新規受付を止め、残りを書き切ってワーカーを止める。"""
+        with self._done:
+            self._stop.set()
+        t = self._thread
+        if t is not None:
+            t.join(timeout)
+
+    # ---- 書く側 ----
+    def _ensure_started(self) -> None:
+        if self._thread is not None:
+            return
+        with self._start_lock:
+            if self._thread is None:
+                t = threading.Thread(target=self._run, name="nolook-log-writer", daemon=True)
+                t.start()
+                self._thread = t
+
+    def _hurry(self) -> bool:
+        """待たずに書くべきか（close 後、または drain が待っている行がまだ書き終わっていない）。"""
+        with self._done:
+            return self._stop.is_set() or self._completed < self._flush_until
+
+    def _finished(self) -> bool:
+        """close 済みで、受け付けた行（まだ積み終わっていない put の分も含む）を書き終えたか。"""
+        with self._done:
+            return self._stop.is_set() and self._completed >= self._submitted
+
+    def _run(self) -> None:
+        while True:
+            try:
+                first = self._q.get(timeout=0.2)
+            except queue.Empty:
+                if self._finished():
+                    return
+                continue
+            batch = [first]
+            deadline = time.monotonic() + self.flush_s
+            while len(batch) < self.flush_rows:
+                wait = 0.0 if self._hurry() else deadline - time.monotonic()
+                try:
+                    # drain / close の合図に気付けるよう、待つのは短く区切る
+                    batch.append(self._q.get(timeout=min(wait, 0.05)) if wait > 0 else self._q.get_nowait())
+                except queue.Empty:
+                    if wait <= 0.05:
+                        break
+            self._flush(batch)
+            with self._done:
+                self._completed += len(batch)
+                self._done.notify_all()
+            self._set_depth()
+
+    def _flush(self, batch: List[Dict[str, Any]]) -> None:
+        t0 = time.perf_counter()
+        try:
+            with self.session_factory() as db:
+                try:
+                    log_service.insert_rows(db, batch)
+                except Exception:
+                    db.rollback()
+                    logger.exception("write-behind flush of %d rows failed, retrying row by row", len(batch))
+                    for values in batch:
+                        try:
+                            log_service.insert_rows(db, [values])
+                        except Exception:
+                            db.rollback()
+                            logger.exception("failed to insert queued emotion_log")
+                            if LOG_QUEUE_DROPPED is not None:
+                                LOG_QUEUE_DROPPED.inc()
+        except Exception:
+            logger.exception("write-behind flush could not open a session")
+            if LOG_QUEUE_DROPPED is not None:
+                LOG_QUEUE_DROPPED.inc(len(batch))
+        finally:
+            if LOG_QUEUE_FLUSH_SECONDS is not None:
+                LOG_QUEUE_FLUSH_SECONDS.observe(time.perf_counter() - t0)
+                LOG_QUEUE_FLUSH_ROWS.observe(len(batch))
+
+    def _set_depth(self) -> None:
+        if LOG_QUEUE_DEPTH is not None:
+            LOG_QUEUE_DEPTH.set(self.depth())
+
+
+# ---- プロセスに1本（DB を差し替えたら前のキューを書き切ってから作り直す） ----
+_lock = threading.Lock()
+_queue: Optional[WriteBehindQueue] = None
+
+
+def get_queue() -> WriteBehindQueue:
+    global _queue
+    factory = coredb.SessionLocal
+    old = None
+    with _lock:
+        if _queue is None or _queue.session_factory is not factory:
+            old, _queue = _queue, WriteBehindQueue(
+                factory,
+                flush_ms=_env_int("NOLOOK_LOG_FLUSH_MS", DEFAULT_FLUSH_MS),
+                flush_rows=_env_int("NOLOOK_LOG_FLUSH_ROWS", DEFAULT_FLUSH_ROWS),
+                capacity=_env_int("NOLOOK_LOG_QUEUE_MAX", DEFAULT_CAPACITY),
+            )
+        q = _queue
+    if old is not None:
+        old.close()
+    return q
+
+
+async def submit(values: Dict[str, Any]) -> bool:
+    """
+    async ルートから積む。満杯なら NOLOOK_LOG_QUEUE_WAIT_MS までスレッドプールで空きを待つ。
+    False なら積めていないので、呼び出し側で同期書き込みすること。
+    """
+    q = get_queue()
+    if q.offer(values):
+        return True
+    if LOG_QUEUE_FULL is not None:
+        LOG_QUEUE_FULL.inc()
+    wait = _env_int("NOLOOK_LOG_QUEUE_WAIT_MS", DEFAULT_WAIT_MS) / 1000.0
+    return bool(wait > 0 and await run_in_threadpool(q.put, values, wait))
+
+
+def drain(timeout: float = 10.0) -> bool:
+    q = _queue
+    return q.drain(timeout) if q is not None else True
+
+
+def shutdown(timeout: float = 10.0) -> None:
+    """残りを書き切って止める（lifespan 終了時・プロセス終了時）。"""
+    global _queue
+    with _lock:
+        q, _queue = _queue, None
+    if q is not None:
+        q.close(timeout)
+
+
+atexit.register(shutdown)
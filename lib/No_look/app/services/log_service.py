@@ -1,8 +1,47 @@
 from __future__ import annotations
-from typing import Optional, Dict, Any
+from datetime import datetime, timezone
+from typing import Optional, Dict, Any, Iterable, List
 from sqlalchemy.orm import Session
 
-from app.models.orm import EmotionLog
+from app.models.orm import EmotionLog, label_values
+from app.services import rollup_service
+
+def emotion_row_values(
+    *,
+    class_id: Optional[str],
+    student_id: Optional[str],
+    emotion: str,
+    score: float,
+    labels: Dict[str, float],
+    signals: Optional[Dict[str, Any]] = None,
+    topic_tags: Optional[list] = None,
+    created_at: Optional[datetime] = None,
+) -> Dict[str, Any]:
+    """
+    emotion_logs 1行分の列値（書き込み待ちキューにはこの dict を積む。created_at は受付時刻）
+    labels は p_fun ... p_neutral の6列に展開する
+    """
+    signals = signals or {}
+    return {
+        "class_id": class_id,
+        "student_id": student_id,
+        "emotion": emotion,
+        "score": float(score or 0.0),
+        **label_values(labels),
+        "topic_tags": list(topic_tags or []),
+        "relationship_mention": bool(signals.get("relationship_mention", False)),
+        "negation_index": int(signals.get("negation_index", 0) or 0),
+        "avoidance": int(signals.get("avoidance", 0) or 0),
+        "created_at": created_at or datetime.now(timezone.utc),
+    }
+
+def insert_rows(db: Session, values: Iterable[Dict[str, Any]]) -> List[EmotionLog]:
+    """まとめて INSERT して1回 commit（日次集計も同じトランザクションで更新）"""
+    rows = [EmotionLog(**v) for v in values]
+    db.add_all(rows)
+    rollup_service.apply_changes(db, [(None, rollup_service.entry(r)) for r in rows])
+    db.commit()
+    return rows
 
 def log_emotion(
     db: Session,
@@ -15,20 +54,8 @@ def log_emotion(
     signals: Optional[Dict[str, Any]] = None,
     topic_tags: Optional[list] = None,
 ) -> EmotionLog:
-    """emotion_logs に1件INSERTして返す"""
-    signals = signals or {}
-    row = EmotionLog(
-        class_id=class_id,
-        student_id=student_id,
-        emotion=emotion,
-        score=float(score or 0.0),
-        labels=labels,
-        topic_tags=topic_tags or [],
-        relationship_mention=bool(signals.get("relationship_mention", False)),
-        negation_index=int(signals.get("negation_index", 0) or 0),
-        avoidance=int(signals.get("avoidance", 0) or 0),
-    )
-    db.add(row)
-    db.commit()
-    db.refresh(row)
-    return row
+    """emotion_logs に1件INSERTして返す（日次集計も同じトランザクションで更新）"""
+    return insert_rows(db, [emotion_row_values(
+        class_id=class_id, student_id=student_id, emotion=emotion, score=score,
+        labels=labels, signals=signals, topic_tags=topic_tags,
+    )])[0]
@@ -0,0 +1,236 @@
+# app/services/ngram_model.py
+"""
+文字 n-gram（ハッシュ）による軽量な感情分類器（任意）。
+
+- 特徴量: NFKC 正規化テキストの文字 n-gram（既定 1〜3）を crc32 で dims 次元にハッシュした出現回数
+- 学習: 多項 NB（既定）またはソフトマックス回帰。train_ngram.py からオフラインで行う
+- 保存: .npz（使われた特徴の行だけ float32 で持ち、読み込み時に密な (dims, 6) 行列へ展開）
+- 推論: テキスト列を CSR（indptr / indices / data）にまとめ、重み行の gather ＋ reduceat で
+  (n, 6) のスコアを一度に出す（1件ずつ Python で足し込まない）
+
+NOLOOK_NGRAM_MODEL に .npz のパスがあるときだけ読み込み、
+analyze_service が辞書ルールの結果と NOLOOK_NGRAM_WEIGHT の比率で混ぜる。未設定なら何もしない。
+"""
+from __future__ import annotations
+import logging
+import os
+import threading
+import zlib
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Optional, Sequence, Tuple
+
+import numpy as np
+
+from app.rules.memo import normalize_text
+
+logger = logging.getLogger(__name__)
+
+EMOTION_KEYS = ("楽しい", "悲しい", "怒り", "不安", "しんどい", "中立")  # analyze_service と同じ順（循環 import を避けて再掲）
+KINDS = ("nb", "logreg")
+DEFAULT_DIMS = 1 << 16
+DEFAULT_NGRAM = (1, 3)
+DEFAULT_WEIGHT = 0.3
+
+# 文頭・文末を区別できるよう 2-gram 以上は境界記号を付けて切り出す
+_BOS, _EOS = "\x02", "\x03"
+
+Csr = Tuple[np.ndarray, np.ndarray, np.ndarray]  # (indptr, indices, data)
+
+
+def _grams(t: str, n_min: int, n_max: int):
+    for n in range(n_min, n_max + 1):
+        s = t if n == 1 else f"{_BOS}{t}{_EOS}"
+        for i in range(len(s) - n + 1):
+            yield n, s[i:i + n]
+
+
+def featurize(texts: Sequence[str], dims: int = DEFAULT_DIMS,
+              ngram: Tuple[int, int] = DEFAULT_NGRAM, l2: bool = False) -> Csr:
+    """テキスト列 → CSR（行内の同じ特徴はまとめて回数に）。l2=True なら各行を L2 正規化。"""
+    n_min, n_max = ngram
+    rows, cols = [], []
+    for r, text in enumerate(texts):
+        t = normalize_text(text).strip().casefold()
+        hashed = [zlib.crc32(f"{n}{g}".encode("utf-8")) % dims for n, g in _grams(t, n_min, n_max)]
+        cols.extend(hashed)
+        rows.extend([r] * len(hashed))
+
+    n = len(texts)
+    if not cols:
+        return np.zeros(n + 1, dtype=np.int64), np.zeros(0, dtype=np.int32), np.zeros(0, dtype=np.float32)
+
+    # (行, 列) の組で重複を数える → 行・列の順に並んだ CSR
+    flat = np.asarray(rows, dtype=np.int64) * dims + np.asarray(cols, dtype=np.int64)
+    uniq, counts = np.unique(flat, return_counts=True)
+    row_of = uniq // dims
+    indices = (uniq % dims).astype(np.int32)
+    data = counts.astype(np.float32)
+    indptr = np.zeros(n + 1, dtype=np.int64)
+    np.cumsum(np.bincount(row_of, minlength=n), out=indptr[1:])
+
+    if l2:
+        sq = np.zeros(n, dtype=np.float32)
+        np.add.at(sq, row_of, data * data)
+        data = data / np.sqrt(sq)[row_of]
+    return indptr, indices, data
+
+
+def csr_dot(x: Csr, weights: np.ndarray) -> np.ndarray:
+    """CSR (n, dims) × 密 (dims, k) → (n, k)。"""
+    indptr, indices, data = x
+    n = len(indptr) - 1
+    out = np.zeros((n, weights.shape[1]), dtype=np.float32)
+    if not len(indices):
+        return out
+    contrib = weights[indices] * data[:, None]
+    nonempty = np.flatnonzero(indptr[1:] > indptr[:-1])
+    out[nonempty] = np.add.reduceat(contrib, indptr[nonempty], axis=0)
+    return out
+
+
+def _softmax(z: np.ndarray) -> np.ndarray:
+    z = z - z.max(axis=1, keepdims=True)
+    e = np.exp(z)
+    return e / e.sum(axis=1, keepdims=True)
+
+
+@dataclass(frozen=True, eq=False)
+class NgramModel:
+    """学習済みモデル（不変）。eq=False なのでインスタンスごとにハッシュ＝メモ化キーに使える。"""
+    kind: str
+    dims: int
+    ngram: Tuple[int, int]
+    weights: np.ndarray  # (dims, 6) float32
+    bias: np.ndarray     # (6,) float32（NB は対数事前確率）
+
+    @property
+    def l2(self) -> bool:
+        return self.kind == "logreg"
+
+    def predict_proba(self, texts: Sequence[str]) -> np.ndarray:
+        """(n, 6) の確率（列は EMOTION_KEYS の順）。"""
+        x = featurize(texts, self.dims, self.ngram, l2=self.l2)
+        return _softmax(csr_dot(x, self.weights) + self.bias).astype(np.float64)
+
+    def save(self, path: Path) -> None:
+        # 一度も出てこなかった特徴の行は全部同じ（NB: 平滑化の値 / logreg: 0）なので省く
+        used = np.flatnonzero(np.any(self.weights != self.weights[_unused_row(self.weights)], axis=1))
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with path.open("wb") as f:
+            np.savez_compressed(
+                f,
+                kind=np.array(self.kind),
+                classes=np.array(EMOTION_KEYS),
+                dims=np.int64(self.dims),
+                ngram=np.asarray(self.ngram, dtype=np.int64),
+                rows=used.astype(np.int32),
+                weights=self.weights[used].astype(np.float32),
+                default=self.weights[_unused_row(self.weights)].astype(np.float32),
+                bias=self.bias.astype(np.float32),
+            )
+
+    @classmethod
+    def load(cls, path: Path) -> "NgramModel":
+        with np.load(Path(path), allow_pickle=False) as z:
+            kind = str(z["kind"])
+            if kind not in KINDS:
+                raise ValueError(f"unknown model kind: {kind}")
+            if tuple(str(c) for c in z["classes"]) != EMOTION_KEYS:
+                raise ValueError(f"class order mismatch: {list(z['classes'])}")
+            dims = int(z["dims"])
+            weights = np.tile(z["default"], (dims, 1))
+            weights[z["rows"]] = z["weights"]
+            return cls(kind, dims, tuple(int(v) for v in z["ngram"]), weights, z["bias"].copy())
+
+
+def _unused_row(weights: np.ndarray) -> int:
+    """最も多い（＝学習で一度も更新されなかった）行の代表を1つ選ぶ。"""
+    _, first, counts = np.unique(weights, axis=0, return_index=True, return_counts=True)
+    return int(first[np.argmax(counts)])
+
+
+def _one_hot(labels: Sequence[str]) -> np.ndarray:
+    y = np.zeros((len(labels), len(EMOTION_KEYS)), dtype=np.float32)
+    y[np.arange(len(labels)), [EMOTION_KEYS.index(l) for l in labels]] = 1.0
+    return y
+
+
+def _csr_t_dot(x: Csr, m: np.ndarray, dims: int) -> np.ndarray:
+    """CSR の転置 × 密: X^T (dims, n) × m (n, k) → (dims, k)。"""
+    indptr, indices, data = x
+    rows = np.repeat(np.arange(len(indptr) - 1), np.diff(indptr))
+    out = np.zeros((dims, m.shape[1]), dtype=np.float32)
+    np.add.at(out, indices, m[rows] * data[:, None])
+    return out
+
+
+def train(texts: Sequence[str], labels: Sequence[str], kind: str = "nb",
+          dims: int = DEFAULT_DIMS, ngram: Tuple[int, int] = DEFAULT_NGRAM,
+          alpha: float = 0.1, epochs: int = 200, lr: float = 2.0, l2_reg: float = 1e-4) -> NgramModel:
+    """
+    kind="nb": 多項 NB（alpha はラプラス平滑化）。ほぼ一瞬で終わる。
+    kind="logreg": ソフトマックス回帰を全件勾配降下（epochs 回、l2_reg は重み減衰）。
+    ラベルは EMOTION_KEYS のどれか。データに無いクラスは事前確率が平滑化の分だけ残る。
+    """
+    if kind not in KINDS:
+        raise ValueError(f"kind must be one of {KINDS}")
+    if len(texts) != len(labels) or not texts:
+        raise ValueError("texts and labels must be non-empty and the same length")
+    y = _one_hot(labels)
+    x = featurize(texts, dims, ngram, l2=(kind == "logreg"))
+
+    if kind == "nb":
+        counts = _csr_t_dot(x, y, dims) + alpha                       # (dims, 6)
+        log_prob = np.log(counts) - np.log(counts.sum(axis=0, keepdims=True))
+        prior = y.sum(axis=0) + 1.0
+        return NgramModel(kind, dims, ngram, log_prob.astype(np.float32),
+                          np.log(prior / prior.sum()).astype(np.float32))
+
+    w = np.zeros((dims, len(EMOTION_KEYS)), dtype=np.float32)
+    b = np.zeros(len(EMOTION_KEYS), dtype=np.float32)
+    n = float(len(texts))
+    for _ in range(epochs):
+        grad = _softmax(csr_dot(x, w) + b) - y                      # (n, 6)
+        w -= lr * (_csr_t_dot(x, grad, dims) / n + l2_reg * w)
+        b -= lr * grad.mean(axis=0)
+    return NgramModel(kind, dims, ngram, w, b)
+
+
+# ---- 実行時に使うモデル（NOLOOK_NGRAM_MODEL） ----
+
+_lock = threading.Lock()
+_loaded: Tuple[Optional[str], Optional[NgramModel], float] = (None, None, DEFAULT_WEIGHT)
+
+
+def active_model() -> Tuple[Optional[NgramModel], float]:
+    """
+    (モデル, 混合比) を返す。NOLOOK_NGRAM_MODEL 未設定・読み込み失敗・比率0 なら (None, 0.0)。
+    パスが変わったときだけ読み直す（リクエスト経路では環境変数を1回見るだけ）。
+    """
+    global _loaded
+    path = os.environ.get("NOLOOK_NGRAM_MODEL") or None
+    cached_path, model, weight = _loaded
+    if path == cached_path:
+        return (model, weight) if model is not None else (None, 0.0)
+    with _lock:
+        model = None
+        try:
+            weight = min(1.0, max(0.0, float(os.getenv("NOLOOK_NGRAM_WEIGHT", str(DEFAULT_WEIGHT)))))
+        except ValueError:
+            weight = DEFAULT_WEIGHT
+        if path and weight > 0:
+            try:
+                model = NgramModel.load(Path(path))
+            except (OSError, ValueError, KeyError) as e:
+                logger.warning("n-gram モデルを読み込めないため辞書ルールのみで判定します: %s (%s)", path, e)
+        _loaded = (path, model, weight)
+    return (model, weight) if model is not None else (None, 0.0)
+
+
+def reset_active_model() -> None:
+    """次の active_model() で読み直す（テスト・モデル差し替え用）。"""
+    global _loaded
+    with _lock:
+        _loaded = (None, None, DEFAULT_WEIGHT)
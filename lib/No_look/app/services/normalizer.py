@@ -1,8 +1,16 @@
 # app/services/normalizer.py
 from __future__ import annotations
+import logging
+import os
+import threading
+import time
+import unicodedata
 from pathlib import Path
+from typing import Any, Dict, Iterable, Mapping, Optional, Tuple
 import yaml
 
+logger = logging.getLogger(__name__)
+
 _CANON = ["楽しい", "悲しい", "怒り", "不安", "しんどい", "中立"]
 
 # 最低限の内蔵エイリアス（YAMLが読めない環境でもテストを通す）
@@ -15,30 +23,137 @@ _FALLBACK = {
     "悲しい": "悲しい", "落ち込": "悲しい", "ショック": "悲しい",
 }
 
-_alias_map = None
+# YAML の変更を見に行く間隔（秒）。0 なら毎回 mtime を見る
+_POLL_SECONDS = float(os.getenv("NOLOOK_ALIAS_POLL_SECONDS", "2"))
+
+_END = ""  # トライの終端キー（値は正規キー）
+
+
+def _width_fold(s: str) -> str:
+    """全角/半角・大文字/小文字の違いを吸収（NFKC＋casefold＋前後空白除去）。"""
+    return unicodedata.normalize("NFKC", s).casefold().strip()
+
+
+class AliasIndex:
+    """
+    エイリアス → 正規キーの索引（不変）。
+    - 完全一致は dict 1回で引く
+    - 部分一致は文字トライで入力を1回なめ、最長のエイリアスが勝つ（同じ長さなら左にある方）
+    どちらもエイリアスの数には比例しない（入力長 × 最長エイリアス長 が上限）。
+    """
+
+    def __init__(self, mapping: Mapping[str, str]):
+        self.exact: Dict[str, str] = {}
+        self.trie: Dict[str, Any] = {}
+        for alias, canon in mapping.items():
+            key = _width_fold(alias)
+            if not key:
+                continue
+            self.exact[key] = canon
+            node = self.trie
+            for ch in key:
+                node = node.setdefault(ch, {})
+            node[_END] = canon
+
+    def __len__(self) -> int:
+        return len(self.exact)
+
+    def lookup(self, folded: str) -> Optional[str]:
+        hit = self.exact.get(folded)
+        if hit is not None:
+            return hit
+        best, best_len = None, 0
+        root, n = self.trie, len(folded)
+        for i in range(n):
+            node = root.get(folded[i])
+            j = i + 1
+            while node is not None:
+                canon = node.get(_END)
+                if canon is not None and j - i > best_len:
+                    best, best_len = canon, j - i
+                if j >= n:
+                    break
+                node = node.get(folded[j])
+                j += 1
+        return best
+
+
+def _yaml_aliases(data: Any) -> Iterable[Tuple[str, str]]:
+    """
+    2つの書き方を受け付ける（混在も可）。
+      楽しい: [うれしい, 最高, ...]          # 正規キー → エイリアス一覧（config/emotion_aliases.yaml の形）
+      aliases: {うれしい: 楽しい, ...}       # エイリアス → 正規キー
+    正規キー以外を指すものは捨てる。
+    """
+    if not isinstance(data, dict):
+        return
+    for key, val in data.items():
+        if key == "aliases" and isinstance(val, dict):
+            for alias, canon in val.items():
+                if canon in _CANON and alias is not None:
+                    yield str(alias), canon
+        elif key in _CANON and isinstance(val, (list, tuple)):
+            for alias in val:
+                if alias is not None:
+                    yield str(alias), key
+
 
-def _load_alias_map():
-    global _alias_map
-    if _alias_map is not None:
-        return _alias_map
+def _candidates() -> Tuple[Path, ...]:
     # プロジェクト内 YAML を優先してロード
-    candidates = [
+    return (
         Path("config/emotion_aliases.yaml"),
         Path(__file__).resolve().parents[2] / "config" / "emotion_aliases.yaml",
-    ]
-    for p in candidates:
-        if p.is_file():
-            try:
-                with p.open("r", encoding="utf-8") as f:
-                    data = yaml.safe_load(f) or {}
-                # 期待する形式: {"aliases": {"嬉しい": "楽しい", ...}}
-                mapping = data.get("aliases") if isinstance(data, dict) else {}
-                _alias_map = {**_FALLBACK, **(mapping or {})}
-                return _alias_map
-            except Exception:
-                break
-    _alias_map = dict(_FALLBACK)
-    return _alias_map
+    )
+
+
+def _build(path: Optional[Path]) -> AliasIndex:
+    mapping: Dict[str, str] = dict(_FALLBACK)
+    if path is not None:
+        try:
+            with path.open("r", encoding="utf-8") as f:
+                data = yaml.safe_load(f) or {}
+            mapping.update(_yaml_aliases(data))
+        except Exception as e:
+            logger.warning("failed to load %s: %s", path, e)
+    # 正規キー自身は常に自分に解決（YAML で別キーに向けられていても）
+    mapping.update({k: k for k in _CANON})
+    return AliasIndex(mapping)
+
+
+_lock = threading.Lock()
+_state: Tuple[Optional[AliasIndex], Optional[Path], Optional[float], float] = (None, None, None, 0.0)
+
+
+def _mtime(p: Path) -> Optional[float]:
+    try:
+        return p.stat().st_mtime
+    except OSError:
+        return None
+
+
+def _get_index() -> AliasIndex:
+    """YAML を索引にして返す。_POLL_SECONDS ごとに mtime を見て、変わっていれば作り直す。"""
+    global _state
+    index, path, mtime, checked = _state
+    now = time.monotonic()
+    if index is not None and now - checked < _POLL_SECONDS:
+        return index
+    with _lock:
+        index, path, mtime, checked = _state
+        if index is not None and now - checked < _POLL_SECONDS:
+            return index
+        found = next((p for p in _candidates() if p.is_file()), None)
+        new_mtime = _mtime(found) if found is not None else None
+        if index is None or found != path or new_mtime != mtime:
+            index = _build(found)
+        _state = (index, found, new_mtime, now)
+        return index
+
+
+def _load_alias_map() -> Dict[str, str]:
+    """(幅寄せ済みエイリアス → 正規キー) の辞書（確認・デバッグ用）。"""
+    return dict(_get_index().exact)
+
 
 def normalize_emotion(raw: str | None) -> str | None:
     if not raw:
@@ -47,11 +162,5 @@ def normalize_emotion(raw: str | None) -> str | None:
     # そのまま canonical の場合
     if s in _CANON:
         return s
-    m = _load_alias_map()
-    # 完全一致か、部分一致（prefix/contains）で拾う
-    if s in m:
-        return m[s]
-    for k, v in m.items():
-        if k and k in s:
-            return v
-    return None
+    # 完全一致 → 部分一致（最長のエイリアスが勝つ）
+    return _get_index().lookup(_width_fold(s))
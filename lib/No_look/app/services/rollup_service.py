@@ -0,0 +1,306 @@
+# app/services/rollup_service.py
+"""
+emotion_daily_rollup（クラス × ローカル日 × タイムゾーン の日次集計）の更新と読み出し。
+
+ダッシュボード系（teacher_dashboard / weekly_report / summary）は期間内の生ログを全部読んで
+Python で日毎に数えていたので、投稿数に比例して遅くなっていた。
+書き込み側（/analyze・/analyze/batch・/ask・再分類）が同じトランザクション内でこの表を増減し、
+読み出し側は「日数 × クラス数」行だけ読む。
+
+- 集計するタイムゾーンは NOLOOK_ROLLUP_TZS（カンマ区切り、既定 Asia/Tokyo）。
+  それ以外の tz が指定されたダッシュボードは従来どおり生ログから数える。
+- 1日1レコードの UPDATE は「前の状態を引いて、後の状態を足す」。感情が変われば件数が移り、
+  created_at が別のローカル日に移ればその日の件数も移る。
+- 生徒数は (クラス, 日, tz, 生徒) ごとの行数を emotion_daily_rollup_students に持ち、0↔1 の変化で増減する。
+- class_id が無い行は "" として数える（主キーに NULL を置けないため）。
+
+tz を追加したときなどは作り直す:
+    python -m app.services.rollup_service --rebuild
+"""
+from __future__ import annotations
+import logging
+import os
+from dataclasses import dataclass
+from datetime import date, datetime
+from functools import lru_cache
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+from zoneinfo import ZoneInfo
+
+from sqlalchemy import Table, and_, delete, func, insert, select, update
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+from app.core.localtime import local_parts, school_tz
+from app.models.orm import LABEL_COLUMNS, EmotionDailyRollup, EmotionDailyRollupStudent, EmotionLog, label_columns
+from app.models.schemas import Emotion
+
+logger = logging.getLogger(__name__)
+
+# 感情 → 列名の接尾辞（n_fun = 件数、p_fun = ラベル確率の合計）
+ROLLUP_COLUMNS: Dict[str, str] = {e.value: e.name for e in Emotion}
+EMOTIONS: Tuple[str, ...] = tuple(ROLLUP_COLUMNS)
+
+_ROLLUP: Table = EmotionDailyRollup.__table__
+_STUDENTS: Table = EmotionDailyRollupStudent.__table__
+
+Key = Tuple[str, str, str]  # (class_id, local_date, tz)
+
+
+@dataclass(frozen=True)
+class Entry:
+    """集計に効く1行分の状態（UPDATE 前後を比べるためのスナップショット）。"""
+    class_id: Optional[str]
+    student_id: Optional[str]
+    created_at: datetime
+    emotion: str
+    labels: Any  # 6列の値のタプル（LABEL_COLUMNS の順）か {感情: 確率}
+
+
+def entry(row: EmotionLog) -> Entry:
+    return Entry(row.class_id, row.student_id, row.created_at, row.emotion, row.label_vector())
+
+
+@lru_cache(maxsize=8)
+def _parse_tzs(raw: str) -> Tuple[str, ...]:
+    out: List[str] = []
+    for name in (s.strip() for s in raw.split(",")):
+        if not name or name in out:
+            continue
+        try:
+            ZoneInfo(name)
+        except Exception:
+            logger.warning("NOLOOK_ROLLUP_TZS: unknown time zone %r ignored", name)
+            continue
+        out.append(name)
+    return tuple(out)
+
+
+def rollup_tzs() -> Tuple[str, ...]:
+    """集計を持つタイムゾーン（IANA 名）。"""
+    return _parse_tzs(os.getenv("NOLOOK_ROLLUP_TZS", "Asia/Tokyo"))
+
+
+def _local_date(dt: datetime, tz: str) -> str:
+    return local_parts(dt, tz)[0]
+
+
+def _label_items(labels: Any) -> Iterable[Tuple[str, float]]:
+    if isinstance(labels, tuple):
+        # EmotionLog の p_* 列と集計表の p_* 列は同じ名前
+        return zip(LABEL_COLUMNS.values(), labels)
+    if not isinstance(labels, dict):
+        return ()
+    out = []
+    for k, v in labels.items():
+        col = ROLLUP_COLUMNS.get(k.strip() if isinstance(k, str) else k)
+        if col is None:
+            continue
+        try:
+            out.append((f"p_{col}", float(v)))
+        except (TypeError, ValueError):
+            continue
+    return out
+
+
+def _accumulate(acc: Dict[Key, Dict[str, float]], stu: Dict[Tuple[Key, str], int],
+                e: Entry, sign: int, tzs: Sequence[str]) -> None:
+    for tz in tzs:
+        key = (e.class_id or "", _local_date(e.created_at, tz), tz)
+        d = acc.setdefault(key, {})
+        d["total"] = d.get("total", 0) + sign
+        col = ROLLUP_COLUMNS.get((e.emotion or "").strip())
+        if col is not None:
+            d[f"n_{col}"] = d.get(f"n_{col}", 0) + sign
+        for name, v in _label_items(e.labels):
+            if v:
+                d[name] = d.get(name, 0.0) + sign * v
+        if e.student_id:
+            sk = (key, e.student_id)
+            stu[sk] = stu.get(sk, 0) + sign
+
+
+def _dialect_name(db) -> str:
+    # Session でも Connection でも受ける（移行からは Connection で呼ばれる）
+    bind = db if hasattr(db, "dialect") else db.get_bind()
+    return bind.dialect.name
+
+
+def _upsert_add(db, table: Table, key: Dict[str, Any], deltas: Dict[str, float]) -> None:
+    """key の行に deltas を足す（無ければ作る）。SQLite / PostgreSQL は1文で原子的に。"""
+    dialect = _dialect_name(db)
+    if dialect in ("sqlite", "postgresql"):
+        ins = (sqlite_insert if dialect == "sqlite" else pg_insert)(table).values(**key, **deltas)
+        ins = ins.on_conflict_do_update(
+            index_elements=list(key),
+            set_={c: table.c[c] + ins.excluded[c] for c in deltas},
+        )
+        db.execute(ins)
+        return
+    where = and_(*(table.c[k] == v for k, v in key.items()))
+    res = db.execute(update(table).where(where).values({c: table.c[c] + v for c, v in deltas.items()}))
+    if res.rowcount == 0:
+        db.execute(insert(table).values(**key, **deltas))
+
+
+def _student_transition(db, key: Key, student_id: str, delta: int) -> int:
+    """生徒のその日の行数を delta だけ動かし、生徒数の増減（-1/0/+1）を返す。"""
+    k = {"class_id": key[0], "local_date": key[1], "tz": key[2], "student_id": student_id}
+    _upsert_add(db, _STUDENTS, k, {"n": delta})
+    where = and_(*(_STUDENTS.c[c] == v for c, v in k.items()))
+    n = int(db.execute(select(_STUDENTS.c.n).where(where)).scalar() or 0)
+    before = n - delta
+    if n <= 0:
+        db.execute(delete(_STUDENTS).where(where))
+    if before <= 0 < n:
+        return 1
+    if n <= 0 < before:
+        return -1
+    return 0
+
+
+def apply_changes(db, pairs: Iterable[Tuple[Optional[Entry], Optional[Entry]]],
+                  tzs: Optional[Sequence[str]] = None) -> None:
+    """
+    (前, 後) の組を集計に反映する（INSERT は (None, 後)、UPDATE は (前, 後)）。
+    呼び出し側のトランザクションで実行し、commit は呼び出し側で行う。
+    """
+    tzs = rollup_tzs() if tzs is None else tuple(tzs)
+    if not tzs:
+        return
+    acc: Dict[Key, Dict[str, float]] = {}
+    stu: Dict[Tuple[Key, str], int] = {}
+    for before, after in pairs:
+        if before is not None:
+            _accumulate(acc, stu, before, -1, tzs)
+        if after is not None:
+            _accumulate(acc, stu, after, +1, tzs)
+
+    for (key, sid), delta in stu.items():
+        if delta:
+            moved = _student_transition(db, key, sid, delta)
+            if moved:
+                d = acc.setdefault(key, {})
+                d["students"] = d.get("students", 0) + moved
+
+    for key, deltas in acc.items():
+        deltas = {c: v for c, v in deltas.items() if v}
+        if deltas:
+            _upsert_add(db, _ROLLUP, {"class_id": key[0], "local_date": key[1], "tz": key[2]}, deltas)
+
+
+def read_daily(db, tz: str, start: date, end: date,
+               class_id: Optional[str] = None) -> Optional[Dict[str, Dict[str, Any]]]:
+    """
+    {"YYYY-MM-DD": {"counts": {感情: 件数}, "total": 件数, "students": 人数, "label_sums": {...}}}
+    - tz の集計を持っていれば集計表から（「日数 × クラス数」行）
+    - 学校の tz なら生ログの local_date で GROUP BY（SQL 内で完結。label_sums は SUM(p_*)）
+    - どちらでもなければ None（呼び出し側が生ログを行ごとに変換して数える）
+    class_id=None は全クラスの合計（集計表からの生徒数はクラスごとの人数の和）。
+    """
+    if tz not in rollup_tzs():
+        if tz == school_tz():
+            return _daily_from_local_date(db, start, end, class_id)
+        return None
+    cols = ["total", "students"] + [f"n_{c}" for c in ROLLUP_COLUMNS.values()] \
+        + [f"p_{c}" for c in ROLLUP_COLUMNS.values()]
+    conds = [_ROLLUP.c.tz == tz,
+             _ROLLUP.c.local_date >= start.isoformat(),
+             _ROLLUP.c.local_date <= end.isoformat()]
+    if class_id is not None:
+        conds.append(_ROLLUP.c.class_id == class_id)
+    stmt = (
+        select(_ROLLUP.c.local_date, *(func.sum(_ROLLUP.c[c]).label(c) for c in cols))
+        .where(and_(*conds))
+        .group_by(_ROLLUP.c.local_date)
+    )
+    out: Dict[str, Dict[str, Any]] = {}
+    for r in db.execute(stmt).mappings():
+        out[r["local_date"]] = {
+            "counts": {e: int(r[f"n_{c}"] or 0) for e, c in ROLLUP_COLUMNS.items()},
+            "total": int(r["total"] or 0),
+            "students": int(r["students"] or 0),
+            "label_sums": {e: float(r[f"p_{c}"] or 0.0) for e, c in ROLLUP_COLUMNS.items()},
+        }
+    return out
+
+
+def _daily_from_local_date(db, start: date, end: date, class_id: Optional[str]) -> Dict[str, Dict[str, Any]]:
+    conds = [EmotionLog.local_date >= start.isoformat(), EmotionLog.local_date <= end.isoformat()]
+    if class_id is not None:
+        conds.append(EmotionLog.class_id == class_id)
+    out: Dict[str, Dict[str, Any]] = {}
+    stmt = (
+        select(EmotionLog.local_date, EmotionLog.emotion, func.count())
+        .where(and_(*conds))
+        .group_by(EmotionLog.local_date, EmotionLog.emotion)
+    )
+    for d, emotion, n in db.execute(stmt):
+        day = out.setdefault(d, {"counts": {e: 0 for e in EMOTIONS}, "total": 0, "students": 0})
+        day["total"] += n
+        e = (emotion or "").strip()
+        if e in day["counts"]:
+            day["counts"][e] += n
+    stmt = (
+        select(EmotionLog.local_date, func.count(func.distinct(EmotionLog.student_id)),
+               *(func.sum(c) for c in label_columns()))
+        .where(and_(*conds))
+        .group_by(EmotionLog.local_date)
+    )
+    for d, n, *sums in db.execute(stmt):
+        out[d]["students"] = int(n)
+        out[d]["label_sums"] = {e: float(v or 0.0) for e, v in zip(LABEL_COLUMNS, sums)}
+    return out
+
+
+def rebuild(db, tzs: Optional[Sequence[str]] = None, batch_size: int = 5000) -> int:
+    """
+    生ログから集計を作り直す（tzs の分だけ消して入れ直す）。読んだ行数を返す。
+    メモリは「日数 × クラス数 × tz」と「生徒 × 日」分だけ（ログ件数には比例しない）。
+    """
+    tzs = rollup_tzs() if tzs is None else tuple(tzs)
+    if not tzs:
+        return 0
+    acc: Dict[Key, Dict[str, float]] = {}
+    stu: Dict[Tuple[Key, str], int] = {}
+    n = 0
+    stmt = select(EmotionLog.class_id, EmotionLog.student_id, EmotionLog.created_at,
+                  EmotionLog.emotion, *label_columns()).execution_options(yield_per=batch_size)
+    for row in db.execute(stmt):
+        _accumulate(acc, stu, Entry(*row[:4], tuple(row[4:])), +1, tzs)
+        n += 1
+
+    students: Dict[Key, int] = {}
+    for (key, _), cnt in stu.items():
+        if cnt > 0:
+            students[key] = students.get(key, 0) + 1
+
+    db.execute(delete(_ROLLUP).where(_ROLLUP.c.tz.in_(tzs)))
+    db.execute(delete(_STUDENTS).where(_STUDENTS.c.tz.in_(tzs)))
+    if acc:
+        zero = {c.name: 0 for c in _ROLLUP.c if c.name not in ("class_id", "local_date", "tz")}
+        db.execute(insert(_ROLLUP), [
+            {**zero, **d, "class_id": k[0], "local_date": k[1], "tz": k[2], "students": students.get(k, 0)}
+            for k, d in acc.items()
+        ])
+    rows = [{"class_id": k[0], "local_date": k[1], "tz": k[2], "student_id": sid, "n": cnt}
+            for (k, sid), cnt in stu.items() if cnt > 0]
+    if rows:
+        db.execute(insert(_STUDENTS), rows)
+    return n
+
+
+if __name__ == "__main__":
+    import argparse
+
+    from app.core.db import SessionLocal, init_db
+
+    parser = argparse.ArgumentParser(description="Rebuild emotion_daily_rollup from emotion_logs.")
+    parser.add_argument("--rebuild", action="store_true", help="Recompute the rollup for the given time zones.")
+    parser.add_argument("--tz", nargs="*", help="Time zones to rebuild (default: NOLOOK_ROLLUP_TZS).")
+    args = parser.parse_args()
+    init_db()
+    if args.rebuild:
+        with SessionLocal() as s:
+            scanned = rebuild(s, args.tz or None)
+            s.commit()
+        print(f"rebuilt from {scanned} rows")
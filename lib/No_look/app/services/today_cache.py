@@ -0,0 +1,134 @@
+# app/services/today_cache.py
+"""
+/analyze の「今日の行」の状態をプロセス内に覚えておく（生徒ごと、LRU）。
+
+1日1レコードの更新は前回のブレンド結果（prev）が要るので、メッセージごとに
+INSERT の衝突 → SELECT ... FOR UPDATE で行を読み直していた。
+commit した直後の状態（行 id・6ラベル・感情・スコア・補助指標・created_at）をここに書き込み（write-through）、
+次のメッセージでは読み直さずに主キー指定の UPDATE だけで済ませる。
+
+- キーは (class_id, student_id, 学校ローカル日)。日付が変わったら（NOLOOK_SCHOOL_TZ の0時）全部捨てる
+- 件数上限 NOLOOK_TODAY_CACHE_SIZE（既定 10000、0 で無効）。超えたら最も古く使われたものから捨てる
+- スレッドセーフ（スレッドプール上の同期 Session から呼ばれる）
+- 古い状態を信じて上書きしないよう、UPDATE は覚えている値と行の値が一致するときだけ当たる
+  （別プロセス・/analyze/batch・再分類が先に書いていたら0行 → 捨てて DB から読み直す）
+
+ヒット/ミス/食い違いの件数は nolik_today_cache_{hits,misses,stale}。
+"""
+from __future__ import annotations
+import os
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Any, Dict, Optional, Tuple
+
+try:
+    from app.metrics import TODAY_CACHE_HITS, TODAY_CACHE_MISSES, TODAY_CACHE_STALE
+except Exception:  # メトリクスは任意
+    TODAY_CACHE_HITS = TODAY_CACHE_MISSES = TODAY_CACHE_STALE = None
+
+DEFAULT_MAXSIZE = 10000
+
+Key = Tuple[str, str]  # (class_id, student_id)
+
+
+@dataclass(frozen=True)
+class TodayState:
+    """commit 済みの今日の行（UPDATE の WHERE に使うので、DB に書いた値そのもの）。"""
+    row_id: int
+    created_at: datetime
+    emotion: str
+    score: float
+    vector: Tuple[float, ...]          # 6ラベル（LABEL_COLUMNS の順）
+    topic_tags: Tuple[str, ...]
+    relationship_mention: bool
+    negation_index: int
+    avoidance: int
+
+    def signals(self) -> Dict[str, Any]:
+        return {
+            "topic_tags": list(self.topic_tags),
+            "relationship_mention": self.relationship_mention,
+            "negation_index": self.negation_index,
+            "avoidance": self.avoidance,
+        }
+
+
+class TodayCache:
+    """(class_id, student_id) → 今日の TodayState。日付が進んだら中身を全部捨てる。"""
+
+    def __init__(self, maxsize: int = DEFAULT_MAXSIZE):
+        self.maxsize = maxsize
+        self._data: "OrderedDict[Key, TodayState]" = OrderedDict()
+        self._day: Optional[str] = None
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.stale = 0
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def _roll(self, day: str) -> None:
+        # ロック内で呼ぶ
+        if day != self._day:
+            self._data.clear()
+            self._day = day
+
+    def get(self, class_id: str, student_id: str, day: str) -> Optional[TodayState]:
+        if self.maxsize <= 0:
+            return None
+        with self._lock:
+            self._roll(day)
+            state = self._data.get((class_id, student_id))
+            if state is not None:
+                self._data.move_to_end((class_id, student_id))
+                self.hits += 1
+            else:
+                self.misses += 1
+        counter = TODAY_CACHE_HITS if state is not None else TODAY_CACHE_MISSES
+        if counter is not None:
+            counter.inc()
+        return state
+
+    def put(self, class_id: str, student_id: str, day: str, state: TodayState) -> None:
+        if self.maxsize <= 0:
+            return
+        with self._lock:
+            if self._day is not None and day < self._day:
+                return  # 日付をまたいだ遅いリクエストの結果で新しい日を巻き戻さない
+            self._roll(day)
+            self._data[(class_id, student_id)] = state
+            self._data.move_to_end((class_id, student_id))
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def discard(self, class_id: str, student_id: str, stale: bool = False) -> None:
+        with self._lock:
+            self._data.pop((class_id, student_id), None)
+            if stale:
+                self.stale += 1
+        if stale and TODAY_CACHE_STALE is not None:
+            TODAY_CACHE_STALE.inc()
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def stats(self) -> Dict[str, int]:
+        return {"size": len(self._data), "maxsize": self.maxsize,
+                "hits": self.hits, "misses": self.misses, "stale": self.stale}
+
+
+def _env_int(name: str, default: int) -> int:
+    try:
+        return int(os.getenv(name, str(default)))
+    except ValueError:
+        return default
+
+
+today_cache = TodayCache(_env_int("NOLOOK_TODAY_CACHE_SIZE", DEFAULT_MAXSIZE))
+
+
+__all__ = ["TodayCache", "TodayState", "today_cache"]
@@ -0,0 +1,2 @@
+# bench/__init__.py
+"""分類器のスループット計測（python -m bench.run）。"""
@@ -0,0 +1,132 @@
+# bench/adversarial.py
+"""
+長文・病的入力での分類時間の上限チェック（ファズ兼ベンチマーク）。
+
+    python -m bench.adversarial                         # 10k / 100k / 1M 文字
+    python -m bench.adversarial --sizes 10000 50000 --max-us-per-kb 5000
+
+生徒が長文を貼り付けても分類が入力長に比例する（O(n)）ことを確かめる。
+各エントリポイント × 入力の種類 × 長さで呼び（--repeat 回のうち最速）、1KB あたりの時間を出す。
+  - --max-us-per-kb: 1KB あたりの上限（超えたら終了コード1）
+  - --max-growth: 最短と最長で 1KB あたりの時間が何倍まで増えてよいか（O(n^2) の検出）
+"""
+from __future__ import annotations
+import argparse
+import json
+import random
+import sys
+import time
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Sequence
+
+BASE_DIR = Path(__file__).resolve().parents[1]
+if str(BASE_DIR) not in sys.path:
+    sys.path.insert(0, str(BASE_DIR))
+
+from bench.run import entry_points  # noqa: E402
+
+DEFAULT_SIZES = (10_000, 100_000, 1_000_000)
+
+# 「A.*B」の A だけが並ぶ・同じ文字の連続・ヒット/否定が密集、など
+# 素朴な正規表現やヒット処理が入力長の2乗になりやすい形
+_REPEATED_UNITS = {
+    "prefix:学校": "学校",
+    "prefix:好き": "好き",
+    "prefix:どうやったら": "どうやったら",
+    "prefix:昨日": "昨日",
+    "run:あ": "あ",
+    "run:ー": "ー",
+    "dense:嬉しくない！": "嬉しくない！",
+    "dense:ないない": "ない",
+    "lines:学校": "学校\n",
+}
+_FUZZ_TOKENS = (
+    "学校", "好き", "嫌い", "楽しい", "どうやったら", "できる", "昨日", "しんどかった", "今日は",
+    "大丈夫", "不安", "ない", "無理", "！", "ー", "w", "😭", "ｳﾚｼｲ", "\n", "、", "あ",
+)
+
+
+def adversarial_inputs(size: int, seed: int = 20261017) -> Dict[str, str]:
+    """{種類: size 文字の文字列}。fuzz は _FUZZ_TOKENS を seed で並べたもの。"""
+    out = {name: (unit * (size // len(unit) + 1))[:size] for name, unit in _REPEATED_UNITS.items()}
+    rng = random.Random(seed)
+    parts: List[str] = []
+    n = 0
+    while n < size:
+        tok = rng.choice(_FUZZ_TOKENS)
+        parts.append(tok)
+        n += len(tok)
+    out["fuzz"] = "".join(parts)[:size]
+    return out
+
+
+def time_per_kb(fn: Callable[[str], Any], text: str, repeat: int = 1) -> float:
+    """repeat 回のうち最速の1回（GC などの揺れを除く）。"""
+    best = float("inf")
+    for _ in range(max(1, repeat)):
+        t0 = time.perf_counter()
+        fn(text)
+        best = min(best, time.perf_counter() - t0)
+    return best * 1e6 / (len(text) / 1024)
+
+
+def run(sizes: Sequence[int], only: Optional[Sequence[str]] = None, seed: int = 20261017,
+        repeat: int = 1) -> Dict[str, Dict[str, float]]:
+    """{"entry/input": {"<size>": µs/KB, ...}}"""
+    eps = entry_points()
+    if only:
+        eps = {k: v for k, v in eps.items() if k in only}
+    inputs = {size: adversarial_inputs(size, seed) for size in sizes}
+    results: Dict[str, Dict[str, float]] = {}
+    for name, fn in eps.items():
+        fn("ウォームアップ")
+        for size in sizes:
+            for kind, text in inputs[size].items():
+                results.setdefault(f"{name}/{kind}", {})[str(size)] = round(time_per_kb(fn, text, repeat), 1)
+    return results
+
+
+def check(results: Dict[str, Dict[str, float]], max_us_per_kb: float, max_growth: float) -> List[str]:
+    """上限超え・長さに対する伸び過ぎ（2乗の兆候）を列挙する。"""
+    bad = []
+    for key, by_size in results.items():
+        sizes = sorted(by_size, key=int)
+        for s in sizes:
+            if by_size[s] > max_us_per_kb:
+                bad.append(f"{key}@{s}: {by_size[s]:.0f} us/KB > {max_us_per_kb:.0f}")
+        if len(sizes) > 1 and by_size[sizes[0]] > 0:
+            growth = by_size[sizes[-1]] / by_size[sizes[0]]
+            if growth > max_growth:
+                bad.append(f"{key}: us/KB grew x{growth:.1f} from {sizes[0]} to {sizes[-1]} chars")
+    return bad
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Time classifiers on long adversarial inputs.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=list(DEFAULT_SIZES), help="Input lengths in characters.")
+    parser.add_argument("--only", nargs="*", help="Entry point names to run.")
+    parser.add_argument("--seed", type=int, default=20261017)
+    parser.add_argument("--max-us-per-kb", type=float, default=10_000.0, help="Upper bound per KB of input.")
+    parser.add_argument("--max-growth", type=float, default=3.0, help="Allowed us/KB ratio between largest and smallest size.")
+    parser.add_argument("--repeat", type=int, default=1, help="Calls per input; the fastest one is reported.")
+    parser.add_argument("--out", type=Path, help="Write results as JSON.")
+    args = parser.parse_args(argv)
+
+    results = run(args.sizes, args.only, args.seed, args.repeat)
+    if args.out:
+        args.out.parent.mkdir(parents=True, exist_ok=True)
+        args.out.write_text(json.dumps(results, ensure_ascii=False, indent=2), encoding="utf-8")
+
+    sizes = [str(s) for s in args.sizes]
+    print(f"{'entry/input (us/KB)':<64} " + " ".join(f"{s:>10}" for s in sizes))
+    for key, by_size in results.items():
+        print(f"{key:<64} " + " ".join(f"{by_size[s]:>10.0f}" for s in sizes))
+
+    bad = check(results, args.max_us_per_kb, args.max_growth)
+    for line in bad:
+        print(f"SLOW {line}")
+    return 1 if bad else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
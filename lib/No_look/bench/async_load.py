@@ -0,0 +1,142 @@
+# bench/async_load.py
+"""
+同期 Session（スレッドプール）と非同期 Session（AsyncSession）で、同時接続数ごとのスループットと裾の遅延を比べる。
+
+    python -m bench.async_load                              # sync / async × 同時 10・50・200
+    python -m bench.async_load --concurrency 20 100 400 --seconds 10
+
+- sync:  NOLOOK_DB_ASYNC=0。DB 処理は anyio のスレッドプール（既定 40 本）で同期 Session を使う
+         （async 化前の def ルートと同じ上限）
+- async: NOLOOK_DB_ASYNC=1。aiosqlite / psycopg の AsyncSession を run_sync で使う
+仮想ユーザー（= 生徒、それぞれ別の Cookie）が待ち時間なしで投げ続ける閉ループ。
+4回に3回 /analyze（1日1レコードの UPDATE/INSERT）、残りは /teacher_dashboard を読む。
+モード × 同時数ごとに一時ディレクトリの新しい DB で測り、req/s・p50/p99/max（ms）・エラー数を出す。
+"""
+from __future__ import annotations
+import argparse
+import asyncio
+import importlib
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence
+
+BASE_DIR = Path(__file__).resolve().parents[1]
+if str(BASE_DIR) not in sys.path:
+    sys.path.insert(0, str(BASE_DIR))
+
+from bench.run import DEFAULT_OUT_DIR, _git_commit, _quantile  # noqa: E402
+
+MODES = {"sync": "0", "async": "1"}
+_TEXTS = ("テスト合格！嬉しい", "部活で疲れた", "明日の発表が不安", "友達とケンカしてムカつく", "今日は普通")
+
+
+def _load_app(db_path: Path, mode: str):
+    """conftest と同じく、環境変数を反映させてから DB → 本体の順に読み直す。"""
+    os.environ["DATABASE_URL"] = f"sqlite:///{db_path}"
+    os.environ["NOLOOK_DB_ASYNC"] = MODES[mode]
+    os.environ.setdefault("NOLOOK_CLASS_ID_STRICT", "0")
+    os.environ.setdefault("DISABLE_RATE_LIMIT", "1")
+    import app.core.db as coredb
+    import app.main as mainmod
+    importlib.reload(coredb)
+    importlib.reload(mainmod)
+    coredb.init_db()
+    return mainmod.app, coredb
+
+
+async def _user(client, uid: int, deadline: float, lat: List[float], errors: List[int]) -> None:
+    cookies = {"nll_sid": f"bench-{uid}"}
+    i = 0
+    while time.perf_counter() < deadline:
+        t0 = time.perf_counter()
+        try:
+            if i % 4 == 3:
+                r = await client.get("/teacher_dashboard", params={"class_id": "bench-A", "days": 7})
+            else:
+                r = await client.post("/analyze", cookies=cookies,
+                                      json={"text": _TEXTS[(uid + i) % len(_TEXTS)], "class_id": "bench-A"})
+            ok = r.status_code == 200
+        except Exception:
+            ok = False
+        lat.append(time.perf_counter() - t0)
+        if not ok:
+            errors.append(1)
+        i += 1
+
+
+async def _drive(app, concurrency: int, seconds: float) -> Dict[str, Any]:
+    import httpx
+
+    lat: List[float] = []
+    errors: List[int] = []
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=60.0) as client:
+        deadline = time.perf_counter() + seconds
+        await asyncio.gather(*(_user(client, u, deadline, lat, errors) for u in range(concurrency)))
+    lat.sort()
+    return {
+        "requests": len(lat),
+        "per_sec": round(len(lat) / seconds, 1),
+        "p50_ms": round(_quantile(lat, 0.50) * 1e3, 2),
+        "p99_ms": round(_quantile(lat, 0.99) * 1e3, 2),
+        "max_ms": round(lat[-1] * 1e3, 2) if lat else 0.0,
+        "mean_ms": round(statistics.fmean(lat) * 1e3, 2) if lat else 0.0,
+        "errors": len(errors),
+    }
+
+
+def run_mode(mode: str, concurrency: int, seconds: float) -> Dict[str, Any]:
+    with tempfile.TemporaryDirectory(prefix="nolook_asyncbench_") as tmp:
+        app, coredb = _load_app(Path(tmp) / "bench.db", mode)
+        try:
+            return asyncio.run(_drive(app, concurrency, seconds))
+        finally:
+            if coredb.async_engine is not None:
+                asyncio.run(coredb.dispose_async_engine())
+            coredb.engine.dispose()
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Compare sync vs async DB sessions under concurrent load.")
+    parser.add_argument("--modes", nargs="+", default=list(MODES), choices=list(MODES), help="Session modes to run.")
+    parser.add_argument("--concurrency", nargs="+", type=int, default=[10, 50, 200], help="Virtual users per run.")
+    parser.add_argument("--seconds", type=float, default=5.0, help="Duration per run.")
+    parser.add_argument("--out", type=Path, help="Output JSON path (default: bench_results/async-<commit>.json).")
+    args = parser.parse_args(argv)
+
+    saved = {k: os.environ.get(k) for k in ("DATABASE_URL", "NOLOOK_DB_ASYNC")}
+    results: Dict[str, Dict[str, Any]] = {}
+    try:
+        for mode in args.modes:
+            results[mode] = {str(c): run_mode(mode, c, args.seconds) for c in args.concurrency}
+    finally:
+        for k, v in saved.items():
+            if v is None:
+                os.environ.pop(k, None)
+            else:
+                os.environ[k] = v
+
+    report = {
+        "meta": {"commit": _git_commit(), "concurrency": args.concurrency, "seconds": args.seconds},
+        "results": results,
+    }
+    out = args.out or DEFAULT_OUT_DIR / f"async-{report['meta']['commit'] or 'local'}.json"
+    out.parent.mkdir(parents=True, exist_ok=True)
+    out.write_text(json.dumps(report, ensure_ascii=False, indent=2), encoding="utf-8")
+
+    print(f"{'mode':<6} {'users':>6} {'req/s':>8} {'p50':>8} {'p99':>8} {'max':>8} {'err':>5}")
+    for mode, per_c in results.items():
+        for c, r in per_c.items():
+            print(f"{mode:<6} {c:>6} {r['per_sec']:>8.1f} {r['p50_ms']:>8.1f} {r['p99_ms']:>8.1f} "
+                  f"{r['max_ms']:>8.1f} {r['errors']:>5}")
+    print(f"saved: {out}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
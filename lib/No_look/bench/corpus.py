@@ -0,0 +1,70 @@
+# bench/corpus.py
+"""
+ベンチマーク用の合成コーパス（生徒メッセージ風）。
+
+seed が同じなら同じコーパスを返す（コミット間で結果を比べるため）。
+ルールファイルの語彙とは独立に持つ（ルールを変えてもコーパスは変わらない）。
+- 定型の短文（「疲れた」「だるい」など。実運用どおり同じ文が何度も出る）
+- 絵文字・全角英数/記号・半角カナ・長音/連続文字・否定形を混ぜた文
+- 数KBの長文（日記・相談のような貼り付け）
+"""
+from __future__ import annotations
+import random
+from typing import Dict, List
+
+STOCK = [
+    "疲れた", "だるい", "テストやばい", "眠い", "楽しかった！", "ムカつく", "不安",
+    "しんどい", "普通", "おはよう", "こんにちは", "うれしい", "最悪", "無理",
+]
+
+SUBJECTS = ["今日", "昨日", "部活", "テスト", "友達", "先生", "家", "塾", "体育", "発表", "受験", "バイト"]
+FEELINGS = [
+    "楽しい", "嬉しい", "最高", "悲しい", "つらい", "寂しい", "イライラする", "ムカつく",
+    "不安", "心配", "緊張する", "疲れた", "しんどい", "だるい", "眠い", "限界", "落ち込んだ",
+    "ワクワクする", "ほっとした", "モヤモヤする", "自信ある",
+]
+NEGATED = ["楽しくない", "嬉しくなかった", "不安じゃない", "しんどくない", "つらくはない", "無理じゃない"]
+FILLERS = ["けど", "でも", "から", "ので", "し", "って", "かも", "かな", "だった", "すぎ"]
+EMOJI = ["😀", "😭", "🔥", "💦", "😡", "🥺", "✨", "🙏"]
+WIDE = ["！", "？", "ＴＥＳＴ", "１２３", "（笑）", "ｗｗ", "ﾑｶつく", "ﾔﾊﾞｲ"]
+VOWELS = ["ーー", "ーーー", "〜〜", "ぁぁ", "!!!", "…"]
+
+
+def _sentence(rng: random.Random) -> str:
+    parts = [rng.choice(SUBJECTS), "は"]
+    for _ in range(rng.randint(1, 3)):
+        parts.append(rng.choice(NEGATED) if rng.random() < 0.2 else rng.choice(FEELINGS))
+        if rng.random() < 0.3:
+            parts.append(rng.choice(VOWELS))
+        parts.append(rng.choice(FILLERS))
+    if rng.random() < 0.35:
+        parts.append(rng.choice(EMOJI))
+    if rng.random() < 0.25:
+        parts.append(rng.choice(WIDE))
+    parts.append(rng.choice(["。", "！", "", "…"]))
+    return "".join(parts)
+
+
+def generate_corpus(seed: int = 20261017, n_short: int = 2000, n_long: int = 50,
+                    long_chars: int = 2000) -> Dict[str, List[str]]:
+    """{"short": [...], "long": [...]} を返す。short の約3割は定型文の繰り返し。"""
+    rng = random.Random(seed)
+    short: List[str] = []
+    for _ in range(n_short):
+        if rng.random() < 0.3:
+            short.append(rng.choice(STOCK))
+        else:
+            short.append(_sentence(rng))
+    long: List[str] = []
+    for _ in range(n_long):
+        buf: List[str] = []
+        size = 0
+        while size < long_chars:
+            s = _sentence(rng)
+            buf.append(s)
+            size += len(s)
+        long.append("\n".join(buf) if rng.random() < 0.5 else "".join(buf))
+    return {"short": short, "long": long}
+
+
+__all__ = ["generate_corpus"]
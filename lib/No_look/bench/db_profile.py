@@ -0,0 +1,165 @@
+# bench/db_profile.py
+"""
+SQLite 接続プロファイル（app/core/db.py の PRAGMA）ごとの /analyze 書き込みスループット。
+
+    python -m bench.db_profile                           # off（素の SQLite）と fast（WAL 等）を比較
+    python -m bench.db_profile --writers 8 --readers 4 --seconds 10
+
+クラス全員が一斉に投稿している間に教師ダッシュボードが読み続ける状況を再現する。
+- writers: 各スレッドが /analyze を投稿し続ける（スレッド＝生徒、2回目以降は同じ日の UPDATE）
+- readers: 各スレッドが /teacher_dashboard を読み続ける
+プロファイル毎に一時ディレクトリの新しい DB で測り、writes/s・reads/s・p50/p99（ms）・エラー数と
+接続プールの平均待ち時間（NOLOOK_DB_POOL_SIZE 等を決める目安）を出す。
+"""
+from __future__ import annotations
+import argparse
+import importlib
+import json
+import os
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+BASE_DIR = Path(__file__).resolve().parents[1]
+if str(BASE_DIR) not in sys.path:
+    sys.path.insert(0, str(BASE_DIR))
+
+from bench.run import DEFAULT_OUT_DIR, _git_commit, _quantile  # noqa: E402
+
+PROFILES = ("off", "fast")
+_TEXTS = ("テスト合格！嬉しい", "部活で疲れた", "明日の発表が不安", "友達とケンカしてムカつく", "今日は普通")
+
+
+def _load_app(db_path: Path, profile: str):
+    """conftest と同じく、環境変数を反映させてから DB → 本体の順に読み直す。"""
+    os.environ["DATABASE_URL"] = f"sqlite:///{db_path}"
+    os.environ["NOLOOK_SQLITE_PROFILE"] = profile
+    os.environ.setdefault("NOLOOK_CLASS_ID_STRICT", "0")
+    os.environ.setdefault("DISABLE_RATE_LIMIT", "1")
+    import app.core.db as coredb
+    import app.main as mainmod
+    importlib.reload(coredb)
+    importlib.reload(mainmod)
+    coredb.init_db()
+    return mainmod.app, coredb
+
+
+def _worker(app, stop: threading.Event, fn, lat: List[float], errors: List[int]) -> None:
+    from fastapi.testclient import TestClient
+
+    with TestClient(app) as client:
+        i = 0
+        while not stop.is_set():
+            t0 = time.perf_counter()
+            try:
+                ok = fn(client, i)
+            except Exception:
+                ok = False
+            lat.append(time.perf_counter() - t0)
+            if not ok:
+                errors.append(1)
+            i += 1
+
+
+def _post(client, i: int) -> bool:
+    r = client.post("/analyze", json={"text": _TEXTS[i % len(_TEXTS)], "class_id": "bench-A"})
+    return r.status_code == 200
+
+
+def _read(client, i: int) -> bool:
+    r = client.get("/teacher_dashboard", params={"class_id": "bench-A", "days": 7})
+    return r.status_code == 200
+
+
+def _pool_wait() -> Tuple[float, float]:
+    """接続プールの待ち時間（nolik_db_pool_checkout_seconds）の (合計秒, 回数)。"""
+    from prometheus_client import REGISTRY
+
+    return (REGISTRY.get_sample_value("nolik_db_pool_checkout_seconds_sum") or 0.0,
+            REGISTRY.get_sample_value("nolik_db_pool_checkout_seconds_count") or 0.0)
+
+
+def _summary(lat: List[float], errors: List[int], seconds: float) -> Dict[str, float]:
+    lat = sorted(lat)
+    return {
+        "requests": len(lat),
+        "per_sec": round(len(lat) / seconds, 1),
+        "p50_ms": round(_quantile(lat, 0.50) * 1e3, 2),
+        "p99_ms": round(_quantile(lat, 0.99) * 1e3, 2),
+        "mean_ms": round(statistics.fmean(lat) * 1e3, 2) if lat else 0.0,
+        "errors": len(errors),
+    }
+
+
+def run_profile(profile: str, writers: int, readers: int, seconds: float) -> Dict[str, Any]:
+    with tempfile.TemporaryDirectory(prefix="nolook_dbbench_") as tmp:
+        app, coredb = _load_app(Path(tmp) / "bench.db", profile)
+        pragmas = coredb.verify_sqlite_pragmas()
+        wait0 = _pool_wait()
+        stop = threading.Event()
+        w_lat: List[float] = []
+        r_lat: List[float] = []
+        w_err: List[int] = []
+        r_err: List[int] = []
+        threads = [threading.Thread(target=_worker, args=(app, stop, _post, w_lat, w_err)) for _ in range(writers)]
+        threads += [threading.Thread(target=_worker, args=(app, stop, _read, r_lat, r_err)) for _ in range(readers)]
+        for t in threads:
+            t.start()
+        time.sleep(seconds)
+        stop.set()
+        for t in threads:
+            t.join()
+        wait_sum, wait_n = (a - b for a, b in zip(_pool_wait(), wait0))
+        coredb.engine.dispose()
+    return {
+        "pragmas": {k: v["actual"] for k, v in pragmas.items()},
+        "pool": {**coredb.POOL_SETTINGS, "checkouts": int(wait_n),
+                 "mean_wait_ms": round(wait_sum / wait_n * 1e3, 3) if wait_n else 0.0},
+        "writes": _summary(w_lat, w_err, seconds),
+        "reads": _summary(r_lat, r_err, seconds),
+    }
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Compare /analyze write throughput per SQLite profile.")
+    parser.add_argument("--profiles", nargs="+", default=list(PROFILES), help="NOLOOK_SQLITE_PROFILE values to run.")
+    parser.add_argument("--writers", type=int, default=8, help="Threads posting /analyze.")
+    parser.add_argument("--readers", type=int, default=4, help="Threads reading /teacher_dashboard.")
+    parser.add_argument("--seconds", type=float, default=5.0, help="Duration per profile.")
+    parser.add_argument("--out", type=Path, help="Output JSON path (default: bench_results/db-<commit>.json).")
+    args = parser.parse_args(argv)
+
+    saved = {k: os.environ.get(k) for k in ("DATABASE_URL", "NOLOOK_SQLITE_PROFILE")}
+    try:
+        results = {p: run_profile(p, args.writers, args.readers, args.seconds) for p in args.profiles}
+    finally:
+        for k, v in saved.items():
+            if v is None:
+                os.environ.pop(k, None)
+            else:
+                os.environ[k] = v
+
+    report = {
+        "meta": {"commit": _git_commit(), "writers": args.writers, "readers": args.readers, "seconds": args.seconds},
+        "results": results,
+    }
+    out = args.out or DEFAULT_OUT_DIR / f"db-{report['meta']['commit'] or 'local'}.json"
+    out.parent.mkdir(parents=True, exist_ok=True)
+    out.write_text(json.dumps(report, ensure_ascii=False, indent=2), encoding="utf-8")
+
+    print(f"{'profile':<8} {'writes/s':>9} {'w p50':>8} {'w p99':>8} {'w err':>6} {'reads/s':>9} {'r p99':>8} "
+          f"{'r err':>6} {'pool ms':>8}")
+    for name, r in results.items():
+        w, rd = r["writes"], r["reads"]
+        print(f"{name:<8} {w['per_sec']:>9.1f} {w['p50_ms']:>8.1f} {w['p99_ms']:>8.1f} {w['errors']:>6} "
+              f"{rd['per_sec']:>9.1f} {rd['p99_ms']:>8.1f} {rd['errors']:>6} {r['pool']['mean_wait_ms']:>8.3f}")
+    print(f"saved: {out}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
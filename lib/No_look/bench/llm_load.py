@@ -0,0 +1,142 @@
+# bench/llm_load.py
+"""
+上流 LLM が健全・遅い・落ちているときの /ask の req/s と裾の遅延（ローカルスタブで再現、ネット不要）。
+
+    python -m bench.llm_load                                   # healthy / slow / failing × 同時 50
+    python -m bench.llm_load --concurrency 200 --seconds 10 --timeout-ms 1500
+
+- healthy: スタブは 300ms で返す
+- slow:    スタブは 10 秒かかる（NOLOOK_LLM_TIMEOUT_MS で打ち切られ、ルール返信になる）
+- failing: スタブは毎回 500（ブレーカーが開き、上流を呼ばずにルール返信になる）
+シナリオごとに一時ディレクトリの新しい DB で測り、req/s・p50/p99/max（ms）・LLM 採用率・
+スタブが実際に受けた件数と最大同時処理数（NOLOOK_LLM_MAX_INFLIGHT 以下のはず）を出す。
+"""
+from __future__ import annotations
+import argparse
+import asyncio
+import json
+import os
+import sys
+import tempfile
+import time
+from collections import Counter
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence
+
+BASE_DIR = Path(__file__).resolve().parents[1]
+if str(BASE_DIR) not in sys.path:
+    sys.path.insert(0, str(BASE_DIR))
+
+from bench.async_load import _load_app  # noqa: E402
+from bench.llm_stub import make_app as make_stub  # noqa: E402
+from bench.run import DEFAULT_OUT_DIR, _git_commit, _quantile  # noqa: E402
+
+SCENARIOS = {
+    "healthy": {"latency_ms": 300.0, "error_rate": 0.0},
+    "slow": {"latency_ms": 10000.0, "error_rate": 0.0},
+    "failing": {"latency_ms": 50.0, "error_rate": 1.0},
+}
+_TEXTS = ("テスト合格！嬉しい", "部活で疲れた", "明日の発表が不安", "友達とケンカしてムカつく", "今日は普通")
+
+
+async def _user(client, uid: int, deadline: float, lat: List[float], reasons: Counter) -> None:
+    cookies = {"nll_sid": f"llm-bench-{uid}"}
+    i = 0
+    while time.perf_counter() < deadline:
+        t0 = time.perf_counter()
+        try:
+            r = await client.post("/ask", cookies=cookies,
+                                  json={"prompt": _TEXTS[(uid + i) % len(_TEXTS)], "class_id": "bench-L"})
+            body = r.json() if r.status_code == 200 else {}
+            reasons["llm" if body.get("used_llm") else (body.get("llm_reason") or f"http_{r.status_code}")] += 1
+        except Exception as e:
+            reasons[type(e).__name__] += 1
+        lat.append(time.perf_counter() - t0)
+        i += 1
+
+
+async def _drive(app, concurrency: int, seconds: float) -> Dict[str, Any]:
+    import httpx
+
+    lat: List[float] = []
+    reasons: Counter = Counter()
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench",
+                                 timeout=60.0) as client:
+        deadline = time.perf_counter() + seconds
+        await asyncio.gather(*(_user(client, u, deadline, lat, reasons) for u in range(concurrency)))
+    lat.sort()
+    return {
+        "requests": len(lat),
+        "per_sec": round(len(lat) / seconds, 1),
+        "p50_ms": round(_quantile(lat, 0.50) * 1e3, 2),
+        "p99_ms": round(_quantile(lat, 0.99) * 1e3, 2),
+        "max_ms": round(lat[-1] * 1e3, 2) if lat else 0.0,
+        "llm_ratio": round(reasons["llm"] / len(lat), 3) if lat else 0.0,
+        "reasons": dict(reasons),
+    }
+
+
+def run_scenario(name: str, concurrency: int, seconds: float) -> Dict[str, Any]:
+    import httpx
+    from app.services import llm_client, log_queue
+
+    stub = make_stub(**SCENARIOS[name])
+    with tempfile.TemporaryDirectory(prefix="nolook_llmbench_") as tmp:
+        app, coredb = _load_app(Path(tmp) / "bench.db", "sync")
+        llm_client.configure(transport=httpx.ASGITransport(app=stub))
+        try:
+            result = asyncio.run(_drive(app, concurrency, seconds))
+        finally:
+            llm_client.configure()
+            log_queue.shutdown()   # /ask の書き込み待ちを一時 DB が消える前に書き切る
+            coredb.engine.dispose()
+    result["stub"] = {k: stub.state.stats[k] for k in ("requests", "errors", "max_inflight")}
+    return result
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Measure /ask under healthy, slow and failing LLM upstreams.")
+    parser.add_argument("--scenarios", nargs="+", default=list(SCENARIOS), choices=list(SCENARIOS))
+    parser.add_argument("--concurrency", type=int, default=50, help="Virtual users per run.")
+    parser.add_argument("--seconds", type=float, default=5.0, help="Duration per run.")
+    parser.add_argument("--timeout-ms", type=int, default=1000, help="NOLOOK_LLM_TIMEOUT_MS for the run.")
+    parser.add_argument("--max-inflight", type=int, default=16, help="NOLOOK_LLM_MAX_INFLIGHT for the run.")
+    parser.add_argument("--out", type=Path, help="Output JSON path (default: bench_results/llm-<commit>.json).")
+    args = parser.parse_args(argv)
+
+    env = {
+        "NOLOOK_LLM_TIMEOUT_MS": str(args.timeout_ms),
+        "NOLOOK_LLM_MAX_INFLIGHT": str(args.max_inflight),
+        "NOLOOK_LLM_BASE_URL": "http://llm-stub/v1",
+        "NOLOOK_LLM_WEIGHT": "1.0",
+    }
+    saved = {k: os.environ.get(k) for k in (*env, "DATABASE_URL", "NOLOOK_DB_ASYNC")}
+    os.environ.update(env)
+    try:
+        results = {name: run_scenario(name, args.concurrency, args.seconds) for name in args.scenarios}
+    finally:
+        for k, v in saved.items():
+            if v is None:
+                os.environ.pop(k, None)
+            else:
+                os.environ[k] = v
+
+    report = {
+        "meta": {"commit": _git_commit(), "concurrency": args.concurrency, "seconds": args.seconds,
+                 "timeout_ms": args.timeout_ms, "max_inflight": args.max_inflight},
+        "results": results,
+    }
+    out = args.out or DEFAULT_OUT_DIR / f"llm-{report['meta']['commit'] or 'local'}.json"
+    out.parent.mkdir(parents=True, exist_ok=True)
+    out.write_text(json.dumps(report, ensure_ascii=False, indent=2), encoding="utf-8")
+
+    print(f"{'scenario':<8} {'req/s':>8} {'p50':>8} {'p99':>8} {'max':>8} {'llm%':>6} {'stub':>6} {'peak':>5}")
+    for name, r in results.items():
+        print(f"{name:<8} {r['per_sec']:>8.1f} {r['p50_ms']:>8.1f} {r['p99_ms']:>8.1f} {r['max_ms']:>8.1f} "
+              f"{r['llm_ratio'] * 100:>5.0f}% {r['stub']['requests']:>6} {r['stub']['max_inflight']:>5}")
+    print(f"saved: {out}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
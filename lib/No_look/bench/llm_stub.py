@@ -0,0 +1,87 @@
+# bench/llm_stub.py
+"""
+OpenAI 互換の chat.completions だけを返すローカルのスタブ（オフラインの負荷試験・テスト用）。
+
+    python -m bench.llm_stub --port 9911 --latency-ms 300 --jitter-ms 100 --error-rate 0.05
+    NOLOOK_LLM_BASE_URL=http://127.0.0.1:9911/v1 uvicorn app.main:app
+
+- POST /v1/chat/completions: latency_ms ± jitter_ms 待ってから固定の返信を返す。error_rate の割合で 500
+- GET /stats: 受けた件数・エラー件数・最大同時処理数（/ask 側の同時実行数の上限が効いているかの確認用）
+- POST /config: {"latency_ms", "jitter_ms", "error_rate"} を実行中に変える（上流の劣化・回復の再現）
+プロセス内で使うときは make_app() を httpx.ASGITransport に渡す（app.services.llm_client.configure）。
+"""
+from __future__ import annotations
+import argparse
+import asyncio
+import random
+import sys
+import time
+from typing import Any, Dict, Optional, Sequence
+
+from fastapi import FastAPI
+from fastapi.responses import JSONResponse
+
+REPLY = "話してくれてありがとう。今日はここまでで十分だよ。"
+
+
+def make_app(latency_ms: float = 300.0, jitter_ms: float = 0.0, error_rate: float = 0.0,
+             reply: str = REPLY, seed: Optional[int] = None) -> FastAPI:
+    app = FastAPI(title="nolook LLM stub")
+    rng = random.Random(seed)
+    cfg: Dict[str, float] = {"latency_ms": latency_ms, "jitter_ms": jitter_ms, "error_rate": error_rate}
+    stats = {"requests": 0, "errors": 0, "inflight": 0, "max_inflight": 0}
+    app.state.config, app.state.stats = cfg, stats
+
+    @app.post("/v1/chat/completions")
+    async def chat_completions(body: Dict[str, Any]):
+        stats["requests"] += 1
+        stats["inflight"] += 1
+        stats["max_inflight"] = max(stats["max_inflight"], stats["inflight"])
+        try:
+            delay = cfg["latency_ms"] + rng.uniform(-cfg["jitter_ms"], cfg["jitter_ms"])
+            await asyncio.sleep(max(delay, 0.0) / 1000.0)
+            if rng.random() < cfg["error_rate"]:
+                stats["errors"] += 1
+                return JSONResponse({"error": {"message": "stub failure", "type": "server_error"}}, status_code=500)
+            return {
+                "id": f"chatcmpl-stub-{stats['requests']}",
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": body.get("model", "stub"),
+                "choices": [{"index": 0, "finish_reason": "stop",
+                             "message": {"role": "assistant", "content": reply}}],
+                "usage": {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0},
+            }
+        finally:
+            stats["inflight"] -= 1
+
+    @app.get("/stats")
+    def get_stats():
+        return {**stats, **cfg}
+
+    @app.post("/config")
+    def set_config(body: Dict[str, float]):
+        cfg.update({k: float(v) for k, v in body.items() if k in cfg})
+        return cfg
+
+    return app
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Serve an OpenAI-compatible chat.completions stub.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9911)
+    parser.add_argument("--latency-ms", type=float, default=300.0, help="Mean response latency.")
+    parser.add_argument("--jitter-ms", type=float, default=0.0, help="Uniform +/- jitter around the latency.")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of requests answered with 500.")
+    args = parser.parse_args(argv)
+
+    import uvicorn
+
+    uvicorn.run(make_app(args.latency_ms, args.jitter_ms, args.error_rate),
+                host=args.host, port=args.port, log_level="warning")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
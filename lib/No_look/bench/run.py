@@ -0,0 +1,221 @@
+# bench/run.py
+"""
+全分類器エントリポイントのスループット計測。
+
+    python -m bench.run                       # bench_results/classifiers-<commit>.json に保存
+    python -m bench.run --quick               # 小さいコーパスで手早く
+    python -m bench.run --compare old.json    # texts/sec が閾値以上落ちた項目があれば終了コード1
+
+各エントリポイント × コーパス（short/long）× キャッシュ（cold=メモ化無効 / warm=有効）で
+texts/sec・1件あたり p50/p99/mean（マイクロ秒）・tracemalloc のピーク/残留バイトを測る。
+"""
+from __future__ import annotations
+import argparse
+import gc
+import json
+import platform
+import statistics
+import subprocess
+import sys
+import time
+import tracemalloc
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterator, List, Optional, Sequence
+
+BASE_DIR = Path(__file__).resolve().parents[1]          # lib/No_look
+REPO_DIR = BASE_DIR.parents[1]
+FIREBASE_DIR = REPO_DIR / "firebase_backend"
+DEFAULT_OUT_DIR = BASE_DIR / "bench_results"
+
+if str(BASE_DIR) not in sys.path:
+    sys.path.insert(0, str(BASE_DIR))
+
+from bench.corpus import generate_corpus  # noqa: E402
+
+
+def entry_points() -> Dict[str, Callable[[str], Any]]:
+    """計測対象（リポジトリ内のテキスト分類エントリポイント全部）。"""
+    from app.rules import classify_emotion_rule
+    from app.services.analyze_service import analyze_text_to_labels
+    from app.services.emotion import classify_by_rules
+
+    eps: Dict[str, Callable[[str], Any]] = {
+        "analyze_text_to_labels": analyze_text_to_labels,
+        "classify_by_rules": classify_by_rules,
+        "classify_emotion_rule": classify_emotion_rule,
+    }
+    try:
+        import simple_server
+        import working_ask_server
+        eps["simple_server.analyze_emotion"] = simple_server.analyze_emotion
+        eps["working_ask_server.simple_emotion_analysis"] = working_ask_server.simple_emotion_analysis
+    except Exception as e:  # 依存（fastapi/openai 等）が無い環境
+        print(f"skip demo servers: {e}", file=sys.stderr)
+    if FIREBASE_DIR.is_dir():
+        if str(FIREBASE_DIR) not in sys.path:
+            sys.path.insert(0, str(FIREBASE_DIR))
+        try:
+            from emotion_rules import detect_emotion_6
+            eps["detect_emotion_6"] = detect_emotion_6
+        except Exception as e:
+            print(f"skip detect_emotion_6: {e}", file=sys.stderr)
+    return eps
+
+
+@contextmanager
+def memo_enabled(enabled: bool) -> Iterator[None]:
+    """app.rules.memo のキャッシュを有効/無効にして空の状態から測る。"""
+    from app.rules import memo
+    saved = [(c, c.maxsize) for c in memo._caches]
+    memo.clear_all()
+    if not enabled:
+        for c, _ in saved:
+            c.maxsize = 0
+    try:
+        yield
+    finally:
+        for c, size in saved:
+            c.maxsize = size
+        memo.clear_all()
+
+
+def _quantile(sorted_vals: Sequence[float], q: float) -> float:
+    if not sorted_vals:
+        return 0.0
+    i = min(len(sorted_vals) - 1, max(0, round(q * (len(sorted_vals) - 1))))
+    return sorted_vals[i]
+
+
+def measure(fn: Callable[[str], Any], texts: Sequence[str], repeat: int = 1,
+            alloc_sample: int = 200) -> Dict[str, float]:
+    """1件ずつ呼んでレイテンシを集め、別パスで tracemalloc によるメモリを測る。"""
+    perf = time.perf_counter_ns
+    lat: List[int] = []
+    gc.collect()
+    t_start = perf()
+    for _ in range(repeat):
+        for t in texts:
+            t0 = perf()
+            fn(t)
+            lat.append(perf() - t0)
+    wall = (perf() - t_start) / 1e9
+    lat.sort()
+
+    # メモリは遅くなるので先頭 alloc_sample 件だけ（同じ条件で毎回同じ件）
+    sample = texts[:alloc_sample]
+    tracemalloc.start()
+    try:
+        base, _ = tracemalloc.get_traced_memory()
+        tracemalloc.reset_peak()
+        for t in sample:
+            fn(t)
+        current, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    n = len(lat)
+    return {
+        "calls": n,
+        "texts_per_sec": round(n / wall, 1) if wall > 0 else 0.0,
+        "p50_us": round(_quantile(lat, 0.50) / 1e3, 2),
+        "p99_us": round(_quantile(lat, 0.99) / 1e3, 2),
+        "mean_us": round(statistics.fmean(lat) / 1e3, 2) if lat else 0.0,
+        "alloc_peak_kib": round((peak - base) / 1024, 1),
+        "alloc_retained_kib": round((current - base) / 1024, 1),
+    }
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        out = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=REPO_DIR,
+                             capture_output=True, text=True, timeout=10)
+        return out.stdout.strip() or None
+    except Exception:
+        return None
+
+
+def run(seed: int, n_short: int, n_long: int, long_chars: int, repeat: int,
+        only: Optional[Sequence[str]] = None) -> Dict[str, Any]:
+    from app.rules.registry import get_rules
+
+    corpus = generate_corpus(seed=seed, n_short=n_short, n_long=n_long, long_chars=long_chars)
+    eps = entry_points()
+    if only:
+        eps = {k: v for k, v in eps.items() if k in only}
+
+    results: Dict[str, Any] = {}
+    for name, fn in eps.items():
+        for cname, texts in corpus.items():
+            fn(texts[0])  # ウォームアップ（import 直後の遅延初期化を除く）
+            for mode, cached in (("cold", False), ("warm", True)):
+                with memo_enabled(cached):
+                    results[f"{name}/{cname}/{mode}"] = measure(
+                        fn, texts, repeat=repeat if cname == "short" else 1
+                    )
+    return {
+        "meta": {
+            "created_at": datetime.now(timezone.utc).isoformat(),
+            "commit": _git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "rules": get_rules().key,
+            "corpus": {"seed": seed, "short": n_short, "long": n_long, "long_chars": long_chars},
+            "repeat": repeat,
+        },
+        "results": results,
+    }
+
+
+def compare(current: Dict[str, Any], baseline: Dict[str, Any], threshold: float) -> List[str]:
+    """texts/sec が baseline より threshold（割合）以上落ちた項目を返す。"""
+    bad = []
+    for key, cur in current["results"].items():
+        old = baseline.get("results", {}).get(key)
+        if not old or not old.get("texts_per_sec"):
+            continue
+        drop = 1.0 - cur["texts_per_sec"] / old["texts_per_sec"]
+        if drop > threshold:
+            bad.append(f"{key}: {old['texts_per_sec']:.0f} -> {cur['texts_per_sec']:.0f} texts/s (-{drop:.0%})")
+    return bad
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark every text classifier entry point.")
+    parser.add_argument("--seed", type=int, default=20261017)
+    parser.add_argument("--short", type=int, default=2000, help="Number of short messages.")
+    parser.add_argument("--long", type=int, default=50, help="Number of long messages.")
+    parser.add_argument("--long-chars", type=int, default=2000, help="Approximate length of a long message.")
+    parser.add_argument("--repeat", type=int, default=3, help="Passes over the short corpus.")
+    parser.add_argument("--quick", action="store_true", help="Small corpus (300 short / 10 long, 1 pass).")
+    parser.add_argument("--only", nargs="*", help="Entry point names to run.")
+    parser.add_argument("--out", type=Path, help="Output JSON path (default: bench_results/classifiers-<commit>.json).")
+    parser.add_argument("--compare", type=Path, help="Baseline JSON; exit 1 when texts/sec regresses.")
+    parser.add_argument("--threshold", type=float, default=0.15, help="Allowed texts/sec drop vs --compare.")
+    args = parser.parse_args(argv)
+
+    if args.quick:
+        args.short, args.long, args.repeat = 300, 10, 1
+    report = run(args.seed, args.short, args.long, args.long_chars, args.repeat, args.only)
+
+    out = args.out or DEFAULT_OUT_DIR / f"classifiers-{report['meta']['commit'] or 'local'}.json"
+    out.parent.mkdir(parents=True, exist_ok=True)
+    out.write_text(json.dumps(report, ensure_ascii=False, indent=2), encoding="utf-8")
+
+    print(f"{'entry/corpus/cache':<58} {'texts/s':>10} {'p50us':>8} {'p99us':>8} {'peakKiB':>8}")
+    for key, r in report["results"].items():
+        print(f"{key:<58} {r['texts_per_sec']:>10.0f} {r['p50_us']:>8.1f} {r['p99_us']:>8.1f} {r['alloc_peak_kib']:>8.1f}")
+    print(f"saved: {out}")
+
+    if args.compare:
+        baseline = json.loads(args.compare.read_text(encoding="utf-8"))
+        bad = compare(report, baseline, args.threshold)
+        for line in bad:
+            print(f"REGRESSION {line}")
+        return 1 if bad else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
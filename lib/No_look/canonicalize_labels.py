@@ -0,0 +1,52 @@
+#!/usr/bin/env python
+"""emotion_logs の labels を現行の形に揃える CLI（app/services/label_canonicalize_service.py を使う）。
+
+保存済み labels の整形だけで、ルールを変えたあとの再分類はしない（本文テキストは保存していない）。
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import sys
+from pathlib import Path
+
+BASE_DIR = Path(__file__).resolve().parent
+DEFAULT_CHECKPOINT = BASE_DIR / ".canonicalize_checkpoint.json"
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Canonicalize label keys and re-derive emotion/score of stored emotion_logs.")
+    parser.add_argument("--database-url", help="SQLAlchemy URL (default: $DATABASE_URL or sqlite:///./nolik.db)")
+    parser.add_argument("--apply", action="store_true", help="Write changes back (default is a dry-run diff).")
+    parser.add_argument("--chunk-size", type=int, default=2000, help="Rows per chunk (id-ordered).")
+    parser.add_argument("--checkpoint", type=Path, default=DEFAULT_CHECKPOINT, help="Progress file used to resume.")
+    parser.add_argument("--restart", action="store_true", help="Ignore an existing checkpoint and start from the first row.")
+    parser.add_argument("--quiet", action="store_true", help="Do not print per-chunk progress.")
+    args = parser.parse_args()
+
+    if args.database_url:
+        os.environ["DATABASE_URL"] = args.database_url
+    sys.path.insert(0, str(BASE_DIR))
+
+    from app.core.db import SessionLocal
+    from app.services.label_canonicalize_service import run_canonicalize
+
+    def progress(r) -> None:
+        if not args.quiet:
+            print(f"… last_id={r.last_id} scanned={r.scanned} changed={r.changed} updated={r.updated}", file=sys.stderr)
+
+    report = run_canonicalize(
+        SessionLocal,
+        dry_run=not args.apply,
+        chunk_size=max(1, args.chunk_size),
+        checkpoint=args.checkpoint,
+        restart=args.restart,
+        progress=progress,
+    )
+    print(json.dumps(report.to_dict(), ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
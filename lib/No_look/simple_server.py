@@ -10,6 +10,8 @@ from fastapi import FastAPI, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
 
+from app.rules.registry import get_rules
+
 # .envファイルを読み込み
 load_dotenv()
 
@@ -91,21 +93,9 @@ def llm_reply(user_text: str, emotion: str, style: str, followup: bool) -> Tuple
         return None, f"{type(e).__name__}: {e}"
 
 def analyze_emotion(text: str) -> str:
-    """簡単な感情分析"""
-    text = text.lower()
-    
-    if any(word in text for word in ["楽しい", "嬉しい", "幸せ", "最高", "良い", "素晴らしい", "やった", "成功", "できた"]):
-        return "楽しい"
-    elif any(word in text for word in ["悲しい", "辛い", "寂しい", "落ち込", "泣", "悲", "つらい", "ひどい"]):
-        return "悲しい"
-    elif any(word in text for word in ["怒", "ムカつく", "腹立つ", "イライラ", "うざい", "許せない", "頭にくる"]):
-        return "怒り"
-    elif any(word in text for word in ["不安", "心配", "怖い", "緊張", "ドキドキ", "やばい", "どうしよう"]):
-        return "不安"
-    elif any(word in text for word in ["疲れ", "しんどい", "大変", "きつい", "だるい", "眠い", "つかれ", "きつかった", "分からん", "わからん", "難しい", "困った", "めんどくさい"]):
-        return "しんどい"
-    else:
-        return "中立"
+    """簡単な感情分析（語彙は config/emotion_rules.json の lexicons.simple_server、上から優先）"""
+    hits = get_rules().lexicon("simple_server").matcher.scan(text.lower()).hits
+    return hits[0].emotion if hits else "中立"
 
 def get_fallback_reply(emotion: str, style: str, followup: bool) -> str:
     """フォールバック用のルールベース返信"""
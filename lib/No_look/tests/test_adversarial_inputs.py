@@ -0,0 +1,28 @@
+# tests/test_adversarial_inputs.py
+import random
+import re
+
+from app.rules.matcher import OrderedKeywords, compile_pattern
+from bench.adversarial import adversarial_inputs, check, run
+
+PATTERNS = ["(好き).*(嫌い)|(嫌い).*(好き)", "学校.*楽しい", "どうやったら.*できる", "(a|ab).*(b|bc)"]
+
+def test_ordered_keywords_match_re_search():
+    toks = ["好き", "嫌い", "学校", "楽しい", "どうやったら", "できる", "a", "b", "c", "\n", "好", "でき"]
+    rng = random.Random(12)
+    for p in PATTERNS:
+        fast, slow = compile_pattern(p), re.compile(p)
+        assert isinstance(fast, OrderedKeywords)
+        for _ in range(3000):
+            t = "".join(rng.choice(toks) for _ in range(rng.randint(0, 10)))
+            assert fast.search(t) == bool(slow.search(t)), (p, t)
+    # 形が違うものは通常の正規表現のまま
+    assert isinstance(compile_pattern("a.*b.*c"), re.Pattern)
+    assert isinstance(compile_pattern("(.)\\1{2,}"), re.Pattern)
+
+def test_long_inputs_stay_linear():
+    assert len(adversarial_inputs(5000)["fuzz"]) == 5000
+    results = run([10_000, 80_000], only=["analyze_text_to_labels", "classify_by_rules", "detect_emotion_6"], repeat=2)
+    assert any(k.startswith("detect_emotion_6/") for k in results)
+    # 2乗だと 8倍の長さで 1KB あたり約8倍になる。サンドボックスの揺れを見込んで緩めの上限
+    assert check(results, max_us_per_kb=20_000, max_growth=3.0) == []
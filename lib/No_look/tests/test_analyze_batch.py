@@ -0,0 +1,50 @@
+# tests/test_analyze_batch.py
+import numpy as np
+
+from app.services.analyze_service import (
+    EMOTION_KEYS,
+    analyze_text_to_labels,
+    blend_labels_ema_with_latest_bonus,
+    blend_sequences_ema,
+    analyze_texts_to_matrix,
+    labels_to_row,
+)
+
+def test_vectorized_ema_matches_dict_blend():
+    texts = ["嬉しい！", "つらい", "限界、しんどい", "普通", "ムカつく", "不安"]
+    groups = [[0, 2, 4], [1, 3], [5]]
+    out = blend_sequences_ema(np.zeros((3, 6)), analyze_texts_to_matrix(texts), groups)
+    for g in groups:
+        prev = None
+        for i in g:
+            prev = blend_labels_ema_with_latest_bonus(prev, analyze_text_to_labels(texts[i]))
+            assert np.allclose(labels_to_row(prev), out[i])
+
+def test_batch_one_row_per_student_per_day(tmp_path):
+    m, client = make_client(tmp_path)
+    items = [
+        {"class_id": "1-A", "student_id": "s1", "text": "部活で失敗して落ち込んだ"},
+        {"class_id": "1-A", "student_id": "s2", "text": "テスト合格！嬉しい"},
+        {"class_id": "1-A", "student_id": "s1", "text": "友達に褒められて嬉しい！"},
+        {"class_id": "1-A", "student_id": "s2", "text": "x", "selected_emotion": "怒り"},
+    ]
+    r = client.post("/analyze/batch", json={"items": items})
+    assert r.status_code == 200, r.text
+    res = r.json()["results"]
+    assert [x["index"] for x in res] == [0, 1, 2, 3]
+    assert res[0]["id"] == res[2]["id"] and res[1]["id"] == res[3]["id"]
+    assert res[0]["id"] != res[1]["id"]
+    assert res[3]["labels"]["怒り"] == 1.0
+    assert res[2]["labels"]["楽しい"] > res[0]["labels"]["楽しい"]
+    for x in res:
+        assert list(x["labels"]) == list(EMOTION_KEYS)
+
+    # 同日にもう一度送っても同じ行に積まれる
+    r2 = client.post("/analyze/batch", json={"items": [items[0]]})
+    assert r2.json()["results"][0]["id"] == res[0]["id"]
+
+def test_batch_rejects_bad_items(tmp_path):
+    m, client = make_client(tmp_path)
+    assert client.post("/analyze/batch", json={"items": []}).status_code == 400
+    bad = {"items": [{"student_id": "s1", "text": "x", "selected_emotion": "キラキラ"}]}
+    assert client.post("/analyze/batch", json=bad).status_code == 422
@@ -0,0 +1,40 @@
+# tests/test_analyze_streaming.py
+import math
+import random
+import time
+
+from app.rules.registry import get_rules
+from app.services import analyze_service as svc
+
+WORDS = ["嬉しい", "楽しい", "最高", "悲しい", "つらい", "ムカつく", "不安", "心配", "しんどい", "疲れ",
+         "ない", "じゃない", "無理", "できない", "！", "ーー", "あ", "自信", "けど", "友達", "テスト", "別に", "無視", "\n", "。"]
+
+def test_chunked_scan_matches_single_scan():
+    lex = get_rules().lexicon(svc.RULES_LEXICON)
+    rng = random.Random(13)
+    for _ in range(500):
+        t = "".join(rng.choices(WORDS, k=rng.randint(0, 40)))
+        scan = lex.matcher.scan(t)
+        want_labels, want_signals = svc._labels_from_scan(scan, lex.params), svc._signals_from_scan(scan)
+        for chunk in (1, 3, 7, 16):
+            labels, signals = svc._analyze_streaming(t, lex, chunk, 0)
+            assert signals == want_signals, (t, chunk)
+            assert all(math.isclose(labels[k], want_labels[k], abs_tol=1e-9) for k in svc.EMOTION_KEYS), (t, chunk)
+
+def test_long_text_is_cut_off_by_cpu_budget(monkeypatch):
+    monkeypatch.setenv("NOLOOK_ANALYZE_CHUNK_CHARS", "2048")
+    monkeypatch.setenv("NOLOOK_ANALYZE_BUDGET_MS", "10")
+    text = "部活で褒められて嬉しいけど、テストが不安でできない！" * 20000   # 約 50万文字
+    t0 = time.perf_counter()
+    labels, signals = svc.analyze_text(text)
+    assert time.perf_counter() - t0 < 2.0
+    assert math.isclose(sum(labels.values()), 1.0, abs_tol=0.06)
+    assert signals["topic_tags"] == ["勉強", "部活"]
+    assert 0 < signals["negation_index"] < 20000     # 途中までしか数えていない
+
+def test_api_accepts_long_post(tmp_path, monkeypatch):
+    monkeypatch.setenv("NOLOOK_ANALYZE_BUDGET_MS", "50")
+    m, client = make_client(tmp_path)
+    r = client.post("/analyze", json={"text": "今日は疲れた。" * 30000, "class_id": "long-A"})
+    assert r.status_code == 200, r.text
+    assert r.json()["emotion"] == "しんどい"
@@ -0,0 +1,54 @@
+# tests/test_analyze_upsert.py
+import threading
+
+from fastapi.testclient import TestClient
+from sqlalchemy import func, select
+
+from app.models.orm import EmotionDailyRollup, EmotionLog
+
+def test_concurrent_analyze_keeps_one_row_and_every_update(tmp_path):
+    """同じ生徒の /analyze が同時に来ても1日1行のまま、どの更新も取りこぼさない。"""
+    m, client = make_client(tmp_path)
+    from app.core import db as coredb
+    sid = client.post("/analyze", json={"text": "宿題できない", "class_id": "U"}).json()["student_id"]
+
+    errors = []
+    def worker():
+        with TestClient(client.app, cookies={"nll_sid": sid}) as c:
+            for _ in range(3):
+                r = c.post("/analyze", json={"text": "宿題できない", "class_id": "U"})
+                if r.status_code != 200:
+                    errors.append(r.text)
+    threads = [threading.Thread(target=worker) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert errors == []
+
+    with coredb.SessionLocal() as s:
+        rows = s.query(EmotionLog).filter(EmotionLog.class_id == "U").all()
+        total = s.scalar(select(func.sum(EmotionDailyRollup.total)).where(EmotionDailyRollup.class_id == "U"))
+    assert len(rows) == 1 and rows[0].daily_date == rows[0].local_date
+    assert rows[0].negation_index == 2 * 25       # 「ない」「できない」× 25件がすべて積み上がる
+    assert total == 1
+
+def test_batch_and_single_share_the_daily_row(tmp_path):
+    m, client = make_client(tmp_path)
+    from app.core import db as coredb
+    client.cookies.set("nll_sid", "u1")
+    first = client.post("/analyze", json={"text": "部活で疲れた", "class_id": "U"}).json()
+    r = client.post("/analyze/batch", json={"items": [
+        {"class_id": "U", "student_id": "u1", "text": "テスト合格！嬉しい"},
+        {"class_id": "U", "student_id": "u2", "text": "明日の発表が不安"},
+    ]}).json()
+    assert r["results"][0]["id"] == first["id"]
+    client.post("/ask", json={"prompt": "部活で疲れた", "class_id": "U"})   # /ask の行は一意キーの外
+    from app.services import log_queue
+    assert log_queue.drain()
+    again = client.post("/analyze", json={"text": "今日は普通", "class_id": "U"}).json()
+    assert again["id"] == first["id"]
+    with coredb.SessionLocal() as s:
+        keys = s.execute(select(EmotionLog.student_id, EmotionLog.daily_date)
+                         .where(EmotionLog.class_id == "U").order_by(EmotionLog.id)).all()
+    assert [k[0] for k in keys] == ["u1", "u2", "u1"] and keys[2][1] is None
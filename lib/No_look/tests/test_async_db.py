@@ -0,0 +1,43 @@
+# tests/test_async_db.py
+import asyncio
+import inspect
+
+from app.core import db as coredb
+from app.services import log_queue
+from app.routes.analyze import analyze_route
+from app.routes.ask import ask_route
+from app.routes.teacher_dashboard import teacher_dashboard
+from app.routes.weekly import weekly_report
+
+def test_hot_routes_are_coroutines_and_mode_is_per_dialect(monkeypatch):
+    assert all(inspect.iscoroutinefunction(f) for f in (ask_route, analyze_route, teacher_dashboard, weekly_report))
+    assert coredb.async_url("postgresql+psycopg://u@db/n") == "postgresql+psycopg://u@db/n"
+    assert coredb.async_url("sqlite:///x.db") == "sqlite+aiosqlite:///x.db"
+    assert coredb.async_url("sqlite://") is None                   # インメモリは同期側と共有できない
+    monkeypatch.delenv("NOLOOK_DB_ASYNC", raising=False)
+    assert coredb.async_enabled("postgresql+psycopg://u@db/n") and not coredb.async_enabled("sqlite:///x.db")
+    monkeypatch.setenv("NOLOOK_DB_ASYNC", "1")
+    assert coredb.async_enabled("sqlite:///x.db")
+
+def test_async_and_sync_sessions_write_and_read_the_same_rows(tmp_path, monkeypatch):
+    monkeypatch.setenv("NOLOOK_DB_ASYNC", "1")
+    m, client = make_client(tmp_path)
+    assert coredb.AsyncSessionLocal is not None
+    for text in ("テスト合格！嬉しい", "部活で疲れた"):
+        client.cookies.clear()
+        assert client.post("/analyze", json={"text": text, "class_id": "AS"}).status_code == 200
+    assert client.post("/ask", json={"prompt": "明日の発表が不安", "class_id": "AS"}).status_code == 200
+    assert log_queue.drain()
+    a_dash = client.get("/teacher_dashboard", params={"class_id": "AS", "days": 3}).json()["daily"]
+    a_week = client.get("/weekly_report", params={"class_id": "AS", "view": "full", "tz": "UTC"}).json()["totals"]
+    asyncio.run(coredb.dispose_async_engine())
+
+    monkeypatch.setenv("NOLOOK_DB_ASYNC", "0")
+    m, client = make_client(tmp_path)                        # 同じ DB を同期 Session で読み直す
+    assert coredb.AsyncSessionLocal is None
+    assert client.get("/teacher_dashboard", params={"class_id": "AS", "days": 3}).json()["daily"] == a_dash
+    assert a_dash[-1]["total"] == 3 and sum(a_week.values()) == 3
+    # 同期側の書き込みも同じ日次集計に入る
+    r = client.post("/analyze", json={"text": "やっぱり不安", "class_id": "AS"})
+    assert r.status_code == 200
+    assert client.get("/teacher_dashboard", params={"class_id": "AS", "days": 3}).json()["daily"][-1]["total"] == 4
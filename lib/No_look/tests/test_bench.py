@@ -0,0 +1,28 @@
+# tests/test_bench.py
+import json
+
+from bench.corpus import generate_corpus
+from bench.run import compare, main
+
+def test_corpus_is_reproducible_and_varied():
+    a = generate_corpus(seed=1, n_short=300, n_long=3, long_chars=500)
+    assert a == generate_corpus(seed=1, n_short=300, n_long=3, long_chars=500)
+    assert a != generate_corpus(seed=2, n_short=300, n_long=3, long_chars=500)
+    joined = "".join(a["short"])
+    assert any(e in joined for e in ("😀", "😭", "🔥"))
+    assert "ー" in joined and "ない" in joined
+    assert all(len(t) >= 500 for t in a["long"])
+
+def test_bench_writes_json_and_flags_regressions(tmp_path):
+    out = tmp_path / "b.json"
+    args = ["--short", "20", "--long", "1", "--long-chars", "200", "--repeat", "1",
+            "--only", "analyze_text_to_labels", "--out", str(out)]
+    assert main(args) == 0
+    report = json.loads(out.read_text(encoding="utf-8"))
+    r = report["results"]["analyze_text_to_labels/short/cold"]
+    assert r["calls"] == 20 and r["texts_per_sec"] > 0 and r["p99_us"] >= r["p50_us"]
+    assert report["meta"]["corpus"]["seed"] == 20261017
+
+    faster = {"results": {k: {**v, "texts_per_sec": v["texts_per_sec"] * 10} for k, v in report["results"].items()}}
+    assert compare(report, faster, 0.15)
+    assert compare(report, report, 0.15) == []
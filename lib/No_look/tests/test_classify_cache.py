@@ -0,0 +1,63 @@
+# tests/test_classify_cache.py
+import json
+import os
+
+from app.rules import memo, registry
+from app.rules.memo import LabelCache
+from app.rules.registry import DEFAULT_RULES_PATH, RuleRegistry
+from app.services import analyze_service
+from app.services.analyze_service import analyze_text_to_labels
+
+def test_lru_counts_and_evicts():
+    cache = LabelCache("t", maxsize=2)
+    calls = []
+    fn = lambda t: calls.append(t) or len(t)
+    assert cache.get_or_compute("疲れた", fn) == 3
+    assert cache.get_or_compute("疲れた", fn) == 3
+    cache.get_or_compute("だるい", fn)
+    cache.get_or_compute("疲れた", fn)          # 「だるい」が最古になる
+    cache.get_or_compute("テストやばい", fn)    # 「だるい」を追い出す
+    assert calls == ["疲れた", "だるい", "テストやばい"]
+    assert cache.stats() == {"size": 2, "maxsize": 2, "hits": 2, "misses": 3, "evictions": 1}
+
+def test_classifier_gets_the_callers_text_and_long_text_bypasses():
+    cache = LabelCache("t", maxsize=8, max_text=5)
+    seen = []
+    fn = lambda t: seen.append(t) or t
+    assert cache.get_or_compute("ﾑｶつく", fn) == "ﾑｶつく"
+    assert cache.get_or_compute("ムカつく", fn) == "ムカつく"    # 全角/半角違いは別キー
+    assert seen == ["ﾑｶつく", "ムカつく"]
+    cache.get_or_compute("長い長い長い文章", fn)
+    assert len(cache) == 2
+
+def test_width_variants_keep_their_uncached_decision():
+    from app.services.emotion import _classify_uncached, classify_by_rules
+    for text in ("ムカつく", "ﾑｶつく", "ｲﾗｲﾗする", "イライラする"):   # 全角を先に覚えても半角に流用しない
+        assert analyze_text_to_labels(text) == analyze_service._analyze_uncached(text)[0]
+        assert classify_by_rules(text).labels == _classify_uncached(text)[1]
+    assert analyze_text_to_labels("ﾑｶつく")["中立"] == 1.0              # 半角ｶﾅは辞書に当たらない（従来どおり）
+
+def test_returned_labels_are_not_shared():
+    a = analyze_text_to_labels("嬉しい！")
+    a["楽しい"] = -1.0
+    assert analyze_text_to_labels("嬉しい！")["楽しい"] > 0
+
+def test_rules_swap_invalidates(tmp_path, monkeypatch):
+    p = tmp_path / "rules.json"
+    data = json.loads(DEFAULT_RULES_PATH.read_text(encoding="utf-8-sig"))
+    p.write_text(json.dumps(data, ensure_ascii=False), encoding="utf-8")
+    reg = RuleRegistry(p, poll_seconds=0)
+    memo.invalidate_on_swap(reg)
+    monkeypatch.setattr(registry, "_registry", reg)
+
+    assert analyze_text_to_labels("ぴえん")["中立"] == 1.0
+    assert len(analyze_service._label_cache) > 0
+
+    data["version"] = "test-2"
+    data["lexicons"]["analyze"]["weights"]["悲しい"]["(ぴえん)"] = 2.0
+    p.write_text(json.dumps(data, ensure_ascii=False), encoding="utf-8")
+    st = p.stat()
+    os.utime(p, ns=(st.st_atime_ns, st.st_mtime_ns + 1_000_000_000))
+    assert reg.check() is True
+    assert len(analyze_service._label_cache) == 0
+    assert analyze_text_to_labels("ぴえん")["悲しい"] > 0
@@ -0,0 +1,69 @@
+# tests/test_daily_rollup.py
+from sqlalchemy import select
+
+from app.services import rollup_service
+
+def _snapshot(s):
+    from app.models.orm import EmotionDailyRollup, EmotionDailyRollupStudent
+    cols = [c for c in EmotionDailyRollup.__table__.c]
+    rows = {tuple(r[:3]): tuple(round(v, 9) if isinstance(v, float) else v for v in r[3:])
+            for r in s.execute(select(*cols)).all()}
+    stu = set(s.execute(select(*EmotionDailyRollupStudent.__table__.c)).all())
+    return rows, stu
+
+def test_writes_keep_rollup_in_step_with_logs(tmp_path, monkeypatch):
+    m, client = make_client(tmp_path)
+    from app.core import db as coredb
+
+    # 1日1レコードの UPDATE：件数は前の感情から今の感情へ移る（生徒数・合計は1のまま）
+    client.post("/analyze", json={"text": "テスト合格！嬉しい", "class_id": "R"})
+    for _ in range(2):
+        r = client.post("/analyze", json={"text": "x", "class_id": "R", "selected_emotion": "怒り"})
+        assert r.status_code == 200
+    for _ in range(2):
+        client.post("/ask", json={"prompt": "明日の発表が不安", "class_id": "R"})
+    client.cookies.clear()                                  # 別の生徒
+    client.post("/analyze", json={"text": "友達とケンカしてムカつく", "class_id": "R"})
+    client.post("/analyze/batch", json={"items": [
+        {"class_id": "R", "student_id": "b1", "text": "部活で疲れた"},
+        {"class_id": "R", "student_id": "b1", "text": "今日は普通"},
+    ]})
+    from app.services import log_queue
+    assert log_queue.drain()                                # /ask の分は書き込み待ちキュー経由
+
+    d = client.get("/teacher_dashboard", params={"class_id": "R", "days": 1}).json()["daily"][-1]
+    assert d["total"] == 5 and d["students"] == 3
+    assert sum(d["counts"].values()) == 5 and d["counts"]["楽しい"] == 0 and d["counts"]["怒り"] == 2
+
+    # 集計を使わない（生ログから数える）経路と同じ結果
+    monkeypatch.setenv("NOLOOK_ROLLUP_TZS", "")
+    assert client.get("/teacher_dashboard", params={"class_id": "R", "days": 1}).json()["daily"][-1] == d
+    raw_weekly = client.get("/weekly_report", params={"class_id": "R", "view": "full", "tz": "UTC"}).json()
+    monkeypatch.setenv("NOLOOK_ROLLUP_TZS", "Asia/Tokyo,UTC")
+
+    with coredb.SessionLocal() as s:
+        incremental = _snapshot(s)
+        rollup_service.rebuild(s, ["Asia/Tokyo"])
+        assert _snapshot(s) == incremental        # 作り直しと書き込み時の増減が一致
+        rollup_service.rebuild(s)
+        s.commit()
+    from app.routes import weekly
+    weekly._CACHE.clear()
+    rolled_weekly = client.get("/weekly_report", params={"class_id": "R", "view": "full", "tz": "UTC"}).json()
+    assert rolled_weekly["daily"] == raw_weekly["daily"] and rolled_weekly["totals"] == raw_weekly["totals"]
+
+def test_dashboard_reads_only_rollup_rows(tmp_path):
+    m, client = make_client(tmp_path)
+    from app.core import db as coredb
+    from app.models.orm import EmotionLog
+    for _ in range(20):
+        client.cookies.clear()
+        client.post("/analyze", json={"text": "今日は普通", "class_id": "Q"})
+    # 生ログを別クラスに付け替えても集計から返る（生ログを読んでいない）
+    with coredb.SessionLocal() as s:
+        s.query(EmotionLog).update({EmotionLog.class_id: "moved"})
+        s.commit()
+    d = client.get("/teacher_dashboard", params={"class_id": "Q", "days": 3}).json()["daily"]
+    assert [x["total"] for x in d] == [0, 0, 20] and d[-1]["students"] == 20
+    js = client.get("/summary", params={"days": 1, "class_id": "Q", "view": "full"}).json()
+    assert sum(js["totals"].values()) == 20
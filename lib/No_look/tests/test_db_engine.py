@@ -0,0 +1,39 @@
+# tests/test_db_engine.py
+import pytest
+from prometheus_client import REGISTRY
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+
+from app.core import db as coredb
+
+def test_pool_settings_per_dialect_and_env(monkeypatch):
+    pg = coredb.pool_settings("postgresql+psycopg://u:p@db/nolook")
+    assert pg["pool_pre_ping"] is True and pg["pool_recycle"] > 0
+    assert coredb.pool_settings("sqlite:///x.db")["pool_pre_ping"] is False
+    assert coredb.pool_settings("sqlite://") == {}               # インメモリは StaticPool
+    assert "statement_timeout=5000" in coredb._connect_args("postgresql+psycopg://u@db/n")["options"]
+    assert coredb._normalize_url("postgres://u@db/n") == "postgresql+psycopg://u@db/n"
+
+    monkeypatch.setenv("NOLOOK_DB_POOL_SIZE", "3")
+    monkeypatch.setenv("NOLOOK_DB_PRE_PING", "1")
+    s = coredb.pool_settings("sqlite:///x.db")
+    assert s["pool_size"] == 3 and s["pool_pre_ping"] is True
+    monkeypatch.setenv("NOLOOK_DB_POOL_SIZE", "many")
+    with pytest.raises(ValueError):
+        coredb.pool_settings("sqlite:///x.db")
+
+def test_checkout_wait_and_timeouts_are_measured(tmp_path, monkeypatch):
+    monkeypatch.setenv("NOLOOK_DB_POOL_SIZE", "1")
+    monkeypatch.setenv("NOLOOK_DB_MAX_OVERFLOW", "0")
+    monkeypatch.setenv("NOLOOK_DB_POOL_TIMEOUT", "0.05")
+    eng = coredb.make_engine(f"sqlite:///{tmp_path / 'pool.db'}")
+    count = lambda: REGISTRY.get_sample_value("nolik_db_pool_checkout_seconds_count") or 0.0
+    timeouts = lambda: REGISTRY.get_sample_value("nolik_db_pool_timeouts_total") or 0.0
+    c0, t0 = count(), timeouts()
+    held = eng.connect()
+    with pytest.raises(PoolTimeoutError):
+        eng.connect()
+    held.close()
+    with eng.connect():
+        pass
+    assert count() - c0 == 3 and timeouts() - t0 == 1
+    eng.dispose()
@@ -0,0 +1,83 @@
+# tests/test_ingest.py
+import asyncio
+import json
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import select
+
+from app.models.orm import EmotionDailyRollup, EmotionLog
+from app.routes.ingest import _lines
+
+JST = timezone(timedelta(hours=9))
+
+def _event(sid, text, created_at=None, **kw):
+    ev = {"class_id": "IG", "student_id": sid, "text": text, **kw}
+    if created_at is not None:
+        ev["created_at"] = created_at.isoformat()
+    return json.dumps(ev, ensure_ascii=False)
+
+def _chunks(body: bytes, size: int):
+    for i in range(0, len(body), size):
+        yield body[i:i + size]
+
+def test_line_splitter_handles_chunk_boundaries_and_long_lines():
+    async def collect(chunks):
+        async def gen():
+            for c in chunks:
+                yield c
+        return [x async for x in _lines(gen(), max_line=8)]
+    assert asyncio.run(collect([b"ab", b"c\nde", b"f\n\ng"])) == [(1, b"abc"), (2, b"def"), (3, b""), (4, b"g")]
+    assert asyncio.run(collect([b"0123", b"456789\nok\n"])) == [(1, None), (2, b"ok")]   # 長すぎる行は溜めない
+
+def test_ingest_buckets_by_event_time_and_streams_results(tmp_path, monkeypatch):
+    monkeypatch.setenv("NOLOOK_INGEST_BATCH", "3")
+    m, client = make_client(tmp_path)
+    from app.core import db as coredb
+
+    now = datetime.now(JST)
+    midnight = now.replace(hour=0, minute=0, second=0, microsecond=0)
+    early, later = midnight + (now - midnight) / 3, midnight + (now - midnight) / 2   # どちらも今日
+    yesterday = midnight - timedelta(hours=12)
+    lines = [
+        _event("s1", "テスト合格！嬉しい", yesterday),
+        _event("s1", "部活で疲れた", yesterday + timedelta(hours=2)),
+        "{not json",
+        _event("s1", "明日の発表が不安", later),
+        _event("s2", "", now),
+        _event("s2", "友達とケンカしてムカつく", now + timedelta(days=2)),
+        _event("s2", "今日は普通", selected_emotion="楽しい"),
+        _event("s1", "やっぱり不安", early),
+    ]
+    body = ("\n".join(lines) + "\n").encode("utf-8")
+    r = client.post("/ingest", content=_chunks(body, 7), headers={"Content-Type": "application/x-ndjson"})
+    assert r.status_code == 200 and r.headers["content-type"].startswith("application/x-ndjson")
+    out = [json.loads(x) for x in r.text.splitlines()]
+    assert out[-1] == {"summary": {"lines": 8, "ok": 5, "errors": 3}}
+    by_line = {x["line"]: x for x in out[:-1]}
+    assert sorted(by_line) == list(range(1, 9))
+    assert [n for n, x in by_line.items() if not x["ok"]] == [3, 5, 6]
+    assert by_line[1]["local_date"] == by_line[2]["local_date"] == yesterday.date().isoformat()
+    assert by_line[1]["id"] == by_line[2]["id"] != by_line[4]["id"]
+    assert by_line[4]["id"] == by_line[8]["id"]               # 別バッチでも同じ日の行へ
+    assert by_line[7]["emotion"] == "楽しい" and by_line[7]["score"] == 1.0
+
+    with coredb.SessionLocal() as s:
+        rows = s.execute(select(EmotionLog.student_id, EmotionLog.daily_date, EmotionLog.created_at)
+                         .where(EmotionLog.class_id == "IG").order_by(EmotionLog.id)).all()
+        days = dict(s.execute(select(EmotionDailyRollup.local_date, EmotionDailyRollup.total)
+                              .where(EmotionDailyRollup.class_id == "IG", EmotionDailyRollup.tz == "Asia/Tokyo")).all())
+    assert [(sid, d) for sid, d, _ in rows] == [
+        ("s1", yesterday.date().isoformat()), ("s1", now.date().isoformat()), ("s2", now.date().isoformat())]
+    # 最終更新時刻は受信時刻ではなくイベントの時刻（遅れて届いた古い投稿では戻らない）
+    created = rows[1][2].replace(tzinfo=timezone.utc)
+    assert created == later.astimezone(timezone.utc)
+    assert days == {yesterday.date().isoformat(): 1, now.date().isoformat(): 2}
+
+    # 続けて /analyze すると、ingest が作った今日の行に積み上がる
+    client.cookies.set("nll_sid", "s1")
+    assert client.post("/analyze", json={"text": "部活で疲れた", "class_id": "IG"}).json()["id"] == by_line[4]["id"]
+
+    r = client.post("/ingest", params={"results": "errors"}, content=(_event("s3", "普通") + "\n{}\n").encode())
+    out = [json.loads(x) for x in r.text.splitlines()]
+    assert [x.get("line") for x in out] == [2, None] and out[0]["ok"] is False   # 成功行は返さない
+    assert out[-1] == {"summary": {"lines": 2, "ok": 1, "errors": 1}}
@@ -0,0 +1,56 @@
+# tests/test_label_canonicalize_job.py
+import json
+
+from sqlalchemy import create_engine, select
+from sqlalchemy.orm import sessionmaker
+
+from app.models import orm
+from app.models.orm import EmotionLog
+from app.services.analyze_service import analyze_text_to_labels
+from app.services.label_canonicalize_service import run_canonicalize
+
+def _session(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'rc.db'}")
+    orm.Base.metadata.create_all(bind=engine)
+    return sessionmaker(bind=engine)
+
+def _seed(SessionLocal):
+    ok = analyze_text_to_labels("テスト合格！嬉しい")
+    with SessionLocal() as s:
+        for i in range(10):
+            s.add(EmotionLog(class_id="1-A", student_id=f"s{i}", emotion=max(ok, key=ok.get),
+                             score=max(ok.values()), labels=ok))
+        # 古いコードが残した行：キーに空白・別名、emotion と labels が食い違う
+        s.add(EmotionLog(class_id="1-B", student_id="x", emotion="楽しい", score=0.9,
+                         labels={" 悲しい": 0.7, "たのしい": 0.2, "中立": 0.1}))
+        s.add(EmotionLog(class_id="1-B", student_id="y", emotion="怒り", score=0.0, labels={}))
+        s.commit()
+
+def test_dry_run_reports_diff_without_writing(tmp_path):
+    SessionLocal = _session(tmp_path)
+    _seed(SessionLocal)
+    r = run_canonicalize(SessionLocal, dry_run=True, chunk_size=3).to_dict()
+    assert r["scanned"] == 12 and r["changed"] == 2 and r["updated"] == 0
+    assert r["by_class"] == {"1-B": 2}
+    assert r["by_emotion"] == {"楽しい→悲しい": 1, "怒り→中立": 1}
+    with SessionLocal() as s:
+        assert s.execute(select(EmotionLog.emotion).where(EmotionLog.student_id == "x")).scalar() == "楽しい"
+
+def test_apply_and_resume_from_checkpoint(tmp_path):
+    SessionLocal = _session(tmp_path)
+    _seed(SessionLocal)
+    ckpt = tmp_path / "ckpt.json"
+    r = run_canonicalize(SessionLocal, dry_run=False, chunk_size=4, checkpoint=ckpt)
+    assert r.updated == 2
+    with SessionLocal() as s:
+        row = s.execute(select(EmotionLog).where(EmotionLog.student_id == "x")).scalar_one()
+        assert row.emotion == "悲しい" and row.score == 0.7
+        assert list(row.labels) == ["楽しい", "悲しい", "怒り", "不安", "しんどい", "中立"]
+    assert json.loads(ckpt.read_text(encoding="utf-8"))["last_id"] == 12
+
+    # 途中まで進んだ checkpoint から再開すると残りだけ読む
+    data = json.loads(ckpt.read_text(encoding="utf-8"))
+    data["last_id"] = 8
+    ckpt.write_text(json.dumps(data), encoding="utf-8")
+    again = run_canonicalize(SessionLocal, dry_run=False, chunk_size=4, checkpoint=ckpt)
+    assert again.resumed_from == 8 and again.scanned == 4 and again.changed == 0
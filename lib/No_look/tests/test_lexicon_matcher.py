@@ -0,0 +1,44 @@
+# tests/test_lexicon_matcher.py
+import re
+
+import pytest
+
+from app.rules.matcher import LexiconMatcher, literal_alternatives
+from app.rules.registry import get_rules
+from app.services.analyze_service import analyze_text_to_labels
+
+WORD_WEIGHTS = get_rules().lexicon("analyze").weights
+
+TEXTS = [
+    "自己ベストで最高に嬉しい！",
+    "つらいしつらーーい、でも自信あるかも",
+    "萎えた萎え萎えた",
+    "楽しくない…嬉しくないけど大丈夫かな",
+    "",
+]
+
+@pytest.mark.parametrize("text", TEXTS)
+def test_scan_matches_finditer_per_pattern(text):
+    matcher = LexiconMatcher(WORD_WEIGHTS)
+    got = [(h.emotion, h.weight, h.start, h.end) for h in matcher.scan(text).hits]
+    want = [
+        (emo, w, m.start(), m.end())
+        for emo, pats in WORD_WEIGHTS.items()
+        for pat, w in pats.items()
+        for m in re.finditer(pat, text)
+    ]
+    assert got == want
+
+def test_markers_reported_in_same_scan():
+    matcher = LexiconMatcher({"楽しい": {"(嬉し)": 1.0}}, {"neg": "ない", "excla": r"[!！]"})
+    scan = matcher.scan("嬉しくない！")
+    assert scan.markers["neg"] == [(3, 5)]
+    assert scan.has("excla")
+
+def test_non_literal_pattern_rejected():
+    with pytest.raises(ValueError):
+        literal_alternatives(r"学校.*楽しい")
+
+def test_analyze_labels_unchanged_shape():
+    vec = analyze_text_to_labels("今日は楽しくない…")
+    assert set(vec) == {"楽しい", "悲しい", "怒り", "不安", "しんどい", "中立"}
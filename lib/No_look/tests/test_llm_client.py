@@ -0,0 +1,83 @@
+# tests/test_llm_client.py
+import asyncio
+import time
+
+import httpx
+import pytest
+
+from app.services import llm_client
+from app.services.llm_client import CircuitBreaker
+from bench.llm_stub import make_app as make_stub
+
+_MSG = [{"role": "user", "content": "部活で疲れた"}]
+
+@pytest.fixture
+def stub(monkeypatch):
+    monkeypatch.setenv("NOLOOK_LLM_BASE_URL", "http://llm-stub/v1")
+    monkeypatch.setenv("NOLOOK_LLM_WEIGHT", "1.0")
+    app = make_stub(latency_ms=0)
+    def use(**env):
+        for k, v in env.items():
+            monkeypatch.setenv(k, str(v))
+        llm_client.configure(transport=httpx.ASGITransport(app=app))
+        return app
+    yield use
+    llm_client.configure()
+
+def test_breaker_opens_then_half_opens_once():
+    now = [0.0]
+    b = CircuitBreaker(failures=2, cooldown_s=10, clock=lambda: now[0])
+    b.failure()
+    assert b.allow()
+    b.failure()
+    assert b.state == "open" and not b.allow()
+    now[0] = 10.0
+    assert b.allow() and not b.allow()                    # 明けたら試しの1本だけ
+    b.failure()
+    assert b.state == "open" and not b.allow()            # 試しが失敗したら開き直す
+    now[0] = 20.0
+    assert b.allow()
+    b.success()
+    assert b.state == "closed" and b.allow()
+
+def test_ask_uses_the_shared_async_client(tmp_path, stub):
+    app = stub()
+    m, client = make_client(tmp_path)
+    with client:                                           # 同じループなら接続も使い回す
+        bodies = [client.post("/ask", json={"prompt": "部活で疲れた", "class_id": "L"}).json() for _ in range(3)]
+        first = llm_client._current.client
+        assert client.post("/ask", json={"prompt": "今日は普通"}).status_code == 200
+        assert llm_client._current.client is first
+    assert all(b["used_llm"] and b["reply"] == "話してくれてありがとう。今日はここまでで十分だよ。" for b in bodies)
+    assert app.state.stats["requests"] == 4
+
+def test_slow_or_failing_upstream_falls_back_and_opens_the_breaker(tmp_path, stub):
+    app = stub(NOLOOK_LLM_TIMEOUT_MS=100, NOLOOK_LLM_BREAKER_FAILURES=2, NOLOOK_LLM_BREAKER_COOLDOWN_S=30)
+    app.state.config["latency_ms"] = 5000
+    m, client = make_client(tmp_path)
+    ask = lambda: client.post("/ask", json={"prompt": "明日の発表が不安", "class_id": "L"}).json()
+
+    t0 = time.perf_counter()
+    first = ask()
+    assert time.perf_counter() - t0 < 2.0                  # 上流の 5 秒を待たない
+    assert first["used_llm"] is False and first["llm_reason"] == "timeout" and first["reply"]
+    app.state.config.update(latency_ms=0, error_rate=1.0)
+    assert ask()["llm_reason"].startswith("InternalServerError")
+    hits = app.state.stats["requests"]
+    assert [ask()["llm_reason"] for _ in range(3)] == ["circuit_open"] * 3
+    assert app.state.stats["requests"] == hits             # 開いている間は上流を呼ばない
+
+    app.state.config["error_rate"] = 0.0                   # 上流が回復し、クールダウンが明けた
+    llm_client.breaker._opened_at -= 30
+    assert ask()["used_llm"] is True and llm_client.breaker.state == "closed"
+
+def test_inflight_calls_are_capped(stub):
+    app = stub(NOLOOK_LLM_MAX_INFLIGHT=3, NOLOOK_LLM_TIMEOUT_MS=5000)
+    app.state.config["latency_ms"] = 50
+
+    async def burst():
+        return await asyncio.gather(*(llm_client.complete(_MSG, model="m", temperature=0.3, max_tokens=16)
+                                      for _ in range(12)))
+    results = asyncio.run(burst())
+    assert all(text and reason is None for text, reason in results)
+    assert app.state.stats["requests"] == 12 and app.state.stats["max_inflight"] == 3
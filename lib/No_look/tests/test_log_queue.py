@@ -0,0 +1,127 @@
+# tests/test_log_queue.py
+import threading
+import time
+
+from prometheus_client import REGISTRY
+from sqlalchemy import func, select
+
+from app.models.orm import EmotionDailyRollup, EmotionLog
+from app.services import log_queue, log_service
+
+def _values(i):
+    return log_service.emotion_row_values(class_id="Q", student_id=f"s{i}", emotion="中立", score=1.0,
+                                          labels={"中立": 1.0})
+
+def _count(coredb):
+    with coredb.SessionLocal() as s:
+        return s.scalar(select(func.count()).select_from(EmotionLog).where(EmotionLog.class_id == "Q"))
+
+def _wait_for(pred, timeout=5.0):
+    end = time.monotonic() + timeout
+    while time.monotonic() < end and not pred():
+        time.sleep(0.01)
+    return pred()
+
+def test_flush_on_rows_or_time_and_backpressure(tmp_path):
+    m, client = make_client(tmp_path)
+    from app.core import db as coredb
+
+    batches = lambda: REGISTRY.get_sample_value("nolik_log_queue_flush_rows_count") or 0.0
+    b0 = batches()
+    by_rows = log_queue.WriteBehindQueue(coredb.SessionLocal, flush_ms=60_000, flush_rows=3)
+    assert all(by_rows.offer(_values(i)) for i in range(3))
+    assert _wait_for(lambda: _count(coredb) == 3)         # 3行そろった時点で（60秒待たずに）書く
+    by_rows.close()
+    assert batches() - b0 == 1                              # 1トランザクション
+
+    by_time = log_queue.WriteBehindQueue(coredb.SessionLocal, flush_ms=20, flush_rows=1000)
+    by_time.offer(_values(3))
+    assert _wait_for(lambda: _count(coredb) == 4)
+    by_time.close()
+
+    # 書き込みが詰まっている間は容量で止まる（背圧）。空けば待っていた分も積める
+    gate = threading.Event()
+    blocked = log_queue.WriteBehindQueue(lambda: (gate.wait(), coredb.SessionLocal())[1],
+                                         flush_ms=0, flush_rows=1, capacity=1)
+    assert blocked.offer(_values(4))
+    assert _wait_for(lambda: blocked._q.empty())            # ワーカーが取り出して書き込み待ち
+    assert blocked.offer(_values(5))
+    assert not blocked.offer(_values(6)) and not blocked.put(_values(6), timeout=0.05)
+    threading.Timer(0.05, gate.set).start()
+    assert blocked.put(_values(6), timeout=5.0)
+    assert blocked.drain() and _count(coredb) == 7
+    blocked.close()
+    with coredb.SessionLocal() as s:                        # 日次集計も同じトランザクションで更新
+        assert s.scalar(select(func.sum(EmotionDailyRollup.total)).where(EmotionDailyRollup.class_id == "Q")) == 7
+
+def test_ask_replies_before_commit_and_shutdown_flushes(tmp_path, monkeypatch):
+    monkeypatch.setenv("NOLOOK_LOG_FLUSH_MS", "60000")
+    monkeypatch.setenv("NOLOOK_LOG_FLUSH_ROWS", "1000")
+    m, client = make_client(tmp_path)
+    from app.core import db as coredb
+
+    for i in range(3):
+        client.cookies.clear()
+        r = client.post("/ask", json={"prompt": "部活で疲れた", "class_id": "Q"})
+        assert r.status_code == 200
+    assert _count(coredb) == 0 and log_queue.get_queue().depth() == 3   # 返信は commit を待たない
+    assert REGISTRY.get_sample_value("nolik_log_queue_depth") == 3
+    log_queue.shutdown()                                    # lifespan 終了時と同じ
+    assert _count(coredb) == 3
+
+    monkeypatch.setenv("NOLOOK_LOG_WRITE_BEHIND", "0")     # 無効ならリクエスト内で書く
+    client.post("/ask", json={"prompt": "部活で疲れた", "class_id": "Q"})
+    assert _count(coredb) == 4
+
+def test_group_commit_resumes_right_after_drain(tmp_path):
+    m, client = make_client(tmp_path)
+    from app.core import db as coredb
+
+    batches = lambda: REGISTRY.get_sample_value("nolik_log_queue_flush_rows_count") or 0.0
+    q = log_queue.WriteBehindQueue(coredb.SessionLocal, flush_ms=300, flush_rows=1000)
+    q.offer(_values(0))
+    assert q.drain() and _count(coredb) == 1               # drain の分は待たずに書く
+    b0 = batches()
+    for i in range(1, 4):                                   # 途切れずに次が来ても、合図は drain の分だけ
+        q.offer(_values(i))
+        time.sleep(0.01)
+    assert _wait_for(lambda: _count(coredb) == 4)
+    assert batches() - b0 == 1                              # 3行は1トランザクションにまとまる
+    q.close()
+
+def test_rows_accepted_while_closing_are_written(tmp_path):
+    m, client = make_client(tmp_path)
+    from app.core import db as coredb
+
+    # 受付チェックを通った直後に close が走り、ワーカーが空のキューを見てから積まれる順序を作る
+    q = log_queue.WriteBehindQueue(coredb.SessionLocal, flush_ms=0, flush_rows=1000)
+    q.offer(_values(0))
+    assert q.drain()
+    enqueue = q._q.put_nowait
+    def late_enqueue(values):
+        q._stop.wait(5.0)
+        time.sleep(0.3)                                     # ワーカーの空待ち（0.2秒）より長く
+        enqueue(values)
+    q._q.put_nowait = late_enqueue
+    accepted = []
+    t = threading.Thread(target=lambda: accepted.append(q.offer(_values(1))))
+    t.start()
+    time.sleep(0.05)
+    q.close()
+    t.join()
+    assert accepted == [True] and _count(coredb) == 2      # True を返した行は close 後でも書かれる
+
+    # 多数のスレッドが積んでいる最中に close しても、True の件数と書かれた件数が一致する
+    q = log_queue.WriteBehindQueue(coredb.SessionLocal, flush_ms=5, flush_rows=50)
+    ok = []
+    def producer(k):
+        ok.extend(q.offer(_values(100 + k * 1000 + i)) for i in range(200))
+    threads = [threading.Thread(target=producer, args=(k,)) for k in range(8)]
+    for th in threads:
+        th.start()
+    time.sleep(0.01)
+    q.close()
+    for th in threads:
+        th.join()
+    assert _count(coredb) == 2 + sum(ok)
+    assert not q.offer(_values(9))                          # close 後は受け付けない
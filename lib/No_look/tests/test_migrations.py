@@ -0,0 +1,119 @@
+# tests/test_migrations.py
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import create_engine, func, select, text
+
+from app.core.migrations import MIGRATIONS, current_version, run_migrations
+
+_OLD_SCHEMA = """
+CREATE TABLE emotion_logs (
+    id INTEGER PRIMARY KEY, created_at DATETIME, class_id VARCHAR, student_id VARCHAR,
+    emotion VARCHAR, score FLOAT, labels JSON, topic_tags JSON,
+    relationship_mention BOOLEAN, negation_index FLOAT, avoidance FLOAT
+);
+CREATE INDEX ix_emotion_logs_created_at ON emotion_logs (created_at);
+CREATE INDEX ix_emotion_logs_class_id ON emotion_logs (class_id);
+CREATE INDEX ix_emotion_logs_student_id ON emotion_logs (student_id);
+"""
+
+def _old_db(tmp_path):
+    eng = create_engine(f"sqlite:///{tmp_path / 'old.db'}")
+    with eng.begin() as conn:
+        for stmt in filter(None, (s.strip() for s in _OLD_SCHEMA.split(";"))):
+            conn.exec_driver_sql(stmt)
+    return eng
+
+def _plan(conn, stmt) -> str:
+    compiled = stmt.compile(dialect=conn.dialect)
+    params = tuple(compiled.params[k] for k in compiled.positiontup)
+    rows = conn.exec_driver_sql("EXPLAIN QUERY PLAN " + str(compiled), params).fetchall()
+    return " | ".join(r[-1] for r in rows)
+
+def test_runner_upgrades_old_db_and_is_idempotent(tmp_path):
+    eng = _old_db(tmp_path)
+    with eng.begin() as conn:
+        conn.exec_driver_sql(
+            "INSERT INTO emotion_logs (created_at, class_id, student_id, emotion, score, labels, topic_tags,"
+            " relationship_mention, negation_index, avoidance)"
+            " VALUES ('2026-10-17 16:30:00.000000', 'A', 's1', '中立', 1.0, '{}', '[]', 0, 0, 0),"
+            "        ('2026-10-17 17:00:00.000000', 'A', 's1', '悲しい', 0.7,"
+            "         '{\" 悲しい\": 0.7, \"たのしい\": 0.3}', '[]', 0, 0, 0)")
+    assert current_version(eng) == 0
+    assert run_migrations(eng) == [m.version for m in MIGRATIONS]
+    assert run_migrations(eng) == []                # 2回目は何もしない
+    # 記録が消えても（途中で落ちた想定）移行本体は冪等なので通る
+    with eng.begin() as conn:
+        conn.execute(text("DELETE FROM schema_version"))
+    assert run_migrations(eng) == [m.version for m in MIGRATIONS]
+    assert current_version(eng) == MIGRATIONS[-1].version
+    with eng.connect() as conn:
+        names = {r[0] for r in conn.exec_driver_sql("SELECT name FROM sqlite_master WHERE type='index'")}
+        # 既存行の学校ローカル列は移行で埋まる（UTC 16:30 → JST 翌日 1時）
+        local = conn.exec_driver_sql("SELECT local_date, local_week, local_hour FROM emotion_logs ORDER BY id").first()
+        # 同じ生徒・同じ日の行が複数あっても、1日1レコードの一意キーは最新の1行にだけ付く
+        daily = conn.exec_driver_sql("SELECT daily_date FROM emotion_logs ORDER BY id").scalars().all()
+        # JSON の labels は6列に移り（キーは正規化）、列自体は無くなる
+        cols = {r[1] for r in conn.exec_driver_sql("PRAGMA table_info(emotion_logs)")}
+        probs = conn.exec_driver_sql("SELECT p_fun, p_sad, p_neutral FROM emotion_logs ORDER BY id").all()
+        p_sad = conn.exec_driver_sql("SELECT SUM(p_sad) FROM emotion_daily_rollup").scalar()
+    assert {"ix_emotion_logs_class_student_created", "ix_emotion_logs_class_created_emotion",
+            "ix_emotion_logs_class_local_date", "ux_emotion_logs_daily"} <= names
+    assert tuple(local) == ("2026-10-18", "2026-W42", 1)
+    assert daily == [None, "2026-10-18"]
+    assert "labels" not in cols and [tuple(r) for r in probs] == [(0.0, 0.0, 0.0), (0.3, 0.7, 0.0)]
+    assert p_sad == 0.7                              # 日次集計は移した列から作り直される
+
+def test_hot_queries_use_composite_indexes(tmp_path):
+    m, client = make_client(tmp_path)
+    from app.core import db as coredb
+    from app.models.orm import EmotionLog
+    assert current_version(coredb.engine) == MIGRATIONS[-1].version
+
+    end = datetime.now(timezone.utc)
+    start = end - timedelta(days=7)
+    analyze = (
+        select(EmotionLog)
+        .where(EmotionLog.class_id == "A", EmotionLog.student_id == "s1",
+               EmotionLog.created_at >= start, EmotionLog.created_at < end)
+        .order_by(EmotionLog.created_at.desc())
+        .limit(1)
+    )
+    dashboard = select(EmotionLog).where(
+        EmotionLog.class_id == "A", EmotionLog.created_at.between(start, end))
+    counts = select(EmotionLog.emotion).where(
+        EmotionLog.class_id == "A", EmotionLog.created_at >= start)
+
+    with coredb.engine.connect() as conn:
+        p = _plan(conn, analyze)
+        assert "ix_emotion_logs_class_student_created" in p and "TEMP B-TREE" not in p, p
+        p = _plan(conn, dashboard)
+        assert "ix_emotion_logs_class_created_emotion" in p, p
+        assert "COVERING INDEX ix_emotion_logs_class_created_emotion" in _plan(conn, counts)
+        by_day = (select(EmotionLog.local_date, EmotionLog.emotion, func.count())
+                  .where(EmotionLog.class_id == "A", EmotionLog.local_date.between("2026-10-01", "2026-10-07"))
+                  .group_by(EmotionLog.local_date, EmotionLog.emotion))
+        p = _plan(conn, by_day)
+        assert "COVERING INDEX ix_emotion_logs_class_local_date" in p and "TEMP B-TREE" not in p, p
+
+def test_local_date_sql_path_matches_per_row_path(tmp_path, monkeypatch):
+    monkeypatch.setenv("NOLOOK_ROLLUP_TZS", "")            # 集計表を使わない
+    m, client = make_client(tmp_path)
+    for text in ("テスト合格！嬉しい", "部活で疲れた", "明日の発表が不安"):
+        client.cookies.clear()
+        client.post("/analyze", json={"text": text, "class_id": "L"})
+    q = {"class_id": "L", "days": 3}
+    sql = client.get("/teacher_dashboard", params={**q, "tz": "Asia/Tokyo"}).json()["daily"]
+    per_row = client.get("/teacher_dashboard", params={**q, "tz": "Japan"}).json()["daily"]  # 同じ時刻・別名
+    assert sql == per_row and sql[-1]["total"] == 3 and sql[-1]["students"] == 3
+
+    # 1日のラベル量は SUM(p_*) の1文（行ごとに dict を作って足した値と同じ）
+    from app.core import db as coredb
+    from app.core.localtime import local_parts
+    from app.models.orm import EmotionLog
+    from app.services import rollup_service
+    day = datetime.fromisoformat(local_parts(datetime.now(timezone.utc))[0]).date()
+    with coredb.SessionLocal() as s:
+        sums = rollup_service.read_daily(s, "Asia/Tokyo", day, day, class_id="L")[day.isoformat()]["label_sums"]
+        rows = s.query(EmotionLog).filter(EmotionLog.class_id == "L").all()
+    assert all(abs(sums[k] - sum(r.labels[k] for r in rows)) < 1e-9 for k in sums)
+    assert abs(sum(sums.values()) - 3) < 0.2
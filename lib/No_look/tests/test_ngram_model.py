@@ -0,0 +1,53 @@
+# tests/test_ngram_model.py
+import numpy as np
+
+from app.services import analyze_service
+from app.services.analyze_service import EMOTION_KEYS, analyze_text_to_labels, analyze_texts_to_matrix
+from app.services.ngram_model import NgramModel, csr_dot, featurize, reset_active_model, train
+from train_ngram import regression_cases
+
+def test_train_save_load_roundtrip(tmp_path):
+    cases = regression_cases()
+    assert len(cases) > 20 and all(e in EMOTION_KEYS for _, e in cases)
+    texts, labels = [t for t, _ in cases], [e for _, e in cases]
+    for kind in ("nb", "logreg"):
+        model = train(texts, labels, kind=kind, dims=1 << 12)
+        pred = [EMOTION_KEYS[i] for i in model.predict_proba(texts).argmax(axis=1)]
+        assert sum(p == e for p, e in zip(pred, labels)) / len(labels) > 0.9
+
+        path = tmp_path / f"{kind}.npz"
+        model.save(path)
+        loaded = NgramModel.load(path)
+        assert np.allclose(loaded.predict_proba(texts), model.predict_proba(texts), atol=1e-6)
+        assert path.stat().st_size < 64 * 1024
+
+def test_csr_dot_matches_dense():
+    texts = ["テスト合格！", "", "ｳﾚｼｲ", "つらい…つらい"]
+    x = featurize(texts, dims=64, ngram=(1, 2))
+    dense = np.zeros((len(texts), 64), dtype=np.float32)
+    for r in range(len(texts)):
+        lo, hi = x[0][r], x[0][r + 1]
+        dense[r, x[1][lo:hi]] = x[2][lo:hi]
+    w = np.random.default_rng(0).standard_normal((64, 6)).astype(np.float32)
+    assert np.allclose(csr_dot(x, w), dense @ w, atol=1e-5)
+
+def test_blend_is_opt_in_and_batch_matches_single(tmp_path, monkeypatch):
+    texts = ["テストやばい", "部活で褒められて嬉しい", "今日は普通だった", "もう無理しんどい"]
+    before = [analyze_text_to_labels(t) for t in texts]
+
+    cases = regression_cases()
+    train([t for t, _ in cases], [e for _, e in cases], dims=1 << 12).save(tmp_path / "m.npz")
+    monkeypatch.setenv("NOLOOK_NGRAM_MODEL", str(tmp_path / "m.npz"))
+    monkeypatch.setenv("NOLOOK_NGRAM_WEIGHT", "0.5")
+    reset_active_model()
+    try:
+        after = [analyze_text_to_labels(t) for t in texts]
+        assert after != before and list(after[0]) == list(EMOTION_KEYS)
+        assert all(abs(sum(v.values()) - sum(b.values())) < 0.06 for v, b in zip(after, before))
+        m = analyze_texts_to_matrix(texts)
+        assert np.allclose(m, [[v[k] for k in EMOTION_KEYS] for v in after])
+    finally:
+        monkeypatch.delenv("NOLOOK_NGRAM_MODEL")
+        reset_active_model()
+    assert [analyze_text_to_labels(t) for t in texts] == before
+    assert analyze_service.active_model() == (None, 0.0)
@@ -0,0 +1,37 @@
+# tests/test_normalizer_aliases.py
+import os
+
+from app.services import normalizer
+from app.services.normalizer import AliasIndex, normalize_emotion
+
+def test_project_yaml_canonical_lists_are_used():
+    # config/emotion_aliases.yaml は「正規キー → 一覧」形式（以前は読まれていなかった）
+    assert normalize_emotion("萎えた") == "悲しい"
+    assert normalize_emotion("キレそう") == "怒り"
+    assert normalize_emotion("ＯＫ") == "中立"          # 全角 → 半角・小文字
+    assert normalize_emotion("怒怒りり") == "怒り"
+    assert normalize_emotion("キラキラ") is None
+
+def test_longest_alias_wins():
+    idx = AliasIndex({"疲れ": "しんどい", "疲れたけど楽しい": "楽しい", "イラ": "怒り"})
+    assert idx.lookup("今日は疲れたけど楽しい日") == "楽しい"
+    assert idx.lookup("疲れた、イライラ") == "しんどい"     # 同じ長さなら左
+    assert idx.lookup("なにもない") is None
+
+def test_both_yaml_shapes_and_mtime_reload(tmp_path, monkeypatch):
+    path = tmp_path / "emotion_aliases.yaml"
+    path.write_text("不安:\n  - そわそわ\naliases:\n  ドキドキ: 楽しい\n  謎: 不明\n", encoding="utf-8")
+    monkeypatch.setattr(normalizer, "_candidates", lambda: (path,))
+    monkeypatch.setattr(normalizer, "_POLL_SECONDS", 0.0)
+    monkeypatch.setattr(normalizer, "_state", (None, None, None, 0.0))
+
+    assert normalize_emotion("そわそわする") == "不安"
+    assert normalize_emotion("ドキドキ") == "楽しい"
+    assert normalize_emotion("謎") is None
+    assert normalize_emotion("嬉しい") == "楽しい"        # 内蔵エイリアスは残る
+
+    path.write_text("悲しい:\n  - そわそわ\n", encoding="utf-8")
+    st = path.stat()
+    os.utime(path, (st.st_atime, st.st_mtime + 5))
+    assert normalize_emotion("そわそわする") == "悲しい"
+    assert normalize_emotion("ドキドキ") is None
@@ -0,0 +1,79 @@
+# tests/test_rules_registry.py
+import copy
+import json
+import os
+
+from app.rules.registry import DEFAULT_RULES_PATH, ENTRY_POINT_LEXICONS, RuleRegistry, get_rules
+
+def _write(path, data):
+    path.write_text(json.dumps(data, ensure_ascii=False), encoding="utf-8")
+    # mtime の粒度が粗い環境でも変更を検知させる
+    st = path.stat()
+    os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns + 1_000_000_000))
+
+def _rules(version, words):
+    return {"version": version, "lexicons": {"t": {"weights": {"楽しい": words}}}}
+
+def test_shipped_rules_cover_every_classifier():
+    rules = get_rules()
+    for name in ("analyze", "rule_counts", "rule_priority", "detect6", "simple_server", "working_ask_server"):
+        assert rules.lexicon(name).matcher is not None
+    assert rules.version and rules.key.startswith(rules.version + ":")
+    assert DEFAULT_RULES_PATH.is_file()
+
+def test_hot_reload_swaps_atomically_and_notifies(tmp_path):
+    p = tmp_path / "rules.json"
+    _write(p, _rules("1", ["嬉しい"]))
+    reg = RuleRegistry(p, poll_seconds=0)
+    seen = []
+    reg.on_swap(lambda old, new: seen.append((old.version, new.version)))
+    before = reg.current
+    assert reg.current.lexicon("t").matcher.scan("最高").hits == []
+
+    _write(p, _rules("2", ["嬉しい", "最高"]))
+    assert reg.check() is True
+    assert reg.current.version == "2"
+    assert len(reg.current.lexicon("t").matcher.scan("最高").hits) == 1
+    assert seen == [("1", "2")]
+    # 旧版オブジェクトは不変のまま
+    assert before.lexicon("t").matcher.scan("最高").hits == []
+
+def test_broken_file_keeps_previous_rules(tmp_path):
+    p = tmp_path / "rules.json"
+    _write(p, _rules("1", ["嬉しい"]))
+    reg = RuleRegistry(p, poll_seconds=0)
+    _write(p, {"version": "2", "lexicons": {"t": {"weights": {"楽しい": ["学校.*楽しい"]}}}})
+    assert reg.check() is False
+    assert reg.current.version == "1"
+    assert reg.check() is False  # 変化なし
+
+def test_reload_missing_a_required_key_keeps_previous_rules(tmp_path):
+    shipped = json.loads(DEFAULT_RULES_PATH.read_text(encoding="utf-8-sig"))
+    p = tmp_path / "rules.json"
+    _write(p, shipped)
+    reg = RuleRegistry(p, poll_seconds=0, required_lexicons=ENTRY_POINT_LEXICONS)
+    before = reg.current
+
+    broken = []
+    for path in (("analyze", "params", "neutral_floor"), ("analyze", "markers", "hedge"),
+                 ("detect6", "patterns", "recovery_after")):
+        data = copy.deepcopy(shipped)
+        sec, key, name = path
+        del data["lexicons"][sec][key][name]
+        broken.append(data)
+    data = copy.deepcopy(shipped)
+    del data["lexicons"]["simple_server"]                   # 区画ごと消えた
+    broken.append(data)
+    data = copy.deepcopy(shipped)
+    data["lexicons"]["rule_priority"] = ["萎え"]            # 区画が object でない
+    broken.append(data)
+    data = copy.deepcopy(shipped)
+    data["lexicons"]["analyze"]["params"]["excla_boost"] = "1.2"
+    broken.append(data)
+
+    for i, data in enumerate(broken):
+        data["version"] = f"broken-{i}"
+        _write(p, data)
+        assert reg.check() is False, data["version"]
+        assert reg.current is before
+    assert get_rules().lexicon("analyze").params["neutral_floor"] is not None
@@ -0,0 +1,58 @@
+# tests/test_signals.py
+import random
+
+from app.models.orm import EmotionLog
+from app.services.analyze_service import analyze_text, merge_signals
+
+# 旧 compute_signals（_archive/genai_main_archived.py）の語彙と数え方
+TOPIC_LEXICON = {
+    "友だち": ["友だち", "友達", "ともだち", "いじめ", "無視", "仲間", "先輩", "後輩"],
+    "勉強": ["勉強", "テスト", "宿題", "成績", "授業", "課題", "受験"],
+    "家庭": ["家", "家族", "親", "父", "母", "兄", "姉", "弟", "妹"],
+    "部活": ["部活", "クラブ", "サークル", "試合", "大会", "練習"],
+    "体調": ["体調", "熱", "風邪", "腹痛", "頭痛", "眠い", "疲れ", "しんどい"],
+}
+RELATIONSHIP_WORDS = ["友だち", "友達", "ともだち", "いじめ", "無視", "悪口", "仲間はずれ", "ぼっち"]
+NEGATION_WORDS = ["ない", "できない", "無理", "嫌い", "いやだ", "ダメ", "もうやだ"]
+AVOIDANCE_WORDS = ["別に", "なんでもない", "知らない", "まあいい", "どうでもいい"]
+
+def _archived(t):
+    return {
+        "topic_tags": [tag for tag, kws in TOPIC_LEXICON.items() if any(k in t for k in kws)],
+        "relationship_mention": any(w in t for w in RELATIONSHIP_WORDS),
+        "negation_index": sum(t.count(w) for w in NEGATION_WORDS),
+        "avoidance": sum(t.count(w) for w in AVOIDANCE_WORDS),
+    }
+
+def test_signals_match_archived_compute_signals():
+    words = sorted({w for ws in TOPIC_LEXICON.values() for w in ws}
+                   | set(RELATIONSHIP_WORDS) | set(NEGATION_WORDS) | set(AVOIDANCE_WORDS))
+    rng = random.Random(9)
+    for _ in range(2000):
+        t = "".join(rng.choice(words + ["は", "で", "、", "楽しい", "嬉し"]) for _ in range(rng.randint(0, 8)))
+        assert analyze_text(t)[1] == _archived(t), t
+
+def test_merge_signals_accumulates_day():
+    a = {"topic_tags": ["勉強"], "relationship_mention": False, "negation_index": 1, "avoidance": 0}
+    b = {"topic_tags": ["部活", "勉強"], "relationship_mention": True, "negation_index": 2, "avoidance": 1}
+    assert merge_signals(a, b) == {
+        "topic_tags": ["勉強", "部活"], "relationship_mention": True, "negation_index": 3, "avoidance": 1,
+    }
+
+def test_analyze_and_ask_store_signals(tmp_path):
+    m, client = make_client(tmp_path)
+    r = client.post("/analyze", json={"text": "部活の先輩に無視された。別にいいけど", "class_id": "sig-A"})
+    assert r.status_code == 200, r.text
+    assert r.json()["signals"] == {
+        "topic_tags": ["友だち", "部活"], "relationship_mention": True, "negation_index": 0, "avoidance": 1,
+    }
+    r = client.post("/ask", json={"prompt": "テストできない", "class_id": "sig-A", "selected_emotion": "不安"})
+    assert r.status_code == 200, r.text
+    from app.services import log_queue
+    assert log_queue.drain()                                # /ask は書き込み待ちキュー経由
+
+    from app.core import db as coredb
+    with coredb.SessionLocal() as s:
+        rows = s.query(EmotionLog).filter(EmotionLog.class_id == "sig-A").order_by(EmotionLog.id).all()
+    assert [r.topic_tags for r in rows] == [["友だち", "部活"], ["勉強"]]
+    assert rows[0].avoidance == 1 and rows[1].negation_index == 2
@@ -0,0 +1,26 @@
+# tests/test_sqlite_profile.py
+def test_pragmas_applied_and_reported(tmp_path, monkeypatch):
+    monkeypatch.setenv("NOLOOK_ADMIN_TOKEN", "t0k")
+    monkeypatch.setenv("NOLOOK_SQLITE_BUSY_TIMEOUT", "7000")
+    m, client = make_client(tmp_path)
+    with client:
+        r = client.get("/admin/diagnostics/db", headers={"X-Admin-Token": "t0k"})
+    assert r.status_code == 200, r.text
+    js = r.json()
+    assert js["dialect"] == "sqlite"
+    assert js["startup"]["journal_mode"] == {"expected": "wal", "actual": "wal", "ok": True}
+    assert js["current"]["busy_timeout"]["actual"] == 7000
+    assert all(v["ok"] for v in js["current"].values())
+    assert js["schema_version"] >= 1
+    assert js["pool"]["class"] == "TimedQueuePool" and js["pool"]["settings"]["pool_size"] >= 1
+    assert {"synchronous", "mmap_size", "cache_size", "temp_store"} <= set(js["current"])
+    assert client.get("/admin/diagnostics/db").status_code == 403
+    assert client.get("/admin/diagnostics/db", headers={"X-Admin-Token": "t0kx"}).status_code == 403
+
+def test_profile_off_keeps_sqlite_defaults(tmp_path, monkeypatch):
+    monkeypatch.setenv("NOLOOK_SQLITE_PROFILE", "off")
+    m, client = make_client(tmp_path)
+    from app.core import db as coredb
+    assert coredb.SQLITE_PRAGMAS == {} and coredb.verify_sqlite_pragmas() == {}
+    with coredb.engine.connect() as conn:
+        assert conn.exec_driver_sql("PRAGMA journal_mode").scalar().lower() != "wal"
@@ -0,0 +1,72 @@
+# tests/test_today_cache.py
+from datetime import datetime, timezone
+
+from sqlalchemy import event, func, select, update
+
+from app.models.orm import EmotionDailyRollup, EmotionLog
+from app.services.today_cache import TodayCache, TodayState, today_cache
+
+_TEXTS = ("テスト合格！嬉しい", "部活で疲れた", "明日の発表が不安", "今日は普通")
+
+def _state(i):
+    return TodayState(i, datetime.now(timezone.utc), "中立", 1.0, (0.0,) * 5 + (1.0,), (), False, 0, 0)
+
+def test_lru_bound_and_day_rollover():
+    c = TodayCache(maxsize=2)
+    c.put("A", "s1", "2026-10-17", _state(1))
+    c.put("A", "s2", "2026-10-17", _state(2))
+    assert c.get("A", "s1", "2026-10-17").row_id == 1
+    c.put("A", "s3", "2026-10-17", _state(3))             # 最も古く使われた s2 が落ちる
+    assert c.get("A", "s2", "2026-10-17") is None and len(c) == 2
+    assert c.get("A", "s1", "2026-10-18") is None and len(c) == 0   # 日付が変わったら全部捨てる
+    c.put("A", "s1", "2026-10-17", _state(1))             # 前日の遅い書き込みは入れない
+    assert len(c) == 0
+
+def _run(client, sid):
+    client.cookies.set("nll_sid", sid)
+    return [client.post("/analyze", json={"text": t, "class_id": "TC"}).json() for t in _TEXTS]
+
+def test_hit_skips_the_select_and_matches_the_db_path(tmp_path, monkeypatch):
+    m, client = make_client(tmp_path)
+    from app.core import db as coredb
+    today_cache.clear()
+
+    sql = []
+    listener = lambda conn, cur, stmt, *a: sql.append(stmt)
+    event.listen(coredb.engine, "before_cursor_execute", listener)
+    try:
+        cached = _run(client, "c1")
+    finally:
+        event.remove(coredb.engine, "before_cursor_execute", listener)
+    reads = [s for s in sql if s.startswith("SELECT") and "FROM emotion_logs" in s]
+    assert reads == []                                      # 2件目以降も今日の行を読み直さない
+    assert sum(s.startswith("INSERT INTO emotion_logs") for s in sql) == 1
+
+    monkeypatch.setattr(today_cache, "maxsize", 0)          # キャッシュ無し（毎回 DB から読む）
+    direct = _run(client, "c2")
+    strip = lambda r: {k: r[k] for k in ("labels", "emotion", "score", "signals")}
+    assert [strip(r) for r in cached] == [strip(r) for r in direct]
+    with coredb.SessionLocal() as s:
+        rows = {r.student_id: r for r in s.query(EmotionLog).filter(EmotionLog.class_id == "TC")}
+        total = s.scalar(select(func.sum(EmotionDailyRollup.total)).where(EmotionDailyRollup.class_id == "TC"))
+        p_sum = s.scalar(select(func.sum(EmotionDailyRollup.p_fun)).where(EmotionDailyRollup.class_id == "TC"))
+    assert rows["c1"].labels == rows["c2"].labels and rows["c1"].negation_index == rows["c2"].negation_index
+    assert total == 2 and abs(p_sum - 2 * rows["c1"].p_fun) < 1e-9
+
+def test_row_changed_elsewhere_falls_back_to_the_db(tmp_path):
+    m, client = make_client(tmp_path)
+    from app.core import db as coredb
+    today_cache.clear()
+    client.cookies.set("nll_sid", "c3")
+    first = client.post("/analyze", json={"text": "部活で疲れた", "class_id": "TC"}).json()
+    with coredb.SessionLocal() as s:                         # 別プロセス・再分類が書いた想定
+        s.execute(update(EmotionLog).where(EmotionLog.id == first["id"])
+                  .values(emotion="怒り", score=1.0, p_tired=0.0, p_angry=1.0))
+        s.commit()
+    stale = today_cache.stale
+    client.post("/analyze", json={"text": "今日は普通", "class_id": "TC"})
+    assert today_cache.stale == stale + 1
+    with coredb.SessionLocal() as s:
+        row = s.get(EmotionLog, first["id"])
+    assert row.p_angry > 0 and row.p_tired == 0.0           # DB の値からブレンドし直している
+    assert today_cache.get("TC", "c3", row.local_date).vector == row.label_vector()
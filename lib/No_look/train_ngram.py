@@ -0,0 +1,111 @@
+#!/usr/bin/env python
+"""
+文字 n-gram 感情モデル（app/services/ngram_model.py）をオフラインで学習して .npz に保存する CLI。
+
+学習データ:
+  - tests/test_rules_regression.py の CASES（期待値が1つに決まるものだけ）
+  - firebase_backend/emotion_test_cases.json（check_emotion_mix.py と同じ形式、あれば）
+  - --cases で渡した JSON（[{"text": ..., "expected": ...}, ...]、複数可）
+  - --distill N: bench.corpus の合成文 N 件を現行の辞書ルールでラベル付けして足す
+
+    python train_ngram.py --out config/emotion_ngram.npz
+    NOLOOK_NGRAM_MODEL=config/emotion_ngram.npz NOLOOK_NGRAM_WEIGHT=0.3 uvicorn app.main:app
+"""
+
+from __future__ import annotations
+
+import argparse
+import ast
+import json
+import sys
+from pathlib import Path
+from typing import List, Tuple
+
+BASE_DIR = Path(__file__).resolve().parent
+REPO_DIR = BASE_DIR.parents[1]
+REGRESSION_TESTS = BASE_DIR / "tests" / "test_rules_regression.py"
+FIREBASE_CASES = REPO_DIR / "firebase_backend" / "emotion_test_cases.json"
+DEFAULT_OUT = BASE_DIR / "config" / "emotion_ngram.npz"
+
+
+def regression_cases(path: Path = REGRESSION_TESTS) -> List[Tuple[str, str]]:
+    """CASES = [...] をテストを import せずに読む（pytest/fastapi に依存しない）。"""
+    tree = ast.parse(path.read_text(encoding="utf-8-sig"))
+    for node in tree.body:
+        if isinstance(node, ast.Assign) and any(getattr(t, "id", None) == "CASES" for t in node.targets):
+            cases = ast.literal_eval(node.value)
+            return [(text, exp) for text, exp in cases if isinstance(exp, str)]
+    return []
+
+
+def json_cases(path: Path) -> List[Tuple[str, str]]:
+    with path.open("r", encoding="utf-8") as f:
+        data = json.load(f)
+    if not isinstance(data, list):
+        raise ValueError(f"{path}: test case file must contain a JSON array")
+    return [((c.get("text") or "").strip(), c["expected"]) for c in data if c.get("expected")]
+
+
+def distilled_cases(n: int, seed: int) -> List[Tuple[str, str]]:
+    from app.services.analyze_service import analyze_text_to_labels
+    from bench.corpus import generate_corpus
+
+    texts = generate_corpus(seed=seed, n_short=n, n_long=0)["short"]
+    out = []
+    for t in texts:
+        labels = analyze_text_to_labels(t)
+        out.append((t, max(labels, key=labels.get)))
+    return out
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Train the hashed char n-gram emotion model.")
+    parser.add_argument("--kind", choices=("nb", "logreg"), default="nb", help="Multinomial NB or softmax regression.")
+    parser.add_argument("--out", type=Path, default=DEFAULT_OUT, help="Output .npz path.")
+    parser.add_argument("--cases", type=Path, nargs="*", default=[], help="Extra JSON case files.")
+    parser.add_argument("--distill", type=int, default=0, help="Add N rule-labelled synthetic messages.")
+    parser.add_argument("--seed", type=int, default=20261017, help="Seed for --distill.")
+    parser.add_argument("--dims", type=int, default=1 << 16, help="Hashed feature dimensions.")
+    parser.add_argument("--ngram", type=int, nargs=2, default=(1, 3), metavar=("MIN", "MAX"))
+    parser.add_argument("--alpha", type=float, default=0.1, help="NB smoothing.")
+    parser.add_argument("--epochs", type=int, default=200, help="logreg gradient steps.")
+    args = parser.parse_args()
+
+    sys.path.insert(0, str(BASE_DIR))
+    from app.services.analyze_service import EMOTION_KEYS
+    from app.services.ngram_model import featurize, train
+
+    cases = regression_cases()
+    if FIREBASE_CASES.exists():
+        cases += json_cases(FIREBASE_CASES)
+    for p in args.cases:
+        cases += json_cases(p)
+    if args.distill:
+        cases += distilled_cases(args.distill, args.seed)
+
+    unknown = sorted({e for _, e in cases if e not in EMOTION_KEYS})
+    if unknown:
+        raise SystemExit(f"unknown labels in cases: {unknown}")
+
+    texts = [t for t, _ in cases]
+    labels = [e for _, e in cases]
+    model = train(texts, labels, kind=args.kind, dims=args.dims, ngram=tuple(args.ngram),
+                  alpha=args.alpha, epochs=args.epochs)
+    model.save(args.out)
+
+    pred = model.predict_proba(texts).argmax(axis=1)
+    acc = sum(EMOTION_KEYS[p] == e for p, e in zip(pred, labels)) / len(labels)
+    nnz = len(featurize(texts, model.dims, model.ngram)[1])
+    print(json.dumps({
+        "out": str(args.out),
+        "kind": args.kind,
+        "cases": len(cases),
+        "by_label": {k: labels.count(k) for k in EMOTION_KEYS},
+        "features_nnz": nnz,
+        "train_accuracy": round(acc, 4),
+        "bytes": args.out.stat().st_size,
+    }, ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -20,6 +20,8 @@ from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
 from typing import Optional
 
+from app.rules.registry import get_rules
+
 app = FastAPI(title="No Look Ask API")
 
 app.add_middleware(
@@ -72,21 +74,9 @@ TEMPLATE_RESPONSES = {
 }
 
 def simple_emotion_analysis(text: str) -> str:
-    """Simple emotion detection based on keywords"""
-    text = text.lower()
-    
-    if any(word in text for word in ["楽しい", "嬉しい", "幸せ", "最高", "素晴らしい", "良い"]):
-        return "楽しい"
-    elif any(word in text for word in ["悲しい", "辛い", "寂しい", "落ち込む"]):
-        return "悲しい"
-    elif any(word in text for word in ["怒", "イライラ", "腹立つ", "ムカつく"]):
-        return "怒り"
-    elif any(word in text for word in ["不安", "心配", "怖い", "緊張"]):
-        return "不安"
-    elif any(word in text for word in ["疲れ", "しんどい", "大変", "きつい"]):
-        return "しんどい"
-    else:
-        return "中立"
+    """Simple emotion detection based on keywords (lexicons.working_ask_server in config/emotion_rules.json)"""
+    hits = get_rules().lexicon("working_ask_server").matcher.scan(text.lower()).hits
+    return hits[0].emotion if hits else "中立"
 
 def get_llm_response(prompt: str, emotion: str) -> Optional[str]:
     """Get response from OpenAI LLM"""